@@ -2,15 +2,20 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from backend.utils.config import Config
 import json
-from flask import Flask, request
+from flask import Flask, Response, g, request, stream_with_context
 from flask_cors import CORS
 import os
+import time
 import logging
 import datetime
 from dotenv import load_dotenv
 
 # Memory integration
 from backend.services.memory_integration import memory_manager
+# Write-behind persistence of chat messages
+from backend.services.message_store import message_store
+# Per-stage latency and token-usage metrics
+from backend.utils.metrics import metrics, start_trace, current_trace, server_timing
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 load_dotenv(os.path.join(basedir, ".env"), override=True)
@@ -35,6 +40,15 @@ db = SQLAlchemy()  # <-Initialize database object
 migrate = Migrate()  # <-Initialize migration object
 
 
+def parse_flag(value):
+    """Optional boolean request field: None if absent, else true/false (also "true"/"1"/"on")"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return bool(value)
+
+
 def create_app():
     """Construct core application"""
     app = Flask(__name__)
@@ -65,6 +79,57 @@ def create_app():
     from backend.database import models  # noqa
     from backend.database.models import User, UserModelSession  # noqa
 
+    # Chat turns are persisted by a background writer in batches
+    if os.getenv("MESSAGE_PERSISTENCE", "true").lower() == "true":
+        message_store.init_app(app, db)
+
+    # Keyword lexicons are compiled once, before the first request
+    from backend.utils.keyword_matcher import preload_lexicons
+    logger.info(f"Keyword lexicons loaded: {preload_lexicons()}")
+
+    # Request timing: every request is observed into the HTTP histogram, and
+    # a client sending "X-Debug-Timings: 1" gets its stage spans back in a
+    # Server-Timing header
+    @app.before_request
+    def start_request_timer():
+        g.request_start = time.perf_counter()
+        start_trace()
+
+    @app.after_request
+    def record_request_timing(response):
+        start = g.get("request_start")
+        if start is not None:
+            elapsed = time.perf_counter() - start
+            metrics.http_duration.observe(elapsed, endpoint=request.endpoint or "unknown",
+                                          method=request.method)
+            if request.headers.get("X-Debug-Timings") == "1":
+                trace = current_trace() + [("total", round(elapsed * 1000, 2))]
+                response.headers["Server-Timing"] = server_timing(trace)
+        return response
+
+    def llm_metric_samples():
+        from backend.models.llm_integration import get_llm
+        return get_llm().get_metric_samples()
+
+    metrics.register_collector(llm_metric_samples)
+
+    def session_metric_samples():
+        from backend.services.llm_therapy_service import therapy_service
+        stats = therapy_service.get_session_stats()
+        return [(f"chat_sessions_{name}", {}, value) for name, value in stats.items()]
+
+    metrics.register_collector(session_metric_samples)
+
+    def message_metric_samples():
+        return [(f"chat_messages_{name}", {}, value) for name, value in message_store.get_stats().items()]
+
+    metrics.register_collector(message_metric_samples)
+
+    @app.route("/metrics", methods=["GET"])
+    def prometheus_metrics():
+        """Stage latency histograms, token usage and LLM client gauges (Prometheus text format)"""
+        return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
     # @app.route('/')
     # def home():
     #     return "ok"
@@ -303,6 +368,8 @@ def create_app():
             session_id = choice_info.get("session_id")
             input_type = choice_info.get("input_type", "any")
             user_choice = choice_info.get("user_choice", "")
+            country = choice_info.get("country")
+            ultra_think = parse_flag(choice_info.get("ultra_think"))
             
             # Validate required parameters
             if not user_id:
@@ -354,9 +421,11 @@ def create_app():
 
             # Process user message using LLM therapy service
             try:
-                response_data = therapy_service.process_message(
-                    user_id, session_id, user_choice, input_type
-                )
+                with metrics.span("process_message"):
+                    response_data = therapy_service.process_message(
+                        user_id, session_id, user_choice, input_type, country=country,
+                        ultra_think=ultra_think
+                    )
                 
                 # Validate response data
                 if not isinstance(response_data, dict):
@@ -374,8 +443,9 @@ def create_app():
             
             # Update last accessed time
             try:
-                user.last_accessed = datetime.datetime.utcnow()
-                db.session.commit()
+                with metrics.span("db_commit"):
+                    user.last_accessed = datetime.datetime.utcnow()
+                    db.session.commit()
             except Exception as e:
                 app.logger.warning(f"Failed to update user last accessed time: {e}")
                 # Continue even if update fails
@@ -386,13 +456,69 @@ def create_app():
                 "chatbot_response": response_data.get("response", "感谢您的消息。我在这里支持您。"),
                 "user_options": response_data.get("options", ["继续对话", "换个话题", "需要帮助"]),
                 "emotion": response_data.get("emotion", "neutral"),
-                "requires_followup": response_data.get("requires_followup", False)
+                "requires_followup": response_data.get("requires_followup", False),
+                "ultra_think": response_data.get("ultra_think", False),
+                "options_token": response_data.get("options_token"),
+                "followup_token": response_data.get("followup_token")
             }
             
         except Exception as e:
             app.logger.error(f"Session update failed: {e}")
             return {"success": False, "error": "Internal server error"}, 500
 
+    # Quick-reply options generated after the reply was returned
+    @app.route("/api/options/<options_token>", methods=["GET"])
+    def get_options(options_token):
+        """Fetch deferred quick-reply options for a turn by its options_token"""
+        try:
+            from backend.services.llm_therapy_service import therapy_service
+            
+            # Allow clients to wait briefly for options still being generated
+            try:
+                wait = min(max(float(request.args.get("wait", 0)), 0.0), 5.0)
+            except ValueError:
+                wait = 0.0
+            
+            deferred = therapy_service.get_deferred_options(options_token, wait=wait)
+            if deferred is None:
+                return {"success": False, "error": "Unknown or expired options token"}, 404
+            
+            return {
+                "success": True,
+                "ready": deferred["ready"],
+                "options": deferred["options"]
+            }
+            
+        except Exception as e:
+            app.logger.error(f"Options lookup failed: {e}")
+            return {"success": False, "error": "Internal server error"}, 500
+
+    # Personalized follow-up to a crisis reply, generated after the safety message
+    @app.route("/api/crisis_followup/<followup_token>", methods=["GET"])
+    def get_crisis_followup(followup_token):
+        """Fetch the LLM follow-up for a crisis turn by its followup_token"""
+        try:
+            from backend.services.llm_therapy_service import therapy_service
+
+            try:
+                wait = min(max(float(request.args.get("wait", 0)), 0.0), 10.0)
+            except ValueError:
+                wait = 0.0
+
+            deferred = therapy_service.get_crisis_followup(followup_token, wait=wait)
+            if deferred is None:
+                return {"success": False, "error": "Unknown or expired follow-up token"}, 404
+
+            return {
+                "success": True,
+                "ready": deferred["ready"],
+                "response": deferred["response"]
+            }
+
+        except Exception as e:
+            app.logger.error(f"Crisis follow-up lookup failed: {e}")
+            return {"success": False, "error": "Internal server error"}, 500
+
     # JWT token verification middleware
     def token_required(f):
         """Decorator to verify JWT tokens"""
@@ -427,13 +553,15 @@ def create_app():
             data = request.get_json()
             message = data.get('message', '')
             session_id = data.get('session_id', '')
+            country = data.get('country')
+            ultra_think = parse_flag(data.get('ultra_think'))
             
             if not message:
                 return {"success": False, "error": "Message is required"}, 400
             
             # Process message using LLM therapy service
             response_data = therapy_service.process_message(
-                user.id, session_id, message, "text"
+                user.id, session_id, message, "text", country=country, ultra_think=ultra_think
             )
             
             return {
@@ -442,6 +570,9 @@ def create_app():
                 "options": response_data["options"],
                 "emotion": response_data.get("emotion", "neutral"),
                 "requires_followup": response_data.get("requires_followup", False),
+                "ultra_think": response_data.get("ultra_think", False),
+                "options_token": response_data.get("options_token"),
+                "followup_token": response_data.get("followup_token"),
                 "session_id": session_id,
                 "user_id": user.id
             }
@@ -450,6 +581,75 @@ def create_app():
             app.logger.error(f"Chat endpoint error: {e}")
             return {"success": False, "error": "服务器内部错误"}, 500
 
+    # Streaming chat endpoint (Server-Sent Events) for mobile and mini-program clients
+    @app.route('/api/chat/stream', methods=['POST'])
+    @token_required
+    def chat_stream_endpoint(user):
+        """Stream the therapeutic reply as it is generated, then send options/emotion"""
+        from backend.services.llm_therapy_service import therapy_service
+        
+        data = request.get_json(silent=True) or {}
+        message = data.get('message', '')
+        session_id = data.get('session_id', '')
+        country = data.get('country')
+        ultra_think = parse_flag(data.get('ultra_think'))
+        user_id = user.id
+        
+        if not message:
+            return {"success": False, "error": "Message is required"}, 400
+        
+        def format_event(event, payload):
+            return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+        
+        def generate():
+            try:
+                for event in therapy_service.process_message_stream(
+                    user_id, session_id, message, "text", country=country, ultra_think=ultra_think
+                ):
+                    if event["event"] == "done":
+                        response_data = event["data"]
+                        yield format_event("done", {
+                            "success": True,
+                            "response": response_data["response"],
+                            "options": response_data["options"],
+                            "emotion": response_data.get("emotion", "neutral"),
+                            "requires_followup": response_data.get("requires_followup", False),
+                            "ultra_think": response_data.get("ultra_think", False),
+                            "options_token": response_data.get("options_token"),
+                            "followup_token": response_data.get("followup_token"),
+                            "session_id": session_id,
+                            "user_id": user_id
+                        })
+                        # Deferred quick replies: push the LLM options once
+                        # they replace the fallback ones sent with "done"
+                        options_token = response_data.get("options_token")
+                        if options_token:
+                            deferred = therapy_service.get_deferred_options(options_token, wait=10)
+                            if deferred and deferred["ready"]:
+                                yield format_event("options", {"options": deferred["options"]})
+                        # Crisis turns: push the personalized follow-up on the
+                        # same stream once it is ready
+                        followup_token = response_data.get("followup_token")
+                        if followup_token:
+                            followup = therapy_service.get_crisis_followup(followup_token, wait=10)
+                            if followup and followup["response"]:
+                                yield format_event("followup", {"response": followup["response"]})
+                    else:
+                        yield format_event(event["event"], event["data"])
+            except Exception as e:
+                app.logger.error(f"Chat stream error: {e}")
+                yield format_event("error", {"success": False, "error": "服务器内部错误"})
+        
+        return Response(
+            stream_with_context(generate()),
+            mimetype="text/event-stream",
+            headers={
+                "Cache-Control": "no-cache",
+                # Disable proxy buffering (nginx) so tokens reach the client immediately
+                "X-Accel-Buffering": "no"
+            }
+        )
+
     # Protected user profile endpoint example
     @app.route('/api/user/profile', methods=['GET'])
     @token_required
@@ -0,0 +1,37 @@
+"""add message table
+
+Revision ID: 3b8e5c1f2a9d
+Revises: 16d650c2c2b5
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b8e5c1f2a9d'
+down_revision = '16d650c2c2b5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('message',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('session_id', sa.Integer(), nullable=True),
+    sa.Column('role', sa.String(length=16), nullable=True),
+    sa.Column('content', sa.Text(), nullable=True),
+    sa.Column('emotion', sa.String(length=32), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['session_id'], ['model_session.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_message_session_id_id', 'message', ['session_id', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_message_session_id_id', table_name='message')
+    op.drop_table('message')
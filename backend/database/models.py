@@ -4,14 +4,14 @@
 # # Creates sql tables for use by flask
 # # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
 
-from flask_sqlalchemy import SQLAlchemy
 import logging
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-db = SQLAlchemy()
+# The app's database object, so the models are bound to the configured app
+from backend import db  # noqa
 from sqlalchemy import DateTime
 import bcrypt
 import jwt
@@ -138,3 +138,16 @@ class UserModelSession(db.Model):  # noqa
     user_id = db.Column(db.Integer(), db.ForeignKey('user.id'))
     date_created = db.Column(DateTime, default=datetime.utcnow)
     last_updated = db.Column(DateTime)
+
+
+class Message(db.Model):  # noqa
+    """One chat message (or rolling summary) of an LLM therapy session (append-only)"""
+    __tablename__ = 'message'  # noqa
+    __table_args__ = (db.Index('ix_message_session_id_id', 'session_id', 'id'),)
+    id = db.Column(db.Integer(), primary_key=True)
+    user_id = db.Column(db.Integer(), db.ForeignKey('user.id'))
+    session_id = db.Column(db.Integer(), db.ForeignKey('model_session.id'))
+    role = db.Column(db.String(16))
+    content = db.Column(db.Text())
+    emotion = db.Column(db.String(32))
+    created_at = db.Column(DateTime, default=datetime.utcnow)
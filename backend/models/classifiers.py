@@ -10,11 +10,22 @@ import random
 
 # Import the LLM integration
 from .llm_integration import get_llm_integration
+from .local_classifier import get_local_classifier
 
 # Define the emotions
 emotions = ['fear', 'love', 'instability', 'disgust', 'disappointment',
           'shame', 'anger', 'jealous', 'sadness', 'envy', 'joy', 'guilt']
 
+# LLM labels to the emotions above (the LLM has no counterpart for the rest);
+# neutral has no emotion of its own and is treated as content
+llm_to_emotion = {
+    'happy': 'joy',
+    'neutral': 'joy',
+    'sad': 'sadness',
+    'angry': 'anger',
+    'anxious': 'fear'
+}
+
 # Define label to int mapping
 label2int = {
     'not_s': 0,
@@ -26,6 +37,11 @@ class ClassificationModel:
         # Initialise empty models
         self.llm_integration = None
         self.app = app
+        # Local model (loaded lazily); the primary path once it has been trained
+        self.local_classifier = get_local_classifier()
+        # Last fused classification, so "emo" and "s" lookups on the same
+        # text share one LLM request
+        self._last_classification = None
         # Load the LLM integration
         self.load_models()
     
@@ -39,21 +55,31 @@ class ClassificationModel:
             print(f"LLM integration could not be loaded, using fallback: {str(e)}")
     
     def get_classification(self, text, model_type):
+        # The local model answers emotions in this flow's own taxonomy without
+        # a network call; suicidal intent stays with the LLM check
+        try:
+            local = self.local_classifier.predict(text)
+        except Exception as e:
+            print(f"Error during local classification: {str(e)}")
+            local = None
+        if local is not None and model_type == "emo":
+            return local["fine_emotion"]
+        
         # If LLM integration is not loaded, use fallback
         if self.llm_integration is None:
             if model_type == "emo":
                 return random.choice(emotions)
             else:
-                return "not_s"
+                return local["intention"] if local is not None else "not_s"
         
         # Use LLM integration for classification
         try:
+            classification = self.classify(text)
             if model_type == "emo":
-                # Use LLM for emotion classification
-                return self.llm_integration.analyze_emotion(text)
+                return llm_to_emotion.get(classification["emotion"]) or random.choice(emotions)
             else:
-                # Use LLM for 's' classification (suicidal intent)
-                return self.llm_integration.analyze_intention(text)
+                # 's' classification (suicidal intent)
+                return classification["intention"]
         except Exception as e:
             print(f"Error during LLM classification: {str(e)}")
             # Fallback to random choice if LLM classification fails
@@ -62,6 +88,16 @@ class ClassificationModel:
             else:
                 return "not_s"
     
+    def classify(self, text):
+        # Emotion and suicidal intent come back from one fused LLM request;
+        # the result is reused when the same text is classified again
+        last = self._last_classification
+        if last is not None and last[0] == text:
+            return last[1]
+        classification = self.llm_integration.classify(text)
+        self._last_classification = (text, classification)
+        return classification
+
     def get_distance(self, text1, text2):
         # If LLM integration is not loaded, use random distance
         if self.llm_integration is None:
@@ -3,12 +3,180 @@ import logging
 import requests
 import json
 import time
-from typing import Dict, Any, Optional
+import copy
+import hashlib
+import threading
+import itertools
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+from requests.adapters import HTTPAdapter
+
+from backend.utils.cache import LRUCache, MISSING, normalize_text
+from backend.utils.singleflight import SingleFlight
+from backend.utils.rate_limiter import RateLimiter, SQLiteRateLimiter, parse_retry_after
+from backend.utils.endpoint_router import NOT_ATTEMPTED, EndpointRouter
+from backend.utils.metrics import metrics
+from backend.utils.keyword_matcher import get_matcher
+from backend.utils.model_routing import TaskRoute, load_task_routes
 
 # 设置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 分类提示词版本，修改分类相关提示词时需递增以使缓存失效
+CLASSIFICATION_PROMPT_VERSION = "1"
+
+# 成功的API结果中记录实际应答的端点地址和模型，用于结果缓存键
+SERVED_BY_FIELD = "_served_by"
+
+# 标准情感标签
+VALID_EMOTIONS = ["happy", "sad", "angry", "anxious", "neutral"]
+
+# API不可用时的回退响应
+FALLBACK_RESPONSES = [
+    "我在这里为您提供支持。请告诉我更多关于您的感受。",
+    "感谢您的消息。我理解这可能不容易，我会尽力帮助您。",
+    "我在这里倾听您。请随时分享您的想法和感受。"
+]
+
+# 一次对话轮次内所有LLM调用共享的截止时间（time.monotonic()时间点）
+_turn_deadline: contextvars.ContextVar = contextvars.ContextVar("llm_turn_deadline", default=None)
+
+@contextmanager
+def llm_deadline(seconds: float):
+    """
+    为当前上下文内的所有LLM调用设置共享截止时间
+    
+    嵌套使用时取更早的截止时间。线程池中的任务需通过
+    contextvars.copy_context().run 继承该截止时间。
+    
+    Args:
+        seconds: 从现在起允许使用的总时间（秒）
+    """
+    deadline = time.monotonic() + seconds
+    current = _turn_deadline.get()
+    if current is not None:
+        deadline = min(deadline, current)
+    token = _turn_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _turn_deadline.reset(token)
+
+def deadline_remaining() -> Optional[float]:
+    """当前共享截止时间的剩余秒数，未设置时返回None"""
+    deadline = _turn_deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+class CircuitBreaker:
+    """
+    熔断器：连续失败（超时、连接错误、5xx）达到阈值后断开，
+    短路所有请求直接走回退逻辑；冷却时间过后进入半开状态，
+    只放行一个探测请求，成功则恢复，失败则重新断开。
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._short_circuited = 0
+        self._lock = threading.Lock()
+    
+    def allow_request(self) -> bool:
+        """判断是否允许发起请求"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at >= self.recovery_timeout:
+                    self.state = self.HALF_OPEN
+                    self._probe_in_flight = True
+                    logger.info("LLM circuit half-open, probing provider")
+                    return True
+                self._short_circuited += 1
+                return False
+            
+            # 半开状态：同一时间只允许一个探测请求
+            if self._probe_in_flight:
+                self._short_circuited += 1
+                return False
+            self._probe_in_flight = True
+            return True
+    
+    def cancel_request(self) -> None:
+        """放行的请求最终未发出时调用：释放半开状态的探测名额，不计成功或失败"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probe_in_flight = False
+    
+    def is_open(self) -> bool:
+        """是否处于断开且仍在冷却期内（不改变状态，用于选择端点）"""
+        with self._lock:
+            return (self.state == self.OPEN and
+                    time.monotonic() - self._opened_at < self.recovery_timeout)
+    
+    def record_success(self) -> None:
+        """记录一次成功调用"""
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info("LLM circuit closed, provider recovered")
+            self.state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+    
+    def record_failure(self) -> None:
+        """记录一次失败调用"""
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(
+                        f"LLM circuit opened after {self._failures} failures, "
+                        f"short-circuiting for {self.recovery_timeout}s"
+                    )
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """熔断器状态统计"""
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self._failures,
+                "short_circuited": self._short_circuited
+            }
+
+class LLMEndpoint:
+    """一个OpenAI兼容的服务端点，各自拥有独立的熔断器"""
+    
+    def __init__(self, name: str, api_type: str, api_base: str, api_key: Optional[str],
+                 model: Optional[str] = None, dedicated: bool = False):
+        self.name = name
+        self.api_type = api_type
+        self.api_base = api_base
+        self.api_key = api_key
+        # 指定时覆盖请求中的模型名称（任务路由显式指定模型时除外）
+        self.model = model
+        # 专用端点只接收在任务路由中点名它的请求
+        self.dedicated = dedicated
+        self.circuit_breaker = CircuitBreaker(
+            failure_threshold=int(os.getenv("LLM_BREAKER_THRESHOLD", "5")),
+            recovery_timeout=float(os.getenv("LLM_BREAKER_RECOVERY_SECONDS", "30"))
+        )
+
 class LLMIntegration:
     """大语言模型集成模块，使用API调用代替本地模型"""
     
@@ -30,54 +198,550 @@ class LLMIntegration:
             self.api_base = "https://api.deepseek.com/v1"
         elif self.api_type == "azure" and not self.api_base:
             self.api_base = os.getenv("AZURE_OPENAI_ENDPOINT")
+        
+        # 连接池配置（每个gunicorn worker进程独立一份）
+        self.pool_connections = int(os.getenv("LLM_POOL_CONNECTIONS", "4"))
+        self.pool_maxsize = int(os.getenv("LLM_POOL_MAXSIZE", "16"))
+        self.pool_block = os.getenv("LLM_POOL_BLOCK", "false").lower() == "true"
+        self.pool_stats_interval = int(os.getenv("LLM_POOL_STATS_INTERVAL", "50"))
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._request_counter = itertools.count(1)
+        
+        # 单次请求超时
+        self.request_timeout = float(os.getenv("LLM_REQUEST_TIMEOUT", "10"))
+        
+        # 服务端点：默认只有上面配置的一个；LLM_ENDPOINTS可配置多个OpenAI兼容端点，
+        # 按近期延迟选择，generate_response在超过p95延迟后向第二个端点发送对冲请求
+        self.endpoints = self._load_endpoints()
+        # 主端点的熔断器
+        self.circuit_breaker = self.endpoints[0].circuit_breaker
+        self.hedge_enabled = os.getenv("LLM_HEDGE_ENABLED", "true").lower() == "true"
+        self.router = EndpointRouter(
+            self.endpoints,
+            hedge_quantile=float(os.getenv("LLM_HEDGE_QUANTILE", "0.95")),
+            default_hedge_delay=float(os.getenv("LLM_HEDGE_DELAY_SECONDS", "2")),
+            min_hedge_delay=float(os.getenv("LLM_HEDGE_MIN_DELAY_SECONDS", "0.2")),
+            failure_penalty=self.request_timeout,
+            max_workers=int(os.getenv("LLM_HEDGE_WORKERS", "16"))
+        )
+        
+        # 按任务（分类、选项、回复、UltraThink、摘要、危机）路由模型、max_tokens、超时和端点，
+        # 短小高频的任务可交给快速的小模型
+        self.task_routes = load_task_routes()
+        endpoint_names = {endpoint.name for endpoint in self.endpoints}
+        for route in self.task_routes.values():
+            missing = set(route.endpoints or ()) - endpoint_names
+            if missing:
+                logger.warning(f"Model route {route.task} names unknown endpoints: {sorted(missing)}")
+        
+        # 确定性结果缓存（temperature=0的分类和语义相似度）
+        self.cache_enabled = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+        self.result_cache = LRUCache(
+            max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2048")),
+            ttl_seconds=float(os.getenv("LLM_CACHE_TTL_SECONDS", "3600"))
+        )
+        
+        # 相同(endpoint, payload)的并发请求合并为一次
+        self.coalesce_enabled = os.getenv("LLM_COALESCE_ENABLED", "true").lower() == "true"
+        self.inflight = SingleFlight()
+        
+        # 客户端限流：按服务商RPM/TPM限额平滑请求，短暂排队而不是直接回退；
+        # 设置LLM_RATE_LIMIT_DB时通过SQLite在多个worker进程间共享限额
+        self.rate_limiter = self._create_rate_limiter()
+    
+    def _cache_key(self, kind: str, model: str, *texts: str,
+                   route: Optional[TaskRoute] = None,
+                   result: Optional[Dict[str, Any]] = None) -> Tuple:
+        """
+        缓存键：任务类型、提示词版本、服务端点、实际发送的模型和归一化文本
+        
+        传入result时使用实际应答的端点和模型（写入缓存），否则使用路由首选端点
+        按服务商调整后的模型（读取缓存），不同模型的结果不会共用缓存
+        """
+        served_by = (result or {}).get(SERVED_BY_FIELD)
+        if not served_by:
+            candidates = self.router.ranked(lambda target: self._endpoint_available(target, route))
+            target = candidates[0] if candidates else self.endpoints[0]
+            served_by = (target.api_base, self._sent_model(target, model, pin_model=bool(route and route.model)))
+        return (kind, CLASSIFICATION_PROMPT_VERSION) + tuple(served_by) + tuple(
+            normalize_text(t) for t in texts
+        )
+    
+    def _cache_get(self, key: Tuple) -> Any:
+        """读取缓存，未启用或未命中时返回MISSING"""
+        if not self.cache_enabled:
+            return MISSING
+        return self.result_cache.get(key)
+    
+    def _cache_set(self, key: Tuple, value: Any) -> None:
+        """写入缓存（只缓存API返回的结果，不缓存回退结果）"""
+        if self.cache_enabled:
+            self.result_cache.set(key, value)
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """结果缓存的命中/未命中/淘汰统计"""
+        return self.result_cache.get_stats()
     
-    def _call_api(self, endpoint: str, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-        """通用API调用方法"""
+    def get_coalescing_stats(self) -> Dict[str, Any]:
+        """请求合并统计（实际发出的请求数、被合并的调用数）"""
+        return self.inflight.get_stats()
+    
+    def _task_route(self, task: str) -> TaskRoute:
+        """任务的模型路由，未知任务按回复处理"""
+        return self.task_routes.get(task) or self.task_routes["reply"]
+    
+    def _effective_timeout(self, request_timeout: Optional[float] = None) -> Optional[float]:
+        """结合共享截止时间计算本次请求的超时（默认为单次请求超时）；截止时间已过时返回None"""
+        request_timeout = request_timeout or self.request_timeout
+        remaining = deadline_remaining()
+        if remaining is None:
+            return request_timeout
+        if remaining <= 0:
+            return None
+        return min(request_timeout, remaining)
+    
+    def _load_endpoints(self) -> List[LLMEndpoint]:
+        """
+        读取LLM_ENDPOINTS（JSON数组）中的端点配置，例如：
+        [{"name": "deepseek", "api_base": "https://api.deepseek.com/v1", "api_key_env": "DEEPSEEK_API_KEY"},
+         {"name": "backup", "api_base": "https://example.com/v1", "api_key": "...", "model": "gpt-4o-mini"},
+         {"name": "fast", "api_base": "https://example.com/v1", "api_key_env": "FAST_API_KEY", "dedicated": true}]
+        dedicated为true的端点只用于在任务路由中点名它的任务（见backend/utils/model_routing.py）
+        未配置或配置无效时使用构造参数指定的单个端点
+        """
+        primary = LLMEndpoint("primary", self.api_type, self.api_base, self.api_key)
+        raw = os.getenv("LLM_ENDPOINTS")
+        if not raw:
+            return [primary]
+        try:
+            endpoints = []
+            for index, config in enumerate(json.loads(raw)):
+                api_key = config.get("api_key") or os.getenv(config.get("api_key_env", ""), "") or self.api_key
+                endpoints.append(LLMEndpoint(
+                    name=config.get("name") or f"endpoint-{index}",
+                    api_type=config.get("api_type", "openai"),
+                    api_base=config["api_base"].rstrip("/"),
+                    api_key=api_key,
+                    model=config.get("model"),
+                    dedicated=bool(config.get("dedicated", False))
+                ))
+            if endpoints:
+                logger.info(f"Configured LLM endpoints: {[endpoint.name for endpoint in endpoints]}")
+                return endpoints
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            logger.error(f"Invalid LLM_ENDPOINTS, using the default endpoint: {e}")
+        return [primary]
+    
+    def get_metric_samples(self) -> List[Tuple[str, Dict[str, Any], float]]:
+        """以(名称, 标签, 值)形式导出缓存、合并、限流、对冲和熔断统计，供/metrics使用"""
+        cache = self.get_cache_stats()
+        coalescing = self.get_coalescing_stats()
+        rate_limit = self.get_rate_limit_stats()
+        router = self.router.get_stats()
+        samples = [
+            ("llm_cache_hits", {}, cache["hits"]),
+            ("llm_cache_misses", {}, cache["misses"]),
+            ("llm_cache_entries", {}, cache["size"]),
+            ("llm_cache_evictions", {}, cache["evictions"]),
+            ("llm_cache_expirations", {}, cache["expirations"]),
+            ("llm_coalesced_calls", {}, coalescing["deduplicated"]),
+            ("llm_rate_limit_queued", {}, rate_limit["queued"]),
+            ("llm_rate_limit_rejected", {}, rate_limit["rejected"]),
+            ("llm_hedged_requests", {}, router["hedges"]),
+            ("llm_hedge_wins", {}, router["hedge_wins"])
+        ]
+        for endpoint in self.endpoints:
+            samples.append(("llm_circuit_open", {"endpoint": endpoint.name},
+                            1 if endpoint.circuit_breaker.is_open() else 0))
+        return samples
+    
+    def get_router_stats(self) -> Dict[str, Any]:
+        """各端点的延迟统计以及对冲请求次数"""
+        stats = self.router.get_stats()
+        for endpoint in self.endpoints:
+            stats["endpoints"][endpoint.name]["circuit"] = endpoint.circuit_breaker.get_stats()["state"]
+        return stats
+    
+    def _create_rate_limiter(self) -> RateLimiter:
+        """根据环境变量创建进程内或跨进程（SQLite）限流器"""
+        options = {
+            "requests_per_minute": float(os.getenv("LLM_RPM", "0")),
+            "tokens_per_minute": float(os.getenv("LLM_TPM", "0")),
+            "max_wait": float(os.getenv("LLM_RATE_MAX_WAIT", "5"))
+        }
+        db_path = os.getenv("LLM_RATE_LIMIT_DB")
+        if db_path:
+            try:
+                return SQLiteRateLimiter(db_path, **options)
+            except Exception as e:
+                logger.warning(f"Shared rate limiter unavailable, limiting per process: {e}")
+        return RateLimiter(**options)
+    
+    def get_rate_limit_stats(self) -> Dict[str, Any]:
+        """限流统计（排队、拒绝、Retry-After暂停次数）"""
+        return self.rate_limiter.get_stats()
+    
+    @staticmethod
+    def _estimate_tokens(payload: Dict[str, Any]) -> int:
+        """粗略估算请求消耗的token数：消息字符数的一半加上max_tokens"""
+        chars = sum(len(str(message.get("content", ""))) for message in payload.get("messages", []))
+        return chars // 2 + int(payload.get("max_tokens") or 0)
+    
+    def _throttle(self, estimated_tokens: int) -> bool:
+        """按限流器排队等待，等待时间不超过共享截止时间的剩余；无法及时获得额度时返回False"""
+        remaining = deadline_remaining()
+        max_wait = self.rate_limiter.max_wait if remaining is None else min(self.rate_limiter.max_wait, remaining)
+        if not self.rate_limiter.acquire(estimated_tokens, max_wait=max(0.0, max_wait)):
+            logger.warning("LLM rate limit queue full, using fallback mode")
+            return False
+        return True
+    
+    def _acquire_call(self, estimated_tokens: int, breaker: CircuitBreaker,
+                      request_timeout: Optional[float] = None) -> Optional[float]:
+        """
+        检查截止时间、限流器和端点熔断器，允许调用时返回本次请求的超时时间，
+        否则返回None表示应直接使用回退逻辑
+        """
+        if self._effective_timeout(request_timeout) is None:
+            logger.warning("LLM turn deadline exceeded, using fallback mode")
+            return None
+        # 先检查熔断器，被短路的请求不消耗限流额度
+        if not breaker.allow_request():
+            logger.warning("LLM circuit open, using fallback mode")
+            return None
+        if not self._throttle(estimated_tokens):
+            breaker.cancel_request()
+            return None
+        # 排队等待会消耗截止时间，需重新计算超时
+        timeout = self._effective_timeout(request_timeout)
+        if timeout is None:
+            logger.warning("LLM turn deadline exceeded, using fallback mode")
+            breaker.cancel_request()
+            return None
+        return timeout
+    
+    @staticmethod
+    def _record_status(status_code: int, breaker: CircuitBreaker) -> None:
+        """根据HTTP状态码更新熔断器（429由限流器处理，不计为故障）"""
+        if status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+    
+    def _handle_rate_limited(self, response) -> float:
+        """收到429时按Retry-After暂停所有请求，返回暂停秒数"""
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        if retry_after is None:
+            retry_after = float(os.getenv("LLM_RETRY_AFTER_DEFAULT", "1"))
+        self.rate_limiter.pause(retry_after)
+        return retry_after
+    
+    def _get_session(self) -> requests.Session:
+        """获取复用的HTTP会话（keep-alive连接池），首次调用时创建"""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    session = requests.Session()
+                    # pool_connections: 缓存的主机连接池数量
+                    # pool_maxsize: 每个主机保持的最大连接数
+                    adapter = HTTPAdapter(
+                        pool_connections=self.pool_connections,
+                        pool_maxsize=self.pool_maxsize,
+                        pool_block=self.pool_block
+                    )
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    self._session = session
+                    logger.info(
+                        f"LLM HTTP pool created: connections={self.pool_connections}, "
+                        f"maxsize={self.pool_maxsize}, block={self.pool_block}"
+                    )
+        return self._session
+    
+    def get_pool_stats(self) -> Dict[str, int]:
+        """
+        获取连接复用统计
+        
+        Returns:
+            包含请求数、新建连接数和复用连接数的字典
+        """
+        stats = {"requests": 0, "connections": 0, "reused": 0, "hosts": 0}
+        if self._session is None:
+            return stats
+        
+        for adapter in set(self._session.adapters.values()):
+            pools = getattr(getattr(adapter, "poolmanager", None), "pools", None)
+            if pools is None:
+                continue
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                stats["hosts"] += 1
+                stats["requests"] += getattr(pool, "num_requests", 0)
+                stats["connections"] += getattr(pool, "num_connections", 0)
+        
+        stats["reused"] = max(0, stats["requests"] - stats["connections"])
+        return stats
+    
+    def _log_pool_stats(self) -> None:
+        """按配置的间隔输出连接复用计数"""
+        request_count = next(self._request_counter)
+        if self.pool_stats_interval > 0 and request_count % self.pool_stats_interval == 0:
+            stats = self.get_pool_stats()
+            logger.info(
+                f"LLM HTTP pool: requests={stats['requests']}, "
+                f"new_connections={stats['connections']}, reused={stats['reused']}, "
+                f"hosts={stats['hosts']}"
+            )
+    
+    def close(self) -> None:
+        """关闭连接池"""
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+    
+    def _prepare_request(self, endpoint: str, payload: Dict[str, Any],
+                         target: LLMEndpoint, pin_model: bool = False) -> Tuple[str, Dict[str, str]]:
+        """
+        构造请求URL和请求头，并按服务商调整模型名称（会修改payload，调用方需传入副本）；
+        pin_model为True时保留任务路由指定的模型，不被端点的模型覆盖
+        """
+        headers = {
+            "Content-Type": "application/json",
+        }
+        
+        if "model" in payload:
+            payload["model"] = self._sent_model(target, payload["model"], pin_model)
+        
+        if target.api_type == "openai":
+            # DeepSeek使用不同的身份验证格式；标准OpenAI API同样使用Bearer
+            headers["Authorization"] = f"Bearer {target.api_key}"
+        elif target.api_type == "azure":
+            headers["api-key"] = target.api_key
+        
+        return f"{target.api_base}{endpoint}", headers
+    
+    @staticmethod
+    def _sent_model(target: LLMEndpoint, model: str, pin_model: bool = False) -> str:
+        """端点实际发送的模型名：端点配置的模型覆盖请求模型（pin_model时除外），再按服务商调整"""
+        if target.model and not pin_model:
+            model = target.model
+        # DeepSeek使用不同的模型名称
+        if target.api_type == "openai" and "deepseek" in target.api_base:
+            if model == "gpt-3.5-turbo":
+                return "deepseek-chat"
+            if model == "text-embedding-ada-002":
+                return "deepseek-embed"
+        return model
+    
+    def _endpoint_available(self, target: LLMEndpoint, route: Optional[TaskRoute] = None) -> bool:
+        """端点熔断器未断开且任务路由允许（未指定路由时为非专用端点）时可被选用"""
+        if route is None:
+            allowed = not target.dedicated
+        else:
+            allowed = route.allows(target.name, target.dedicated)
+        return allowed and not target.circuit_breaker.is_open()
+    
+    def _call_api_stream(self, endpoint: str, payload: Dict[str, Any],
+                         route: Optional[TaskRoute] = None) -> Iterator[str]:
+        """
+        流式API调用方法（Server-Sent Events）
+        
+        Yields:
+            每个增量片段的文本内容；出错时提前结束
+        """
+        # 流式请求不做对冲，选用近期延迟最低的端点
+        candidates = self.router.ranked(lambda target: self._endpoint_available(target, route))
+        if not candidates:
+            logger.warning("LLM circuit open on all endpoints, using fallback mode")
+            return
+        target = candidates[0]
+        breaker = target.circuit_breaker
+        
+        if not target.api_key:
+            logger.warning("Missing API key, using fallback mode")
+            return
+        
+        timeout = self._acquire_call(self._estimate_tokens(payload), breaker,
+                                     route.timeout if route else None)
+        if timeout is None:
+            return
+        
+        payload = dict(payload, stream=True)
+        response = None
+        started = time.perf_counter()
+        try:
+            url, headers = self._prepare_request(endpoint, payload, target,
+                                                 pin_model=bool(route and route.model))
+            logger.debug(f"Streaming API Call: {url}")
+            
+            response = self._get_session().post(
+                url,
+                headers=headers,
+                json=payload,
+                timeout=timeout,  # 连接及两次数据之间的最长等待时间
+                stream=True
+            )
+            self._log_pool_stats()
+            self._record_status(response.status_code, breaker)
+            # 以收到响应头的时间作为该端点的延迟样本
+            self.router.trackers[target.name].record(
+                time.perf_counter() - started, response.status_code == 200, self.router.failure_penalty
+            )
+            
+            if response.status_code != 200:
+                logger.error(f"Streaming API call failed: {response.status_code} - {response.text}")
+                if response.status_code == 429:
+                    self._handle_rate_limited(response)
+                return
+            
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                line = line.decode("utf-8") if isinstance(line, bytes) else line
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    chunk = json.loads(data)
+                except ValueError:
+                    logger.warning(f"Invalid stream chunk: {data[:100]}")
+                    continue
+                choices = chunk.get("choices") or []
+                if not choices:
+                    continue
+                delta = (choices[0].get("delta") or {}).get("content")
+                if delta:
+                    yield delta
+                    
+        except requests.exceptions.Timeout:
+            logger.error("Streaming API call timeout")
+            breaker.record_failure()
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Streaming API request error: {e}")
+            breaker.record_failure()
+        except Exception as e:
+            logger.error(f"Streaming API call error: {e}")
+            if response is None:
+                breaker.record_failure()
+        finally:
+            if response is not None:
+                response.close()
+    
+    def _call_api(self, endpoint: str, payload: Dict[str, Any],
+                  hedge: bool = False, route: Optional[TaskRoute] = None) -> Optional[Dict[str, Any]]:
+        """
+        通用API调用方法
+        
+        相同(endpoint, 任务, payload)的并发调用共享同一个进行中的请求及其结果；
+        等待方最多等到本轮共享截止时间，超时则回退。
+        hedge为True且可用端点有多个时，主端点超过其p95延迟仍未返回则向下一个端点发送对冲请求；
+        route限定可用端点和单次请求超时
+        """
+        if not self.coalesce_enabled:
+            return self._route_request(endpoint, payload, hedge, route)
+        
+        try:
+            digest = hashlib.sha256(
+                json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")
+            ).hexdigest()
+        except (TypeError, ValueError):
+            return self._route_request(endpoint, payload, hedge, route)
+        
+        try:
+            result, shared = self.inflight.do(
+                (endpoint, route.task if route else None, digest),
+                lambda: self._route_request(endpoint, payload, hedge, route),
+                timeout=deadline_remaining()
+            )
+        except TimeoutError:
+            logger.warning("Timed out waiting for coalesced API call")
+            return None
+        # 调用方各自持有结果副本，避免共享对象被修改
+        return copy.deepcopy(result) if shared else result
+    
+    def _route_request(self, endpoint: str, payload: Dict[str, Any],
+                       hedge: bool, route: Optional[TaskRoute] = None) -> Optional[Dict[str, Any]]:
+        """按近期延迟在任务允许的端点中选择一个发出请求（可对冲）；所有端点熔断时直接回退"""
+        def available(target: LLMEndpoint) -> bool:
+            return self._endpoint_available(target, route)
+        
+        if not any(available(target) for target in self.endpoints):
+            logger.warning("LLM circuit open on all endpoints, using fallback mode")
+            return None
+        # 落选请求无法中途终止（requests不支持跨线程取消），其结果被丢弃
+        return self.router.call(
+            lambda target: self._request_api(endpoint, payload, target, route=route),
+            hedge=hedge and self.hedge_enabled,
+            available=available
+        )
+    
+    def _request_api(self, endpoint: str, payload: Dict[str, Any],
+                     target: Optional[LLMEndpoint] = None,
+                     retry_rate_limited: bool = True,
+                     route: Optional[TaskRoute] = None) -> Any:
+        """
+        向一个端点发出单次API请求（经限流器、熔断器与共享截止时间控制）
+        
+        收到429时按Retry-After暂停并重试一次，重试仍受排队上限和截止时间约束。
+        未发出HTTP请求就放弃时（缺少密钥、截止时间已过、限流排队被拒、熔断器短路）
+        返回NOT_ATTEMPTED，端点路由不把它计为该端点的失败
+        """
+        target = target or self.endpoints[0]
+        breaker = target.circuit_breaker
+        estimated_tokens = self._estimate_tokens(payload)
         try:
             # 检查API密钥是否有效
-            if not self.api_key:
+            if not target.api_key:
                 logger.warning("Missing API key, using fallback mode")
-                return None
-                
-            headers = {
-                "Content-Type": "application/json",
-            }
+                return NOT_ATTEMPTED
             
-            if self.api_type == "openai":
-                # DeepSeek API需要特殊处理
-                if "deepseek" in self.api_base:
-                    # DeepSeek使用不同的身份验证格式
-                    headers["Authorization"] = f"Bearer {self.api_key}"
-                    # DeepSeek使用不同的模型名称
-                    if "model" in payload:
-                        if payload["model"] == "gpt-3.5-turbo":
-                            payload["model"] = "deepseek-chat"
-                        elif payload["model"] == "text-embedding-ada-002":
-                            payload["model"] = "deepseek-embed"
-                else:
-                    # 标准OpenAI API
-                    headers["Authorization"] = f"Bearer {self.api_key}"
-            elif self.api_type == "azure":
-                headers["api-key"] = self.api_key
-            
-            url = f"{self.api_base}{endpoint}"
+            # 共享截止时间已过、限流排队超时或熔断器断开时直接回退
+            timeout = self._acquire_call(estimated_tokens, breaker, route.timeout if route else None)
+            if timeout is None:
+                return NOT_ATTEMPTED
+        except Exception as e:
+            logger.error(f"API call error: {e}")
+            return NOT_ATTEMPTED
+        
+        response = None
+        try:
+            # 每个端点使用payload副本，对冲请求之间互不影响
+            payload = dict(payload)
+            url, headers = self._prepare_request(endpoint, payload, target,
+                                                 pin_model=bool(route and route.model))
+            served_by = [target.api_base, payload.get("model")]
             
             # 减少日志信息，避免日志过多
             logger.debug(f"API Call: {url}")
             logger.debug(f"Payload model: {payload.get('model')}")
             
-            # 设置合理的超时时间
-            response = requests.post(
-                url,
-                headers=headers,
-                json=payload,
-                timeout=10  # 10秒超时
-            )
+            # 超时取单次超时与共享截止时间剩余的较小值，通过连接池复用TCP/TLS连接
+            with metrics.span("llm_request", endpoint=target.name, task=route.task if route else "other"):
+                response = self._get_session().post(
+                    url,
+                    headers=headers,
+                    json=payload,
+                    timeout=timeout
+                )
+            self._log_pool_stats()
+            self._record_status(response.status_code, breaker)
             
             if response.status_code == 200:
                 result = response.json()
                 # 验证响应格式
                 if isinstance(result, dict):
+                    # 记录服务商返回的实际用量，并用其校正TPM额度
+                    usage = result.get("usage") or {}
+                    metrics.record_usage(usage, payload.get("model"))
+                    if isinstance(usage.get("total_tokens"), int):
+                        self.rate_limiter.adjust_tokens(usage["total_tokens"] - estimated_tokens)
+                    result[SERVED_BY_FIELD] = served_by
                     return result
                 else:
                     logger.error(f"Invalid response format: {type(result)}")
@@ -88,20 +752,32 @@ class LLMIntegration:
                 if response.status_code in [401, 403]:
                     logger.warning("Authentication failed, using fallback mode")
                     return None
-                # 如果是配额错误，也使用回退
+                # 配额错误：按Retry-After暂停后重试一次，仍失败再回退
                 if response.status_code == 429:
+                    retry_after = self._handle_rate_limited(response)
+                    if retry_rate_limited:
+                        logger.warning(f"Rate limit exceeded, retrying after {retry_after:.1f}s")
+                        retried = self._request_api(endpoint, payload, target, retry_rate_limited=False,
+                                                    route=route)
+                        # 首次请求已发出并收到429，重试未能发出时仍计为一次失败
+                        return None if retried is NOT_ATTEMPTED else retried
                     logger.warning("Rate limit exceeded, using fallback mode")
                     return None
                 return None
                 
         except requests.exceptions.Timeout:
             logger.error("API call timeout")
+            breaker.record_failure()
             return None
         except requests.exceptions.RequestException as e:
             logger.error(f"API request error: {e}")
+            breaker.record_failure()
             return None
         except Exception as e:
             logger.error(f"API call error: {e}")
+            if response is None:
+                # 请求未完成，释放熔断器的探测名额
+                breaker.record_failure()
             return None
     
     def analyze_emotion(self, text: str) -> str:
@@ -121,9 +797,15 @@ class LLMIntegration:
         
         try:
             if self.api_type in ["openai", "azure"]:
+                route = self._task_route("classify")
+                cache_key = self._cache_key("emotion", route.request_model, text, route=route)
+                cached = self._cache_get(cache_key)
+                if cached is not MISSING:
+                    return cached
+                
                 # 使用OpenAI API进行情感分析
                 payload = {
-                    "model": "gpt-3.5-turbo",
+                    "model": route.request_model,
                     "messages": [
                         {
                             "role": "system", 
@@ -134,54 +816,47 @@ class LLMIntegration:
                             "content": text
                         }
                     ],
-                    "max_tokens": 10,
+                    "max_tokens": route.max_tokens or 10,
                     "temperature": 0
                 }
                 
-                result = self._call_api("/chat/completions", payload)
+                result = self._call_api("/chat/completions", payload, route=route)
                 if result and "choices" in result and len(result["choices"]) > 0:
                     emotion = result["choices"][0]["message"]["content"].strip().lower()
                     # 确保返回标准的情感标签
-                    valid_emotions = ["happy", "sad", "angry", "anxious", "neutral"]
-                    return emotion if emotion in valid_emotions else "neutral"
+                    emotion = emotion if emotion in VALID_EMOTIONS else "neutral"
+                    self._cache_set(self._cache_key("emotion", route.request_model, text, result=result), emotion)
+                    return emotion
                 else:
                     logger.warning("No valid emotion analysis result from API")
             
             # 回退到关键词匹配
-            emotion_keywords = {
-                "happy": ["开心", "高兴", "快乐", "幸福", "愉快", "开心"],
-                "sad": ["伤心", "难过", "悲伤", "沮丧", "失望", "伤心"],
-                "angry": ["生气", "愤怒", "恼火", "烦躁", "不满", "生气"],
-                "anxious": ["焦虑", "紧张", "担心", "不安", "压力", "焦虑"]
-            }
-            
-            for emotion, keywords in emotion_keywords.items():
-                if any(keyword in text for keyword in keywords):
-                    return emotion
-            
-            return "neutral"
+            return self._keyword_emotion(text)
             
         except Exception as e:
             logger.error(f"Emotion analysis failed: {e}")
             return "neutral"
     
-    def generate_response(self, prompt: str, max_length: int = 300, temperature: float = 0.7) -> str:
+    def generate_response(self, prompt: str, max_length: int = 300, temperature: float = 0.7,
+                          task: str = "reply") -> str:
         """
         生成文本响应
         
         Args:
             prompt: 提示文本
-            max_length: 最大生成长度
+            max_length: 最大生成长度（任务路由配置了max_tokens时以其为准）
             temperature: 生成温度
+            task: 任务类型（reply、options、ultra_think、summary、crisis），决定模型路由
         
         Returns:
             生成的响应文本
         """
         try:
             if self.api_type in ["openai", "azure"]:
+                route = self._task_route(task)
                 # 使用OpenAI API生成响应
                 payload = {
-                    "model": "gpt-3.5-turbo",
+                    "model": route.request_model,
                     "messages": [
                         {
                             "role": "system",
@@ -192,11 +867,11 @@ class LLMIntegration:
                             "content": prompt
                         }
                     ],
-                    "max_tokens": max_length,
+                    "max_tokens": route.max_tokens or max_length,
                     "temperature": temperature
                 }
                 
-                result = self._call_api("/chat/completions", payload)
+                result = self._call_api("/chat/completions", payload, hedge=True, route=route)
                 if result and "choices" in result and len(result["choices"]) > 0:
                     content = result["choices"][0]["message"]["content"]
                     if content and isinstance(content, str):
@@ -207,19 +882,59 @@ class LLMIntegration:
                     logger.warning("No valid choices in API response")
             
             # 回退响应
-            fallback_responses = [
-                "我在这里为您提供支持。请告诉我更多关于您的感受。",
-                "感谢您的消息。我理解这可能不容易，我会尽力帮助您。",
-                "我在这里倾听您。请随时分享您的想法和感受。"
-            ]
-            
             import random
-            return random.choice(fallback_responses)
+            return random.choice(FALLBACK_RESPONSES)
             
         except Exception as e:
             logger.error(f"Response generation failed: {e}")
             return "抱歉，我暂时无法处理您的请求。请稍后再试。"
     
+    def generate_response_stream(self, prompt: str, max_length: int = 300,
+                                 temperature: float = 0.7, task: str = "reply") -> Iterator[str]:
+        """
+        流式生成文本响应
+        
+        Args:
+            prompt: 提示文本
+            max_length: 最大生成长度（任务路由配置了max_tokens时以其为准）
+            temperature: 生成温度
+            task: 任务类型，决定模型路由
+        
+        Yields:
+            生成内容的增量片段；API不可用时整体返回一条回退响应
+        """
+        produced = False
+        try:
+            if self.api_type in ["openai", "azure"]:
+                route = self._task_route(task)
+                payload = {
+                    "model": route.request_model,
+                    "messages": [
+                        {
+                            "role": "system",
+                            "content": "你是一个富有同理心的治疗型AI助手，专门提供心理健康支持。用中文回答，保持温暖、支持性和专业性。"
+                        },
+                        {
+                            "role": "user", 
+                            "content": prompt
+                        }
+                    ],
+                    "max_tokens": route.max_tokens or max_length,
+                    "temperature": temperature
+                }
+                
+                for delta in self._call_api_stream("/chat/completions", payload, route=route):
+                    produced = True
+                    yield delta
+                    
+        except Exception as e:
+            logger.error(f"Streaming response generation failed: {e}")
+        
+        if not produced:
+            logger.warning("No streamed content from API, using fallback response")
+            import random
+            yield random.choice(FALLBACK_RESPONSES)
+    
     def analyze_intention(self, text: str) -> str:
         """
         分析文本中的意图（特别是自杀意图）
@@ -237,8 +952,14 @@ class LLMIntegration:
         
         try:
             if self.api_type in ["openai", "azure"]:
+                route = self._task_route("classify")
+                cache_key = self._cache_key("intention", route.request_model, text, route=route)
+                cached = self._cache_get(cache_key)
+                if cached is not MISSING:
+                    return cached
+                
                 payload = {
-                    "model": "gpt-3.5-turbo",
+                    "model": route.request_model,
                     "messages": [
                         {
                             "role": "system", 
@@ -249,33 +970,152 @@ class LLMIntegration:
                             "content": text
                         }
                     ],
-                    "max_tokens": 5,
+                    "max_tokens": route.max_tokens or 5,
                     "temperature": 0
                 }
                 
-                result = self._call_api("/chat/completions", payload)
+                result = self._call_api("/chat/completions", payload, route=route)
                 if result and "choices" in result and len(result["choices"]) > 0:
                     intention = result["choices"][0]["message"]["content"].strip().lower()
-                    return "s" if intention == "s" else "not_s"
+                    intention = "s" if intention == "s" else "not_s"
+                    self._cache_set(self._cache_key("intention", route.request_model, text, result=result), intention)
+                    return intention
                 else:
                     logger.warning("No valid intention analysis result from API")
             
             # 关键词匹配回退
-            suicidal_keywords = [
-                "自杀", "不想活了", "结束生命", "离开这个世界", 
-                "活着没意思", "撑不下去了", "想死", "自残", "伤害自己"
-            ]
-            
-            for keyword in suicidal_keywords:
-                if keyword in text:
-                    return "s"
-            
-            return "not_s"
+            return self._keyword_intention(text)
             
         except Exception as e:
             logger.error(f"Intention analysis failed: {e}")
             return "not_s"
     
+    def classify(self, text: str) -> Dict[str, Any]:
+        """
+        单次请求同时完成情感分析和意图（自杀倾向）识别
+        
+        Args:
+            text: 要分析的文本
+        
+        Returns:
+            {"emotion": 情感标签, "intention": 's'或'not_s', "confidence": 0-1之间的置信度}
+            关键词回退结果的置信度为0.0
+        """
+        if not text or not text.strip():
+            return {"emotion": "neutral", "intention": "not_s", "confidence": 1.0}
+        
+        text = text.strip().lower()
+        
+        try:
+            if self.api_type in ["openai", "azure"]:
+                route = self._task_route("classify")
+                cache_key = self._cache_key("classify", route.request_model, text, route=route)
+                cached = self._cache_get(cache_key)
+                if cached is not MISSING:
+                    return dict(cached)
+                
+                payload = {
+                    "model": route.request_model,
+                    "messages": [
+                        {
+                            "role": "system",
+                            "content": (
+                                "你是心理健康分析助手。请分析用户文本的情感和是否表达自杀意图，"
+                                "只返回JSON对象，格式为："
+                                '{"emotion": "happy|sad|angry|anxious|neutral", '
+                                '"intention": "s|not_s", "confidence": 0到1之间的数字}。'
+                                "不要其他内容。"
+                            )
+                        },
+                        {
+                            "role": "user",
+                            "content": text
+                        }
+                    ],
+                    "max_tokens": route.max_tokens or 40,
+                    "temperature": 0,
+                    "response_format": {"type": "json_object"}
+                }
+                
+                result = self._call_api("/chat/completions", payload, route=route)
+                if result and "choices" in result and len(result["choices"]) > 0:
+                    classification = self._parse_classification(
+                        result["choices"][0]["message"]["content"]
+                    )
+                    if classification:
+                        self._cache_set(self._cache_key("classify", route.request_model, text, result=result),
+                                        dict(classification))
+                        return classification
+                    logger.warning("Invalid classification JSON from API")
+                else:
+                    logger.warning("No valid classification result from API")
+            
+            # 回退到关键词匹配
+            return self.fallback_classify(text)
+            
+        except Exception as e:
+            logger.error(f"Classification failed: {e}")
+            return {"emotion": "neutral", "intention": "not_s", "confidence": 0.0}
+    
+    def fallback_classify(self, text: str) -> Dict[str, Any]:
+        """
+        仅使用本地关键词匹配进行分类，不发起网络请求
+        
+        Args:
+            text: 要分析的文本
+        
+        Returns:
+            与classify相同格式的结果，置信度为0.0
+        """
+        text = (text or "").strip().lower()
+        return {
+            "emotion": self._keyword_emotion(text),
+            "intention": self._keyword_intention(text),
+            "confidence": 0.0
+        }
+    
+    def _parse_classification(self, content: Any) -> Optional[Dict[str, Any]]:
+        """解析并校验结构化分类结果"""
+        if not content or not isinstance(content, str):
+            return None
+        
+        try:
+            data = json.loads(content)
+        except ValueError:
+            # 部分模型会在JSON外包裹其他文本
+            import re
+            json_match = re.search(r'\{.*\}', content, re.DOTALL)
+            if not json_match:
+                return None
+            try:
+                data = json.loads(json_match.group())
+            except ValueError:
+                return None
+        
+        if not isinstance(data, dict):
+            return None
+        
+        emotion = str(data.get("emotion", "")).strip().lower()
+        intention = str(data.get("intention", "")).strip().lower()
+        try:
+            confidence = float(data.get("confidence", 0.5))
+        except (TypeError, ValueError):
+            confidence = 0.5
+        
+        return {
+            "emotion": emotion if emotion in VALID_EMOTIONS else "neutral",
+            "intention": "s" if intention == "s" else "not_s",
+            "confidence": min(1.0, max(0.0, confidence))
+        }
+    
+    def _keyword_emotion(self, text: str) -> str:
+        """关键词匹配情感（API不可用时的回退），词表见 lexicons/emotion_zh.json"""
+        return get_matcher("emotion_zh").first_category(text, "neutral")
+    
+    def _keyword_intention(self, text: str) -> str:
+        """关键词匹配自杀意图（API不可用时的回退），词表见 lexicons/crisis.json"""
+        return "s" if get_matcher("crisis").contains(text) else "not_s"
+    
     def get_semantic_similarity(self, text1: str, text2: str) -> float:
         """
         计算两个文本之间的语义相似度
@@ -289,6 +1129,14 @@ class LLMIntegration:
         """
         try:
             if self.api_type in ["openai", "azure"]:
+                # 余弦相似度与文本顺序无关，排序后作为缓存键
+                cache_key = self._cache_key(
+                    "similarity", "text-embedding-ada-002", *sorted([text1 or "", text2 or ""])
+                )
+                cached = self._cache_get(cache_key)
+                if cached is not MISSING:
+                    return cached
+                
                 payload = {
                     "model": "text-embedding-ada-002",
                     "input": [text1, text2]
@@ -303,8 +1151,11 @@ class LLMIntegration:
                     emb1 = np.array(result["data"][0]["embedding"])
                     emb2 = np.array(result["data"][1]["embedding"])
                     
-                    similarity = np.dot(emb1, emb2) / (norm(emb1) * norm(emb2))
-                    return float(similarity)
+                    similarity = float(np.dot(emb1, emb2) / (norm(emb1) * norm(emb2)))
+                    self._cache_set(self._cache_key(
+                        "similarity", "text-embedding-ada-002", *sorted([text1 or "", text2 or ""]), result=result
+                    ), similarity)
+                    return similarity
             
             # 简单的文本相似度回退
             import difflib
@@ -337,50 +1188,34 @@ class MockLLM:
     
     def analyze_emotion(self, text: str) -> str:
         """模拟情感分析"""
-        text = text.strip().lower()
-        if not text:
-            return "neutral"
-        
-        emotion_keywords = {
-            "happy": ["开心", "高兴", "快乐", "幸福", "愉快"],
-            "sad": ["伤心", "难过", "悲伤", "沮丧", "失望"],
-            "angry": ["生气", "愤怒", "恼火", "烦躁", "不满"],
-            "anxious": ["焦虑", "紧张", "担心", "不安", "压力"]
-        }
-        
-        for emotion, keywords in emotion_keywords.items():
-            if any(keyword in text for keyword in keywords):
-                return emotion
-        
-        return "neutral"
+        return get_matcher("emotion_zh").first_category(text, "neutral")
     
-    def generate_response(self, prompt: str, max_length: int = 300, temperature: float = 0.7) -> str:
+    def generate_response(self, prompt: str, max_length: int = 300, temperature: float = 0.7,
+                          task: str = "reply") -> str:
         """模拟响应生成"""
-        fallback_responses = [
-            "我在这里为您提供支持。请告诉我更多关于您的感受。",
-            "感谢您的消息。我理解这可能不容易，我会尽力帮助您。",
-            "我在这里倾听您。请随时分享您的想法和感受。"
-        ]
-        
         import random
-        return random.choice(fallback_responses)
+        return random.choice(FALLBACK_RESPONSES)
+    
+    def generate_response_stream(self, prompt: str, max_length: int = 300,
+                                 temperature: float = 0.7, task: str = "reply") -> Iterator[str]:
+        """模拟流式响应生成"""
+        yield self.generate_response(prompt, max_length, temperature)
     
     def analyze_intention(self, text: str) -> str:
         """模拟意图分析"""
-        text = text.strip().lower()
-        if not text:
-            return "not_s"
-        
-        suicidal_keywords = [
-            "自杀", "不想活了", "结束生命", "离开这个世界", 
-            "活着没意思", "撑不下去了", "想死"
-        ]
-        
-        for keyword in suicidal_keywords:
-            if keyword in text:
-                return "s"
-        
-        return "not_s"
+        return "s" if get_matcher("crisis").contains(text) else "not_s"
+    
+    def classify(self, text: str) -> Dict[str, Any]:
+        """模拟情感与意图联合分析"""
+        return {
+            "emotion": self.analyze_emotion(text),
+            "intention": self.analyze_intention(text),
+            "confidence": 0.0
+        }
+    
+    def fallback_classify(self, text: str) -> Dict[str, Any]:
+        """模拟本地回退分类"""
+        return self.classify(text)
     
     def get_semantic_similarity(self, text1: str, text2: str) -> float:
         """模拟语义相似度"""
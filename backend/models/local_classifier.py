@@ -0,0 +1,334 @@
+"""
+Local, CPU-only emotion and crisis classifier.
+
+A character n-gram TF-IDF + logistic regression model trained from the
+EmpatheticPersonas data and serialized with joblib. One model predicts the
+rule-based flow's 12 fine-grained emotions; the 5 coarse labels used by the
+LLM flow are derived by summing the fine-grained probabilities, so both
+taxonomies come from a single sub-millisecond prediction.
+
+Train it with:
+
+    python -m backend.models.local_classifier train [--data PATH] [--output PATH]
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import threading
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+from backend.utils.keyword_matcher import get_matcher
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DATA_PATH = os.path.join(BACKEND_DIR, "EmpatheticPersonas.csv")
+DEFAULT_MODEL_PATH = os.path.join(BACKEND_DIR, "models", "artifacts", "local_classifier.joblib")
+
+MODEL_FORMAT_VERSION = 1
+
+# Fine-grained taxonomy used by the rule-based flow
+FINE_EMOTIONS = ['fear', 'love', 'instability', 'disgust', 'disappointment',
+                 'shame', 'anger', 'jealous', 'sadness', 'envy', 'joy', 'guilt']
+
+# EmpatheticPersonas column prefixes ("Sad - ...") to fine-grained labels
+PERSONA_EMOTIONS = {
+    "Sad": "sadness",
+    "Anxious": "fear",
+    "Happy": "joy",
+    "Angry": "anger",
+    "Loving": "love",
+    "Insecure": "instability",
+    "Disgusted": "disgust",
+    "Disappointed": "disappointment",
+    "Ashamed": "shame",
+    "Guilty": "guilt",
+    "Envious": "envy",
+    "Jealous": "jealous"
+}
+
+# Fine-grained labels to the LLM flow's labels (see VALID_EMOTIONS)
+FINE_TO_COARSE = {
+    "joy": "happy",
+    "love": "happy",
+    "sadness": "sad",
+    "disappointment": "sad",
+    "shame": "sad",
+    "guilt": "sad",
+    "anger": "angry",
+    "disgust": "angry",
+    "envy": "angry",
+    "jealous": "angry",
+    "fear": "anxious",
+    "instability": "anxious"
+}
+
+def _normalize_label(value: Any) -> Optional[str]:
+    """Map a persona prefix or fine-grained label to a fine-grained label"""
+    if not isinstance(value, str):
+        return None
+    value = value.strip()
+    if value in PERSONA_EMOTIONS:
+        return PERSONA_EMOTIONS[value]
+    value = value.lower()
+    return value if value in FINE_EMOTIONS else None
+
+
+def _normalize_intention(value: Any) -> Optional[str]:
+    """Map an 's'/'not_s' (or 1/0) crisis label to 's'/'not_s'"""
+    if isinstance(value, str):
+        value = value.strip().lower()
+        if value in ("s", "not_s"):
+            return value
+        if value in ("1", "0"):
+            return "s" if value == "1" else "not_s"
+        return None
+    if value in (0, 1):
+        return "s" if value == 1 else "not_s"
+    return None
+
+
+def load_training_data(path: str) -> Tuple[List[str], List[str], Optional[List[str]]]:
+    """
+    Read labelled utterances from a CSV file.
+
+    Two layouts are supported:
+    - long form, with a "text" column, an "emotion" (or "label") column and
+      an optional "intention" (or "s") crisis column;
+    - the EmpatheticPersonas wide form, where each column header starts with
+      an emotion ("Sad - ...") and the column holds utterances for it.
+      "All emotions" columns carry no label and are skipped.
+
+    Returns:
+        (texts, fine-grained emotions, crisis labels or None)
+    """
+    import pandas as pd
+
+    data = pd.read_csv(path, encoding='ISO-8859-1')
+    columns = {column.strip().lower(): column for column in data.columns}
+    texts, emotions, intentions = [], [], []
+
+    label_column = columns.get("emotion") or columns.get("label")
+    if "text" in columns and label_column:
+        intention_column = columns.get("intention") or columns.get("s")
+        for _, row in data.iterrows():
+            text, emotion = row[columns["text"]], _normalize_label(row[label_column])
+            if not isinstance(text, str) or not text.strip() or emotion is None:
+                continue
+            texts.append(text.strip())
+            emotions.append(emotion)
+            if intention_column:
+                intentions.append(_normalize_intention(row[intention_column]) or "not_s")
+        return texts, emotions, intentions or None
+
+    for column in data.columns:
+        emotion = _normalize_label(column.split(" - ")[0])
+        if emotion is None:
+            continue
+        for text in data[column].dropna():
+            if isinstance(text, str) and text.strip():
+                texts.append(text.strip())
+                emotions.append(emotion)
+    return texts, emotions, None
+
+
+def _build_pipeline():
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import Pipeline
+
+    return Pipeline([
+        ("tfidf", TfidfVectorizer(analyzer="char_wb", ngram_range=(2, 4),
+                                  sublinear_tf=True, max_features=50000,
+                                  lowercase=True)),
+        ("clf", LogisticRegression(max_iter=1000, C=4.0))
+    ])
+
+
+def train(data_path: str = DEFAULT_DATA_PATH, model_path: str = DEFAULT_MODEL_PATH,
+          holdout: float = 0.2) -> Dict[str, Any]:
+    """
+    Train the emotion (and, if labelled data exists, crisis) models and
+    serialize them to model_path.
+
+    Returns:
+        Training report: sample counts, holdout accuracy, mean latency
+    """
+    import joblib
+    from sklearn.model_selection import train_test_split
+
+    texts, emotions, intentions = load_training_data(data_path)
+    if len(set(emotions)) < 2:
+        raise ValueError(f"Need at least two emotion labels in {data_path}, found {sorted(set(emotions))}")
+
+    report: Dict[str, Any] = {"samples": len(texts), "labels": sorted(set(emotions))}
+
+    # Holdout accuracy first, then refit on everything for the shipped model
+    if holdout and len(texts) >= 50:
+        train_x, test_x, train_y, test_y = train_test_split(
+            texts, emotions, test_size=holdout, random_state=42, stratify=emotions
+        )
+        pipeline = _build_pipeline().fit(train_x, train_y)
+        report["holdout_accuracy"] = round(pipeline.score(test_x, test_y), 4)
+
+    emotion_model = _build_pipeline().fit(texts, emotions)
+
+    crisis_model = None
+    if intentions and len(set(intentions)) == 2:
+        crisis_model = _build_pipeline().fit(texts, intentions)
+    report["crisis_model"] = crisis_model is not None
+
+    os.makedirs(os.path.dirname(os.path.abspath(model_path)), exist_ok=True)
+    joblib.dump({
+        "version": MODEL_FORMAT_VERSION,
+        "emotion": emotion_model,
+        "crisis": crisis_model,
+        "trained_at": datetime.now().isoformat(),
+        "samples": len(texts)
+    }, model_path)
+    report["model_path"] = model_path
+
+    # Single-message latency, as the request path sees it
+    classifier = LocalClassifier(model_path)
+    sample = texts[:200]
+    start = time.perf_counter()
+    for text in sample:
+        classifier.predict(text)
+    report["mean_latency_ms"] = round((time.perf_counter() - start) * 1000 / max(1, len(sample)), 4)
+    return report
+
+
+class LocalClassifier:
+    """Lazily loaded local classifier; predict() returns None until a model is trained"""
+
+    def __init__(self, model_path: Optional[str] = None, neutral_below: Optional[float] = None):
+        self.model_path = model_path or os.getenv("LOCAL_CLASSIFIER_PATH", DEFAULT_MODEL_PATH)
+        # Coarse predictions below this probability are reported as neutral
+        self.neutral_below = neutral_below if neutral_below is not None else float(
+            os.getenv("LOCAL_CLASSIFIER_NEUTRAL_BELOW", "0.4")
+        )
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._emotion_model = None
+        self._crisis_model = None
+
+    def _load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            if not os.path.exists(self.model_path):
+                logger.info(f"No local classifier at {self.model_path}; run "
+                            f"'python -m backend.models.local_classifier train' to create one")
+                return
+            try:
+                import joblib
+                bundle = joblib.load(self.model_path)
+                if bundle.get("version") != MODEL_FORMAT_VERSION:
+                    logger.warning(f"Ignoring local classifier with format version {bundle.get('version')}")
+                    return
+                self._emotion_model = bundle["emotion"]
+                self._crisis_model = bundle.get("crisis")
+                logger.info(f"Loaded local classifier trained at {bundle.get('trained_at')}")
+            except Exception as e:
+                logger.warning(f"Failed to load local classifier: {e}")
+
+    @property
+    def available(self) -> bool:
+        if not self._loaded:
+            self._load()
+        return self._emotion_model is not None
+
+    @property
+    def has_crisis_model(self) -> bool:
+        """Whether intentions come from a trained crisis model, not keywords alone"""
+        return self.available and self._crisis_model is not None
+
+    def predict(self, text: str) -> Optional[Dict[str, Any]]:
+        """
+        Classify a message in both taxonomies.
+
+        Returns:
+            {"emotion", "fine_emotion", "intention", "confidence"}, where
+            emotion is one of VALID_EMOTIONS and confidence is its
+            probability, or None if no model is available
+        """
+        if not self.available:
+            return None
+        text = (text or "").strip()
+
+        probabilities = self._emotion_model.predict_proba([text])[0]
+        classes = self._emotion_model.classes_
+        fine_emotion = str(classes[probabilities.argmax()])
+
+        coarse: Dict[str, float] = {}
+        for label, probability in zip(classes, probabilities):
+            coarse_label = FINE_TO_COARSE.get(label, "neutral")
+            coarse[coarse_label] = coarse.get(coarse_label, 0.0) + float(probability)
+        emotion, confidence = max(coarse.items(), key=lambda item: item[1])
+        if confidence < self.neutral_below:
+            emotion = "neutral"
+
+        return {
+            "emotion": emotion,
+            "fine_emotion": fine_emotion,
+            "intention": self._predict_intention(text),
+            "confidence": round(confidence, 4)
+        }
+
+    def _predict_intention(self, text: str) -> str:
+        # Crisis phrases are always checked, whether or not a crisis model was trained
+        if get_matcher("crisis").contains(text):
+            return "s"
+        if self._crisis_model is not None:
+            return str(self._crisis_model.predict([text])[0])
+        return "not_s"
+
+
+_local_classifier = None
+
+
+def get_local_classifier() -> LocalClassifier:
+    """Get the global local classifier (the model itself loads on first use)"""
+    global _local_classifier
+    if _local_classifier is None:
+        _local_classifier = LocalClassifier()
+    return _local_classifier
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Local emotion/crisis classifier")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    train_parser = subparsers.add_parser("train", help="train and serialize the model")
+    train_parser.add_argument("--data", default=DEFAULT_DATA_PATH, help="training CSV")
+    train_parser.add_argument("--output", default=DEFAULT_MODEL_PATH, help="joblib output path")
+    train_parser.add_argument("--holdout", type=float, default=0.2,
+                              help="fraction held out for the accuracy report (0 to skip)")
+
+    predict_parser = subparsers.add_parser("predict", help="classify messages with a trained model")
+    predict_parser.add_argument("text", nargs="+")
+    predict_parser.add_argument("--model", default=None, help="joblib model path")
+
+    args = parser.parse_args(argv)
+    if args.command == "train":
+        report = train(args.data, args.output, args.holdout)
+        for key, value in report.items():
+            print(f"{key}: {value}")
+        return 0
+
+    classifier = LocalClassifier(args.model)
+    if not classifier.available:
+        print(f"No model found at {classifier.model_path}", file=sys.stderr)
+        return 1
+    for text in args.text:
+        print(f"{text!r}: {classifier.predict(text)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -15,6 +15,8 @@ from sklearn.metrics.pairwise import cosine_similarity
 import PyPDF2
 import docx
 
+from backend.utils.metrics import metrics
+
 logger = logging.getLogger(__name__)
 
 class DocumentProcessor:
@@ -195,7 +197,8 @@ class RAGSystem:
     
     def enhance_prompt_with_context(self, user_prompt: str, user_id: str = None) -> str:
         """Enhance user prompt with relevant document context"""
-        relevant_content = self.retrieve_relevant_content(user_prompt, user_id)
+        with metrics.span("rag_retrieval"):
+            relevant_content = self.retrieve_relevant_content(user_prompt, user_id)
         
         if not relevant_content:
             return user_prompt
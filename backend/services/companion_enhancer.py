@@ -9,6 +9,8 @@ from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 import re
 
+from backend.utils.keyword_matcher import get_matcher
+
 logger = logging.getLogger(__name__)
 
 class CompanionEnhancer:
@@ -29,19 +31,9 @@ class CompanionEnhancer:
             'neutral': 0.5  # Default neutral score
         }
         
-        text_lower = text.lower()
-        
-        # Emotional keyword analysis
-        emotion_keywords = {
-            'happy': ['happy', 'joy', 'good', 'great', 'wonderful', 'excited', 'love'],
-            'sad': ['sad', 'unhappy', 'depressed', 'cry', 'tears', 'lonely', 'miss'],
-            'angry': ['angry', 'mad', 'hate', 'frustrated', 'annoyed', 'upset'],
-            'anxious': ['anxious', 'worried', 'nervous', 'scared', 'afraid', 'stress']
-        }
-        
-        for emotion, keywords in emotion_keywords.items():
-            count = sum(1 for keyword in keywords if keyword in text_lower)
-            emotion_scores[emotion] = min(1.0, count * 0.3)  # Cap at 1.0
+        # Emotional keyword analysis (lexicons/emotion_en.json)
+        for emotion, keywords in get_matcher('emotion_en').matched_categories(text).items():
+            emotion_scores[emotion] = min(1.0, len(keywords) * 0.3)  # Cap at 1.0
         
         # Adjust neutral score based on other emotions
         total_emotion = sum(emotion_scores.values()) - emotion_scores['neutral']
@@ -195,15 +187,8 @@ class CompanionEnhancer:
         return response
     
     def detect_crisis_keywords(self, text: str) -> bool:
-        """Detect potential crisis situations"""
-        crisis_keywords = [
-            'suicide', 'kill myself', 'end my life', 'want to die',
-            'not worth living', 'better off dead', 'no reason to live',
-            'harm myself', 'self harm', 'hurting myself'
-        ]
-        
-        text_lower = text.lower()
-        return any(keyword in text_lower for keyword in crisis_keywords)
+        """Detect potential crisis situations (lexicons/crisis.json)"""
+        return get_matcher('crisis').contains(text)
     
     def generate_crisis_response(self) -> str:
         """Generate appropriate response for crisis situations"""
@@ -0,0 +1,116 @@
+"""
+Local crisis pre-screen and immediate safety replies.
+
+Messages are screened against the crisis lexicon with the shared keyword
+matcher, so a single pass finds every hit. A hit is answered
+at once with a safety message listing the hotlines of the user's country;
+messages are pre-rendered per locale and country, so nothing on this path
+waits on the network.
+"""
+
+import os
+import re
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from backend.utils.keyword_matcher import KeywordMatcher, get_matcher
+
+logger = logging.getLogger(__name__)
+
+_CJK = re.compile(r"[\u4e00-\u9fff]")
+
+SAFETY_TEMPLATES = {
+    "zh": (
+        "我非常在意你刚才说的话，你现在的安全是最重要的。你并不孤单，"
+        "现在就可以联系专业的危机干预热线：\n{hotlines}\n"
+        "如果你正处于危险之中，请立即拨打当地急救电话或前往最近的医院。"
+        "我会一直在这里陪着你，愿意和我说说你现在的感受吗？"
+    ),
+    "en": (
+        "I'm really concerned about what you've shared, and your safety matters most right now. "
+        "You don't have to go through this alone - you can reach someone right away:\n{hotlines}\n"
+        "If you are in immediate danger, please call your local emergency number or go to the "
+        "nearest hospital. I'm here with you. Would you tell me more about how you're feeling?"
+    )
+}
+
+# Used when no hotlines are known for the country
+GENERIC_HOTLINES = {
+    "zh": "当地的心理危机干预热线或急救电话",
+    "en": "Your local crisis line or emergency services"
+}
+
+
+def _load_hotlines() -> Tuple[Dict[str, List[str]], Dict[str, str]]:
+    """(hotlines by country, canonical country by lowercase name) from CountryFinder"""
+    try:
+        from backend.utils.countries import CountryFinder
+        finder = CountryFinder()
+        return finder.phoneline_from_country, finder.countries
+    except Exception as e:
+        logger.warning(f"Crisis hotlines unavailable, using generic safety messages: {e}")
+        return {}, {}
+
+
+class CrisisScreen:
+    """Single-pass crisis keyword screen with pre-rendered safety messages"""
+
+    def __init__(self, matcher: KeywordMatcher, default_countries: Dict[str, str]):
+        """
+        Args:
+            matcher: Crisis phrases, matched case-insensitively anywhere in the text
+            default_countries: Country whose hotlines are listed per locale when
+                the user's country is unknown
+        """
+        self.matcher = matcher
+        self.default_countries = default_countries
+        self._hotlines, self._country_names = _load_hotlines()
+        self._rendered: Dict[Tuple[str, str], str] = {}
+        self._lock = threading.Lock()
+        for locale, country in default_countries.items():
+            self.safety_message(locale, country)
+
+    def match(self, text: str) -> List[str]:
+        """Every crisis phrase found in the text, in order of where it ends"""
+        return [match.keyword for match in self.matcher.iter_matches(text)]
+
+    @staticmethod
+    def detect_locale(text: str) -> str:
+        return "zh" if text and _CJK.search(text) else "en"
+
+    def resolve_country(self, country: Optional[str], locale: str) -> str:
+        """Canonical country name, or the locale's default if it is not known"""
+        if country:
+            if country in self._hotlines:
+                return country
+            canonical = self._country_names.get(country.strip().lower())
+            if canonical:
+                return canonical
+        return self.default_countries.get(locale, self.default_countries.get("en", ""))
+
+    def safety_message(self, locale: str = "zh", country: Optional[str] = None) -> str:
+        """The safety message for a locale and country, rendered once and reused"""
+        locale = locale if locale in SAFETY_TEMPLATES else "en"
+        country = self.resolve_country(country, locale)
+        key = (locale, country)
+        message = self._rendered.get(key)
+        if message is None:
+            hotlines = self._hotlines.get(country) or [GENERIC_HOTLINES[locale]]
+            message = SAFETY_TEMPLATES[locale].format(
+                hotlines="\n".join(f"• {line}" for line in hotlines)
+            )
+            with self._lock:
+                self._rendered[key] = message
+        return message
+
+    def safety_reply(self, text: str, country: Optional[str] = None) -> str:
+        """The safety message in the language of the user's message"""
+        return self.safety_message(self.detect_locale(text), country)
+
+
+# Global crisis screen instance
+crisis_screen = CrisisScreen(get_matcher("crisis"), {
+    "zh": os.getenv("CRISIS_COUNTRY_ZH", "China"),
+    "en": os.getenv("CRISIS_COUNTRY_EN", "United States")
+})
@@ -0,0 +1,150 @@
+"""
+Deferred task store for work that should not sit on the request path.
+Results are computed on a background thread pool and handed out by an
+opaque token, with a fallback value served until they are ready.
+
+With a shared state backend, pending and finished results are also
+published there, so a token can be redeemed on any worker process.
+"""
+
+import logging
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from backend.utils.state_backend import StateBackend
+
+logger = logging.getLogger(__name__)
+
+
+class DeferredTaskStore:
+    """Background results addressable by token, expired after a TTL"""
+    
+    def __init__(self, name: str, max_workers: int = 4, ttl_seconds: float = 300,
+                 max_entries: int = 10000, state: Optional[StateBackend] = None,
+                 poll_interval: float = 0.05):
+        """
+        Args:
+            state: Backend the results are published to (JSON-serializable
+                results only), for lookups from other processes
+            poll_interval: Seconds between backend reads while waiting for a
+                result computed elsewhere
+        """
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.state = state
+        self.poll_interval = poll_interval
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._tasks: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+    
+    def submit(self, func: Callable, *args, fallback: Any = None, **kwargs) -> str:
+        """
+        Schedule func(*args, **kwargs) in the background
+        
+        Args:
+            func: Callable producing the result
+            fallback: Value served while the result is pending or if it fails
+            
+        Returns:
+            Token used to fetch the result
+        """
+        token = secrets.token_urlsafe(16)
+        if self.state is not None:
+            self._publish(token, {"ready": False, "result": fallback})
+        future = self._executor.submit(func, *args, **kwargs)
+        if self.state is not None:
+            future.add_done_callback(lambda done: self._publish(token, self._outcome(done, fallback)))
+        with self._lock:
+            self._purge_locked()
+            self._tasks[token] = {
+                "future": future,
+                "fallback": fallback,
+                "created_at": time.monotonic()
+            }
+        return token
+    
+    def get(self, token: str, wait: float = 0) -> Optional[Dict[str, Any]]:
+        """
+        Look up a deferred result
+        
+        Args:
+            token: Token returned by submit
+            wait: Seconds to block for a pending result
+            
+        Returns:
+            {"ready": bool, "result": ...} or None for unknown/expired tokens.
+            While pending (or after a failure) "result" is the fallback value.
+        """
+        with self._lock:
+            task = self._tasks.get(token)
+        if task is None:
+            return self._get_published(token, wait)
+        
+        future = task["future"]
+        if wait > 0 and not future.done():
+            try:
+                future.result(timeout=wait)
+            except Exception:
+                # Timeouts and failures are both reported below
+                pass
+        
+        if not future.done():
+            return {"ready": False, "result": task["fallback"]}
+        return self._outcome(future, task["fallback"])
+    
+    def _outcome(self, future, fallback: Any) -> Dict[str, Any]:
+        """{"ready": True, "result": ...} of a finished task"""
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.warning(f"Deferred {self.name} task failed: {e}")
+            result = None
+        return {"ready": True, "result": result if result is not None else fallback}
+    
+    def _key(self, token: str) -> str:
+        return f"deferred:{self.name}:{token}"
+    
+    def _publish(self, token: str, record: Dict[str, Any]) -> None:
+        try:
+            self.state.put(self._key(token), record, ttl=self.ttl_seconds)
+        except Exception as e:
+            logger.warning(f"Failed to publish deferred {self.name} result: {e}")
+    
+    def _get_published(self, token: str, wait: float) -> Optional[Dict[str, Any]]:
+        """A result submitted on another process, polled for up to wait seconds"""
+        if self.state is None:
+            return None
+        deadline = time.monotonic() + wait
+        while True:
+            try:
+                record = self.state.get(self._key(token))
+            except Exception as e:
+                logger.warning(f"Failed to read deferred {self.name} result: {e}")
+                return None
+            if record is None:
+                return None
+            if record[1].get("ready") or time.monotonic() >= deadline:
+                return dict(record[1])
+            time.sleep(min(self.poll_interval, max(0.0, deadline - time.monotonic())))
+    
+    def _purge_locked(self) -> None:
+        """Drop expired tasks, and the oldest ones beyond max_entries"""
+        now = time.monotonic()
+        expired = [token for token, task in self._tasks.items()
+                   if now - task["created_at"] > self.ttl_seconds]
+        for token in expired:
+            del self._tasks[token]
+        
+        overflow = len(self._tasks) - self.max_entries + 1
+        if overflow > 0:
+            # Dicts keep insertion order, so the first entries are the oldest
+            for token in list(self._tasks.keys())[:overflow]:
+                del self._tasks[token]
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._tasks)
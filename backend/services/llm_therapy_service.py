@@ -4,14 +4,42 @@ LLM-based therapy service that replaces the rule-based decision maker
 import os
 import logging
 import json
-from datetime import datetime
-from typing import Dict, List, Any, Optional
+import time
+import queue
+import threading
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait
+from typing import Dict, List, Any, Iterator, Optional, Tuple
 
-from backend.models.llm_integration import get_llm
+from backend.models.llm_integration import FALLBACK_RESPONSES, deadline_remaining, get_llm, llm_deadline
+from backend.models.local_classifier import get_local_classifier
 from backend.database.models import User, UserModelSession, Choice
+from backend.services.crisis_screen import crisis_screen
+from backend.services.deferred_tasks import DeferredTaskStore
+from backend.services.session_store import ChatMessage, SessionStore
+from backend.services.session_summary import RollingSummarizer
+from backend.services.memory_integration import memory_manager
+from backend.services.message_store import message_store, to_timestamp
+from backend.utils.prompt_budget import PromptBudget, PromptSection
+from backend.utils.keyword_matcher import get_matcher
+from backend.utils.state_backend import get_state_backend
+from backend.utils.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
+FALLBACK_REPLY = "我在这里为您提供支持。请告诉我更多关于您的感受。"
+DEFAULT_OPTIONS = ["继续对话", "换个话题", "需要帮助"]
+CRISIS_OPTIONS = ["紧急求助", "继续对话", "我需要帮助"]
+
+# Emotion-keyed quick replies, served instantly when LLM options are not ready
+FALLBACK_OPTIONS = {
+    "happy": ["继续分享", "讨论其他话题", "寻求建议", "结束对话"],
+    "sad": ["需要安慰", "讨论原因", "寻求帮助", "换个话题"],
+    "anxious": ["需要安抚", "讨论焦虑源", "放松技巧", "专业帮助"],
+    "angry": ["表达感受", "讨论原因", "冷静方法", "寻求支持"],
+    "neutral": ["继续对话", "换个话题", "寻求指导", "结束会话"]
+}
+
 class LLMTherapyService:
     """
     LLM-based therapy service that handles all therapeutic conversations
@@ -20,13 +48,113 @@ class LLMTherapyService:
     
     def __init__(self):
         self.llm = get_llm()
-        self.conversation_histories: Dict[str, List[Dict]] = {}
-        self._ultra_think_mode = False
+        # Recent messages per session, bounded by idle TTL and session count;
+        # evicted sessions drop their per-session state too and are reloaded
+        # from the message table. With a shared state backend (STATE_BACKEND)
+        # every worker sees the same histories
+        state = get_state_backend()
+        self.state = state
+        # Turns trimmed from the history are folded into a rolling summary
+        # in the background every SUMMARY_EVERY_TURNS turns (0 disables)
+        summary_every = int(os.getenv("SUMMARY_EVERY_TURNS", "5"))
+        self.summarizer = RollingSummarizer(
+            self._fold_session_summary, state,
+            every_turns=summary_every,
+            ttl_seconds=float(os.getenv("SESSION_TTL_SECONDS", "3600")),
+            max_workers=int(os.getenv("SUMMARY_WORKERS", "2")),
+            loader=self._load_session_summary,
+            on_fold=self._save_session_summary
+        ) if summary_every > 0 else None
+        self.sessions = SessionStore(
+            max_entries=int(os.getenv("SESSION_MAX_ENTRIES", "10000")),
+            ttl_seconds=float(os.getenv("SESSION_TTL_SECONDS", "3600")),
+            max_messages=int(os.getenv("SESSION_HISTORY_MESSAGES", "10")),
+            loader=self._load_session_history,
+            on_evict=self._forget_session_state,
+            backend=state.backend if state.shared else None,
+            on_trim=self.summarizer.add if self.summarizer else None
+        )
+        # Quick-reply options issued per session (ordered, bounded) and the
+        # session's last classification, so button taps skip the LLM
+        self.issued_options: Dict[str, Dict[str, None]] = {}
+        self.last_classifications: Dict[str, Dict[str, Any]] = {}
+        self.max_issued_options = int(os.getenv("MAX_ISSUED_OPTIONS", "32"))
+        # Local model pre-screen: crisis hits skip the LLM classification
+        # call; confident predictions supply the emotion (and, with a trained
+        # crisis model, the intention too)
+        self.local_classifier = get_local_classifier()
+        self.local_confidence = float(os.getenv("LOCAL_CLASSIFIER_CONFIDENCE", "0.9"))
+        # UltraThink is chosen per session (carried in the request) and its
+        # replies run on their own small pool, so deep-thinking sessions
+        # cannot take the LLM concurrency standard turns need. When every
+        # worker and queue slot is taken, the turn gets a standard reply
+        self.ultra_think_sessions: Dict[str, bool] = {}
+        ultra_think_workers = int(os.getenv("ULTRA_THINK_WORKERS", "2"))
+        self._ultra_think_executor = ThreadPoolExecutor(
+            max_workers=ultra_think_workers,
+            thread_name_prefix="ultra_think"
+        )
+        self._ultra_think_slots = threading.BoundedSemaphore(
+            ultra_think_workers + int(os.getenv("ULTRA_THINK_MAX_QUEUE", "4"))
+        )
+        self._ultra_think_lock = threading.Lock()
+        # Longest a streamed UltraThink reply may go without a new piece
+        self.ultra_think_stream_idle = float(os.getenv("ULTRA_THINK_STREAM_IDLE_SECONDS", "30"))
+        self.ultra_think_stats = {"admitted": 0, "rejected": 0, "active": 0}
+        # Prompt size is bounded by a token budget; sections are filled in
+        # priority order (lower first) and each has its own cap
+        self.prompt_budget = PromptBudget(int(os.getenv("PROMPT_TOKEN_BUDGET", "3000")))
+        priority_order = os.getenv("PROMPT_SECTION_PRIORITIES", "history,summary,rag,memory").split(",")
+        self.section_priorities = {
+            section: (priority_order.index(section) if section in priority_order else len(priority_order))
+            for section in ("history", "summary", "rag", "memory")
+        }
+        self.section_max_tokens = {
+            "history": int(os.getenv("PROMPT_HISTORY_MAX_TOKENS", "1200")),
+            "summary": int(os.getenv("PROMPT_SUMMARY_MAX_TOKENS", "400")),
+            "rag": int(os.getenv("PROMPT_RAG_MAX_TOKENS", "1000")),
+            "memory": int(os.getenv("PROMPT_MEMORY_MAX_TOKENS", "400"))
+        }
+        # Classification and RAG retrieval are independent, so they run
+        # concurrently and are joined against a per-request deadline
+        self.pregen_deadline = float(os.getenv("PREGEN_DEADLINE_SECONDS", "8"))
+        # Budget shared by every LLM call of one turn, instead of each call
+        # waiting out its own timeout
+        self.turn_deadline = float(os.getenv("TURN_DEADLINE_SECONDS", "15"))
+        self._pregen_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("PREGEN_WORKERS", "8")),
+            thread_name_prefix="pregen"
+        )
+        # Quick-reply options are generated off the critical path: the turn
+        # returns emotion-keyed fallback options and an options_token, and the
+        # LLM options are fetched by token (/api/options/<token>) or pushed as
+        # an "options" event on /api/chat/stream. DEFER_OPTIONS=false
+        # generates them inline instead
+        self.defer_options = os.getenv("DEFER_OPTIONS", "true").lower() == "true"
+        # Deferred results are published to the shared state backend, if
+        # any, so their tokens can be redeemed on every worker
+        shared_state = state if state.shared else None
+        self.options_store = DeferredTaskStore(
+            "options",
+            max_workers=int(os.getenv("OPTIONS_WORKERS", "4")),
+            ttl_seconds=float(os.getenv("OPTIONS_TTL_SECONDS", "300")),
+            state=shared_state
+        )
+        # Crisis turns are answered at once with a templated safety message;
+        # the personalized LLM follow-up is fetched later by token and only
+        # then added to the history, so it never lands inside a later turn
+        self.crisis_ttl = float(os.getenv("CRISIS_TTL_SECONDS", "600"))
+        self.crisis_store = DeferredTaskStore(
+            "crisis",
+            max_workers=int(os.getenv("CRISIS_WORKERS", "4")),
+            ttl_seconds=self.crisis_ttl,
+            state=shared_state
+        )
         
     def initialize_session(self, user_id: int, session_id: int) -> Dict[str, Any]:
         """Initialize a new therapy session with LLM"""
         session_key = f"{user_id}_{session_id}"
-        self.conversation_histories[session_key] = []
+        self.sessions.reset(session_key)
         
         # Generate initial greeting using LLM
         initial_prompt = """You are an empathetic therapeutic AI companion. 
@@ -34,113 +162,567 @@ class LLMTherapyService:
         Ask how they are feeling today and what they would like to talk about.
         Keep it warm, supportive, and professional."""
         
-        greeting = self.llm.generate_response(initial_prompt, max_length=150, temperature=0.8)
+        greeting = self.llm.generate_response(initial_prompt, max_length=150, temperature=0.8, task="reply")
+        self._register_options(session_key, DEFAULT_OPTIONS)
         
         return {
             "response": greeting,
-            "options": ["继续对话", "换个话题", "需要帮助"],
+            "options": list(DEFAULT_OPTIONS),
             "session_id": session_id,
             "user_id": user_id
         }
     
     def process_message(self, user_id: int, session_id: int, message: str, 
-                       input_type: str = "text") -> Dict[str, Any]:
-        """Process user message using LLM and return therapeutic response"""
+                       input_type: str = "text", country: Optional[str] = None,
+                       ultra_think: Optional[bool] = None) -> Dict[str, Any]:
+        """
+        Process user message using LLM and return therapeutic response
+        
+        country (optional) selects the hotlines listed in crisis replies.
+        ultra_think (optional) switches the session into or out of UltraThink
+        mode; when omitted the session keeps its current mode.
+        """
+        with llm_deadline(self.turn_deadline):
+            return self._process_message(user_id, session_id, message, input_type, country, ultra_think)
+    
+    def _process_message(self, user_id: int, session_id: int, message: str,
+                         input_type: str, country: Optional[str] = None,
+                         ultra_think: Optional[bool] = None) -> Dict[str, Any]:
+        """process_message body, run under the turn's shared LLM deadline"""
         try:
             # Validate input parameters
             if not user_id or not session_id or not message:
                 logger.error("Missing required parameters in process_message")
                 return self._get_fallback_response(user_id, session_id)
             
-            session_key = f"{user_id}_{session_id}"
-            
-            # Get or create conversation history
-            if session_key not in self.conversation_histories:
-                self.conversation_histories[session_key] = []
+            if ultra_think is not None:
+                self.set_ultra_think_mode(user_id, session_id, ultra_think)
             
-            conversation_history = self.conversation_histories[session_key]
+            # Local crisis pre-screen, answered before any network call
+            crisis = self._screen_crisis(user_id, session_id, message, country)
+            if crisis is not None:
+                return crisis
             
-            # Add user message to history
-            conversation_history.append({
-                "role": "user",
-                "content": message,
-                "timestamp": datetime.now().isoformat()
-            })
-            
-            # Analyze emotion and intention with error handling
-            try:
-                emotion = self.llm.analyze_emotion(message)
-                intention = self.llm.analyze_intention(message)
-            except Exception as e:
-                logger.warning(f"Emotion/intention analysis failed: {e}")
-                emotion = "neutral"
-                intention = "not_s"
+            turn = self._begin_turn(user_id, session_id, message)
+            timings = turn["timings"]
             
             # Handle critical situations
-            if intention == "s":
-                response = self._handle_crisis_situation(message, user_id)
-                options = ["紧急求助", "继续对话", "我需要帮助"]
+            if turn["intention"] == "s":
+                return self._finish_crisis_turn(turn, country)
             else:
                 # Generate therapeutic response using LLM
                 try:
-                    enhanced_prompt = self._create_therapeutic_prompt(
-                        message, emotion, conversation_history, user_id
-                    )
-                    
-                    response = self.llm.generate_response(
-                        enhanced_prompt, 
-                        max_length=300, 
-                        temperature=0.7
-                    )
-                    
-                    # Validate response
-                    if not response or not response.strip():
-                        response = "我在这里为您提供支持。请告诉我更多关于您的感受。"
-                    
+                    stage_start = time.perf_counter()
+                    response = self._generate_reply(turn)
+                    timings["generation"] = self._elapsed_ms(stage_start)
                 except Exception as e:
                     logger.error(f"Response generation failed: {e}")
-                    response = "我在这里为您提供支持。请告诉我更多关于您的感受。"
+                    response = None
                 
                 # Generate context-aware options
-                try:
-                    options = self._generate_response_options(response, emotion)
-                except Exception as e:
-                    logger.warning(f"Options generation failed: {e}")
-                    options = ["继续对话", "换个话题", "需要帮助"]
+                options, options_token = self._turn_options(turn, response or FALLBACK_REPLY)
             
-            # Add assistant response to history
-            conversation_history.append({
-                "role": "assistant", 
-                "content": response,
-                "timestamp": datetime.now().isoformat()
-            })
+            return self._finish_turn(turn, response, options, options_token)
             
-            # Keep only last 10 messages to manage context length
-            if len(conversation_history) > 10:
-                self.conversation_histories[session_key] = conversation_history[-10:]
+        except Exception as e:
+            logger.error(f"Error processing message: {e}")
+            return self._get_fallback_response(user_id, session_id)
+    
+    def process_message_stream(self, user_id: int, session_id: int, message: str,
+                               input_type: str = "text",
+                               country: Optional[str] = None,
+                               ultra_think: Optional[bool] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Streaming variant of process_message.
+        
+        Yields {"event": "token", "data": {"delta": ...}} for every piece of
+        the reply as it arrives from the LLM, then a single
+        {"event": "done", "data": {...}} carrying the same fields that
+        process_message returns (options, emotion, ...).
+        """
+        if not user_id or not session_id or not message:
+            logger.error("Missing required parameters in process_message_stream")
+            fallback = self._get_fallback_response(user_id, session_id)
+            yield {"event": "token", "data": {"delta": fallback["response"]}}
+            yield {"event": "done", "data": fallback}
+            return
+        
+        if ultra_think is not None:
+            self.set_ultra_think_mode(user_id, session_id, ultra_think)
+        
+        # The shared deadline covers the blocking stages; the token stream
+        # itself is bounded by the per-read timeout
+        try:
+            crisis = self._screen_crisis(user_id, session_id, message, country)
+            if crisis is None:
+                with llm_deadline(self.turn_deadline):
+                    turn = self._begin_turn(user_id, session_id, message)
+                if turn["intention"] == "s":
+                    crisis = self._finish_crisis_turn(turn, country)
+        except Exception as e:
+            logger.error(f"Error processing message: {e}")
+            fallback = self._get_fallback_response(user_id, session_id)
+            yield {"event": "token", "data": {"delta": fallback["response"]}}
+            yield {"event": "done", "data": fallback}
+            return
+        
+        if crisis is not None:
+            yield {"event": "token", "data": {"delta": crisis["response"]}}
+            yield {"event": "done", "data": crisis}
+            return
+        
+        timings = turn["timings"]
+        
+        chunks = []
+        stage_start = time.perf_counter()
+        try:
+            for delta in self._stream_reply(turn):
+                if "first_token" not in timings:
+                    timings["first_token"] = self._elapsed_ms(stage_start)
+                chunks.append(delta)
+                yield {"event": "token", "data": {"delta": delta}}
+        except Exception as e:
+            logger.error(f"Streaming response generation failed: {e}")
+        timings["generation"] = self._elapsed_ms(stage_start)
+        
+        response = "".join(chunks)
+        if not response.strip():
+            response = FALLBACK_REPLY
+            yield {"event": "token", "data": {"delta": response}}
+        
+        with llm_deadline(self.turn_deadline):
+            options, options_token = self._turn_options(turn, response)
+        
+        yield {"event": "done", "data": self._finish_turn(turn, response, options, options_token)}
+    
+    def _turn_options(self, turn: Dict[str, Any], response: str) -> Tuple[List[str], Optional[str]]:
+        """
+        Quick-reply options for a turn's reply. With deferral, the
+        emotion-keyed fallback and a token for the LLM options generated in
+        the background; otherwise the LLM options and no token.
+        """
+        if self.defer_options:
+            options = self.get_fallback_options(turn["emotion"])
+            options_token = self.options_store.submit(
+                self._generate_and_register_options,
+                turn["session_key"], response, turn["emotion"],
+                fallback=options
+            )
+            return options, options_token
+        
+        stage_start = time.perf_counter()
+        try:
+            options = self._generate_response_options(response, turn["emotion"])
+        except Exception as e:
+            logger.warning(f"Options generation failed: {e}")
+            options = list(DEFAULT_OPTIONS)
+        turn["timings"]["options"] = self._elapsed_ms(stage_start)
+        return options, None
+    
+    def _begin_turn(self, user_id: int, session_id: int, message: str) -> Dict[str, Any]:
+        """Record the user message and run the pre-generation stage for a turn"""
+        session_key = f"{user_id}_{session_id}"
+        
+        # Add user message to history (rehydrating an evicted session)
+        user_message = self.sessions.append(session_key, "user", message)
+        conversation_history = self.sessions.history(session_key)
+        
+        # Older turns are represented by the rolling summary; trimmed
+        # messages not folded into it yet are kept in front of the history
+        summary, unfolded = self.summarizer.get(session_key) if self.summarizer else ("", [])
+        
+        # A tapped quick-reply button carries no new emotional content, so
+        # the session's last classification is reused instead of the LLM
+        known_classification = self._classification_for_issued_option(session_key, message)
+        
+        # Classify the message and retrieve RAG context concurrently
+        classification, rag_context, timings = self._run_pregeneration(
+            message, user_id, classification=known_classification
+        )
+        self.last_classifications[session_key] = classification
+        
+        return {
+            "user_id": user_id,
+            "session_id": session_id,
+            "session_key": session_key,
+            "message": message,
+            "user_message": user_message,
+            "history": unfolded + conversation_history,
+            "summary": summary,
+            "emotion": classification["emotion"],
+            "intention": classification["intention"],
+            "rag_context": rag_context,
+            "ultra_think": self.is_ultra_think_mode(user_id, session_id),
+            "timings": timings
+        }
+    
+    def _build_turn_prompt(self, turn: Dict[str, Any]) -> str:
+        """Build the therapeutic prompt for a turn started by _begin_turn"""
+        therapeutic_context = self._resolve_therapeutic_context(turn["rag_context"], turn["emotion"])
+        prompt, report = self._assemble_therapeutic_prompt(
+            turn["message"], turn["emotion"], turn["history"], turn["user_id"],
+            therapeutic_context=therapeutic_context, session_summary=turn["summary"],
+            ultra_think=turn.get("ultra_think", False)
+        )
+        turn["prompt_tokens"] = report["prompt_tokens"]
+        logger.info(f"Prompt tokens for session {turn['session_key']}: {report}")
+        return prompt
+    
+    def _generate_reply_now(self, turn: Dict[str, Any]) -> str:
+        """Build the turn's prompt and generate the reply on the calling thread"""
+        return self.llm.generate_response(
+            self._build_turn_prompt(turn),
+            max_length=300,
+            temperature=0.7,
+            task=self._reply_task(turn)
+        )
+    
+    def _generate_reply(self, turn: Dict[str, Any]) -> Optional[str]:
+        """
+        The therapeutic reply of a turn. UltraThink replies are generated on
+        the UltraThink pool and waited for within the turn deadline.
+        """
+        if turn.get("ultra_think"):
+            future = self._submit_ultra_think(self._generate_reply_now, turn)
+            if future is not None:
+                try:
+                    return future.result(timeout=deadline_remaining())
+                except FutureTimeoutError:
+                    logger.warning(f"UltraThink reply timed out for session {turn['session_key']}")
+                    return None
+            turn["ultra_think"] = False
+        return self._generate_reply_now(turn)
+    
+    def _stream_reply(self, turn: Dict[str, Any]) -> Iterator[str]:
+        """
+        Pieces of the turn's therapeutic reply as they arrive. UltraThink
+        replies are streamed from the UltraThink pool through a queue.
+        """
+        def stream() -> Iterator[str]:
+            return self.llm.generate_response_stream(
+                self._build_turn_prompt(turn),
+                max_length=300,
+                temperature=0.7,
+                task=self._reply_task(turn)
+            )
+        
+        if turn.get("ultra_think"):
+            pieces: queue.Queue = queue.Queue()
             
-            # Ensure we always have valid options
-            if not options or len(options) == 0:
-                options = ["继续对话", "换个话题", "需要帮助"]
+            def produce() -> None:
+                try:
+                    for delta in stream():
+                        pieces.put(delta)
+                finally:
+                    pieces.put(None)
             
-            return {
-                "response": response,
-                "options": options,
-                "emotion": emotion,
-                "requires_followup": self._requires_followup(response, emotion),
-                "session_id": session_id,
-                "user_id": user_id
-            }
+            future = self._submit_ultra_think(produce)
+            if future is not None:
+                while True:
+                    try:
+                        delta = pieces.get(timeout=self.ultra_think_stream_idle)
+                    except queue.Empty:
+                        logger.warning(f"UltraThink stream stalled for session {turn['session_key']}")
+                        return
+                    if delta is None:
+                        return
+                    yield delta
+            turn["ultra_think"] = False
+        yield from stream()
+    
+    def _submit_ultra_think(self, func, *args) -> Optional[Future]:
+        """
+        Run func on the UltraThink pool, in the caller's context (turn
+        deadline, trace). Returns None when the pool and its queue are full.
+        """
+        if not self._ultra_think_slots.acquire(blocking=False):
+            with self._ultra_think_lock:
+                self.ultra_think_stats["rejected"] += 1
+            logger.warning("UltraThink pool full, answering with a standard reply")
+            return None
+        
+        def run(*run_args):
+            with self._ultra_think_lock:
+                self.ultra_think_stats["active"] += 1
+            try:
+                return func(*run_args)
+            finally:
+                with self._ultra_think_lock:
+                    self.ultra_think_stats["active"] -= 1
+        
+        try:
+            future = self._ultra_think_executor.submit(contextvars.copy_context().run, run, *args)
+        except Exception:
+            self._ultra_think_slots.release()
+            raise
+        with self._ultra_think_lock:
+            self.ultra_think_stats["admitted"] += 1
+        future.add_done_callback(lambda _: self._ultra_think_slots.release())
+        return future
+    
+    def _finish_turn(self, turn: Dict[str, Any], response: Optional[str],
+                     options: Optional[List[str]],
+                     options_token: Optional[str] = None) -> Dict[str, Any]:
+        """Record the assistant reply and assemble the result of a turn"""
+        # Validate response
+        if not response or not response.strip():
+            response = FALLBACK_REPLY
+        
+        # Add assistant response to history; the store keeps the most
+        # recent messages only
+        reply = self.sessions.append(turn["session_key"], "assistant", response)
+        
+        # Queue both messages for the database; the writer commits in batches
+        user_message = turn["user_message"]
+        message_store.append(turn["user_id"], turn["session_id"], "user", user_message.content,
+                             emotion=turn["emotion"], timestamp=user_message.timestamp)
+        message_store.append(turn["user_id"], turn["session_id"], "assistant", reply.content,
+                             timestamp=reply.timestamp)
+        
+        # Ensure we always have valid options
+        if not options or len(options) == 0:
+            options = list(DEFAULT_OPTIONS)
+        self._register_options(turn["session_key"], options)
+        
+        timings = turn["timings"]
+        logger.info(f"Stage timings (ms) for session {turn['session_key']}: {timings}")
+        for stage, elapsed_ms in timings.items():
+            metrics.record_stage(stage, elapsed_ms / 1000)
+        
+        result = {
+            "response": response,
+            "options": options,
+            "emotion": turn["emotion"],
+            "requires_followup": self._requires_followup(response, turn["emotion"]),
+            "ultra_think": bool(turn.get("ultra_think")),
+            "session_id": turn["session_id"],
+            "user_id": turn["user_id"],
+            "timings": timings
+        }
+        if "prompt_tokens" in turn:
+            result["prompt_tokens"] = turn["prompt_tokens"]
+        if options_token:
+            result["options_token"] = options_token
+        return result
+    
+    def _screen_crisis(self, user_id: int, session_id: int, message: str,
+                       country: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Local crisis pre-screen. A keyword hit completes the turn with the
+        templated safety reply, without classification, RAG or any LLM call.
+        
+        Returns:
+            The turn result for a crisis message, None otherwise
+        """
+        stage_start = time.perf_counter()
+        hits = crisis_screen.match(message)
+        if not hits:
+            return None
+        
+        session_key = f"{user_id}_{session_id}"
+        user_message = self.sessions.append(session_key, "user", message)
+        # Keyword emotion only; the crisis itself is already established
+        classification = dict(self.llm.fallback_classify(message), intention="s")
+        self.last_classifications[session_key] = classification
+        logger.info(f"Crisis pre-screen hits for session {session_key}: {hits}")
+        
+        turn = {
+            "user_id": user_id,
+            "session_id": session_id,
+            "session_key": session_key,
+            "message": message,
+            "user_message": user_message,
+            "emotion": classification["emotion"],
+            "intention": "s",
+            "timings": {"crisis_screen": self._elapsed_ms(stage_start)}
+        }
+        return self._finish_crisis_turn(turn, country)
+    
+    def _finish_crisis_turn(self, turn: Dict[str, Any], country: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Answer a crisis turn with the safety message for the user's locale
+        and country at once; the personalized LLM follow-up is generated in
+        the background and fetched by followup_token
+        """
+        stage_start = time.perf_counter()
+        logger.critical(f"CRISIS ALERT - User {turn['user_id']}: {turn['message']}")
+        response = crisis_screen.safety_reply(turn["message"], country)
+        followup_token = self.crisis_store.submit(
+            self._crisis_followup,
+            turn["user_id"], turn["session_id"], turn["message"]
+        )
+        turn["timings"]["crisis"] = self._elapsed_ms(stage_start)
+        
+        result = self._finish_turn(turn, response, list(CRISIS_OPTIONS))
+        result["followup_token"] = followup_token
+        return result
+    
+    def _crisis_followup(self, user_id: int, session_id: int,
+                         message: str) -> Optional[Dict[str, Any]]:
+        """Personalized crisis response, None if the LLM was unavailable"""
+        with llm_deadline(self.turn_deadline):
+            response = self._handle_crisis_situation(message, user_id)
+        if not response or response.strip() in FALLBACK_RESPONSES:
+            return None
+        return {"user_id": user_id, "session_id": session_id, "response": response}
+    
+    def get_crisis_followup(self, followup_token: str, wait: float = 0) -> Optional[Dict[str, Any]]:
+        """
+        Fetch the personalized follow-up to a crisis reply. The first fetch
+        of a ready follow-up adds it to the session history, at the point the
+        user sees it.
+        
+        Returns:
+            {"ready": bool, "response": str or None} or None for unknown/expired
+            tokens. response stays None if the LLM was unavailable.
+        """
+        deferred = self.crisis_store.get(followup_token, wait=wait)
+        if deferred is None:
+            return None
+        followup = deferred["result"]
+        if not followup:
+            return {"ready": deferred["ready"], "response": None}
+        
+        # Only the first fetch, on whichever worker, records the reply
+        if self.state.put(f"crisis_followup_delivered:{followup_token}", True,
+                          expected_version=0, ttl=self.crisis_ttl) is not None:
+            user_id, session_id = followup["user_id"], followup["session_id"]
+            reply = self.sessions.append(f"{user_id}_{session_id}", "assistant", followup["response"])
+            message_store.append(user_id, session_id, "assistant", reply.content, timestamp=reply.timestamp)
+        return {"ready": True, "response": followup["response"]}
+    
+    def _register_options(self, session_key: str, options: List[str]) -> None:
+        """Remember quick-reply options issued to a session (most recent kept)"""
+        issued = self.issued_options.setdefault(session_key, {})
+        for option in options:
+            if isinstance(option, str) and option.strip():
+                issued.pop(option.strip(), None)
+                issued[option.strip()] = None
+        while len(issued) > self.max_issued_options:
+            del issued[next(iter(issued))]
+    
+    def _classification_for_issued_option(self, session_key: str,
+                                          message: str) -> Optional[Dict[str, Any]]:
+        """
+        Classification to reuse when the message exactly matches an option
+        this session was offered, or None if it has to be classified (always
+        after a crisis turn)
+        """
+        if message.strip() not in self.issued_options.get(session_key, {}):
+            return None
+        
+        last = self.last_classifications.get(session_key)
+        if last is not None:
+            # A crisis result is never reused: taps on the crisis options
+            # are classified afresh, so they can lead out of the crisis reply
+            if last.get("intention") == "s":
+                return None
+            return dict(last)
+        # Options offered before any classification (the greeting's) are
+        # static, known-safe strings
+        return {"emotion": "neutral", "intention": "not_s", "confidence": 0.0}
+    
+    def _generate_and_register_options(self, session_key: str, response: str,
+                                       emotion: str) -> List[str]:
+        """Generate options in the background and register them once known"""
+        options = self._generate_response_options(response, emotion)
+        self._register_options(session_key, options)
+        return options
+    
+    def _run_pregeneration(self, message: str, user_id: int,
+                           classification: Optional[Dict[str, Any]] = None
+                           ) -> Tuple[Dict[str, Any], Optional[str], Dict[str, float]]:
+        """
+        Run the pre-generation stage: fused emotion/intention classification
+        and RAG retrieval fan out on the thread pool and are joined against
+        the per-request deadline. Stages that miss the deadline fall back to
+        the local classifier (or keywords) and the emotion-keyed context. A
+        known classification (quick-reply fast path) or a local crisis hit
+        skips the LLM call entirely. A confident local prediction replaces the
+        emotion only: the intention still comes from the LLM unless a trained
+        crisis model is loaded, as keywords alone miss indirect crisis talk.
+        
+        Returns:
+            (classification, rag_context, per-stage timings in milliseconds)
+        """
+        timings: Dict[str, float] = {}
+        stage_start = time.perf_counter()
+        
+        def timed(stage, func, *args):
+            start = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                timings[stage] = self._elapsed_ms(start)
+        
+        # Each task runs in a copy of the caller's context so the turn's
+        # shared LLM deadline applies inside the pool threads
+        rag_future = self._pregen_executor.submit(
+            contextvars.copy_context().run,
+            timed, "rag", self._retrieve_rag_context, message, user_id
+        )
+        local = None
+        local_emotion = False
+        if classification is None:
+            local = timed("local_classification", self._local_classify, message)
+            if local is not None:
+                local_emotion = local["confidence"] >= self.local_confidence
+                if local["intention"] == "s" or (local_emotion and self.local_classifier.has_crisis_model):
+                    classification = local
+        
+        if classification is not None:
+            timings["classification"] = 0.0
+            wait([rag_future], timeout=self.pregen_deadline)
+        else:
+            classify_future = self._pregen_executor.submit(
+                contextvars.copy_context().run,
+                timed, "classification", self.llm.classify, message
+            )
+            wait([classify_future, rag_future], timeout=self.pregen_deadline)
             
+            try:
+                if not classify_future.done():
+                    raise TimeoutError("classification missed the pre-generation deadline")
+                classification = classify_future.result()
+                if local_emotion:
+                    classification = dict(local, intention=classification["intention"])
+            except Exception as e:
+                logger.warning(f"Emotion/intention analysis failed: {e}")
+                classify_future.cancel()
+                classification = local or self.llm.fallback_classify(message)
+        
+        rag_context = None
+        try:
+            if not rag_future.done():
+                raise TimeoutError("RAG retrieval missed the pre-generation deadline")
+            rag_context = rag_future.result()
         except Exception as e:
-            logger.error(f"Error processing message: {e}")
-            return self._get_fallback_response(user_id, session_id)
+            logger.warning(f"RAG context unavailable: {e}")
+            rag_future.cancel()
+        
+        # Copy so a straggling stage cannot mutate the returned timings
+        timings = dict(timings)
+        timings["pregeneration"] = self._elapsed_ms(stage_start)
+        return classification, rag_context, timings
+    
+    def _local_classify(self, message: str) -> Optional[Dict[str, Any]]:
+        """Local model classification, or None if no model is available"""
+        try:
+            return self.local_classifier.predict(message)
+        except Exception as e:
+            logger.warning(f"Local classification failed: {e}")
+            return None
+    
+    @staticmethod
+    def _elapsed_ms(start: float) -> float:
+        """Milliseconds elapsed since a time.perf_counter() reading"""
+        return round((time.perf_counter() - start) * 1000, 2)
     
     def _get_fallback_response(self, user_id: int, session_id: int) -> Dict[str, Any]:
         """Get fallback response when processing fails"""
         return {
-            "response": "我在这里为您提供支持。请告诉我更多关于您的感受。",
-            "options": ["继续对话", "换个话题", "需要帮助"],
+            "response": FALLBACK_REPLY,
+            "options": list(DEFAULT_OPTIONS),
             "emotion": "neutral",
             "requires_followup": False,
             "session_id": session_id,
@@ -148,25 +730,79 @@ class LLMTherapyService:
         }
     
     def _create_therapeutic_prompt(self, message: str, emotion: str, 
-                                 conversation_history: List[Dict], user_id: int) -> str:
+                                 conversation_history: List[ChatMessage], user_id: int,
+                                 therapeutic_context: Optional[str] = None,
+                                 session_summary: str = "", ultra_think: bool = False) -> str:
         """Create enhanced prompt for therapeutic response generation"""
+        prompt, _ = self._assemble_therapeutic_prompt(
+            message, emotion, conversation_history, user_id, therapeutic_context, session_summary,
+            ultra_think
+        )
+        return prompt
+    
+    def _assemble_therapeutic_prompt(self, message: str, emotion: str,
+                                     conversation_history: List[ChatMessage], user_id: int,
+                                     therapeutic_context: Optional[str] = None,
+                                     session_summary: str = "", ultra_think: bool = False
+                                     ) -> Tuple[str, Dict[str, Any]]:
+        """
+        Build the therapeutic prompt within the token budget: history, session
+        summary, RAG and memory sections are filled in priority order and
+        trimmed to fit.
         
-        # Build conversation context
-        history_context = ""
-        if conversation_history:
-            # Use last 3 exchanges for context
-            recent_history = conversation_history[-6:]  # Last 3 user-assistant pairs
-            for msg in recent_history:
-                role = "User" if msg["role"] == "user" else "Assistant"
-                history_context += f"{role}: {msg['content']}\n"
+        Returns:
+            (prompt, token report from PromptBudget.assemble)
+        """
+        # Get therapeutic context from RAG if it was not retrieved up front
+        if therapeutic_context is None:
+            therapeutic_context = self._get_therapeutic_context(message, emotion, user_id)
         
-        # Get therapeutic context from RAG if available
-        therapeutic_context = self._get_therapeutic_context(message, emotion, user_id)
+        history_units = [
+            f"{'User' if msg.role == 'user' else 'Assistant'}: {msg.content}"
+            for msg in conversation_history
+        ]
+        sections = [
+            PromptSection("history_context", history_units, self.section_priorities["history"],
+                          max_tokens=self.section_max_tokens["history"], keep="newest"),
+            PromptSection("summary_context", [session_summary] if session_summary else [],
+                          self.section_priorities["summary"],
+                          max_tokens=self.section_max_tokens["summary"]),
+            PromptSection("therapeutic_context", [therapeutic_context], self.section_priorities["rag"],
+                          max_tokens=self.section_max_tokens["rag"]),
+            PromptSection("memory_context", self._retrieve_memory_context(message, user_id),
+                          self.section_priorities["memory"],
+                          max_tokens=self.section_max_tokens["memory"])
+        ]
         
-        # Check if this is an UltraThink deep thinking session
-        is_ultra_think = hasattr(self, '_ultra_think_mode') and self._ultra_think_mode
+        def render(history_context: str, summary_context: str, therapeutic_context: str,
+                   memory_context: str) -> str:
+            return self._render_therapeutic_prompt(
+                message, emotion, user_id, len(conversation_history),
+                history_context, therapeutic_context, memory_context, summary_context,
+                ultra_think
+            )
         
-        if is_ultra_think:
+        return self.prompt_budget.assemble(render, sections)
+    
+    def _retrieve_memory_context(self, message: str, user_id: int) -> List[str]:
+        """Relevant notes from the user's past sessions, most relevant first"""
+        try:
+            memories = memory_manager.retrieve_relevant_memories(str(user_id), message, top_k=3)
+        except Exception as e:
+            logger.warning(f"Memory retrieval failed: {e}")
+            return []
+        return [item["memory"].get("content", "") for item in memories if item.get("memory")]
+    
+    def _render_therapeutic_prompt(self, message: str, emotion: str, user_id: int,
+                                   conversation_depth: int, history_context: str,
+                                   therapeutic_context: str, memory_context: str,
+                                   summary_context: str = "", ultra_think: bool = False) -> str:
+        """Fill the therapeutic prompt template (standard or UltraThink)"""
+        memory_block = f"\nPAST SESSION NOTES:\n{memory_context}\n" if memory_context else ""
+        summary_block = f"[Summary of earlier turns] {summary_context}\n" if summary_context else ""
+        
+        # UltraThink deep thinking sessions get the extended prompt
+        if ultra_think:
             # UltraThink Deep Thinking Mode Prompt
             prompt = f"""You are an advanced therapeutic AI companion operating in UltraThink Deep Thinking mode.
 
@@ -183,11 +819,11 @@ SESSION CONTEXT:
 - User Emotion: {emotion}
 - Session Type: UltraThink Deep Thinking
 - User ID: {user_id}
-- Conversation Depth: {len(conversation_history)} exchanges
+- Conversation Depth: {conversation_depth} exchanges
 
 CONVERSATION HISTORY:
-{history_context}
-
+{summary_block}{history_context}
+{memory_block}
 THERAPEUTIC KNOWLEDGE BASE:
 {therapeutic_context}
 
@@ -254,8 +890,8 @@ Response:"""
             - Session context: Therapeutic conversation
             
             CONVERSATION HISTORY:
-            {history_context}
-            
+            {summary_block}{history_context}
+            {memory_block}
             THERAPEUTIC CONTEXT:
             {therapeutic_context}
             
@@ -277,24 +913,35 @@ Response:"""
     def _get_therapeutic_context(self, message: str, emotion: str, user_id: int) -> str:
         """Get relevant therapeutic knowledge from RAG system"""
         try:
-            from backend.models.rag_system import rag_system
-            context = rag_system.enhance_prompt_with_context(message, user_id)
-            if context and context.strip():
-                logger.info(f"RAG context retrieved: {context[:100]}...")
-                return context
-            else:
-                # Fallback therapeutic knowledge based on emotion
-                emotion_contexts = {
-                    "anxious": "对于焦虑情绪，建议使用深呼吸练习、正念冥想和渐进式肌肉放松技术。",
-                    "sad": "对于悲伤情绪，建议进行情绪日记记录、与他人倾诉和进行轻度体育活动。",
-                    "angry": "对于愤怒情绪，建议使用冷静技巧、转移注意力和建设性表达方式。",
-                    "happy": "对于快乐情绪，建议享受当下、表达感激和与他人分享喜悦。"
-                }
-                return emotion_contexts.get(emotion, "我在这里为您提供情感支持和专业指导。")
+            context = self._retrieve_rag_context(message, user_id)
         except Exception as e:
             logger.warning(f"RAG context unavailable: {e}")
             # Provide basic therapeutic context
             return "基于认知行为疗法和正念原则的心理健康支持。"
+        return self._resolve_therapeutic_context(context, emotion)
+    
+    def _retrieve_rag_context(self, message: str, user_id: int) -> Optional[str]:
+        """Retrieve RAG context for a message; independent of the detected emotion"""
+        from backend.models.rag_system import rag_system
+        context = rag_system.enhance_prompt_with_context(message, user_id)
+        if context and context.strip():
+            logger.info(f"RAG context retrieved: {context[:100]}...")
+            return context
+        return None
+    
+    def _resolve_therapeutic_context(self, rag_context: Optional[str], emotion: str) -> str:
+        """Use the RAG context if any, otherwise emotion-based therapeutic knowledge"""
+        if rag_context:
+            return rag_context
+        
+        # Fallback therapeutic knowledge based on emotion
+        emotion_contexts = {
+            "anxious": "对于焦虑情绪，建议使用深呼吸练习、正念冥想和渐进式肌肉放松技术。",
+            "sad": "对于悲伤情绪，建议进行情绪日记记录、与他人倾诉和进行轻度体育活动。",
+            "angry": "对于愤怒情绪，建议使用冷静技巧、转移注意力和建设性表达方式。",
+            "happy": "对于快乐情绪，建议享受当下、表达感激和与他人分享喜悦。"
+        }
+        return emotion_contexts.get(emotion, "我在这里为您提供情感支持和专业指导。")
     
     def _generate_response_options(self, response: str, emotion: str) -> List[str]:
         """Generate context-aware response options using LLM"""
@@ -322,7 +969,7 @@ Response:"""
         ["option1", "option2", "option3", "option4"]"""
         
         try:
-            options_text = self.llm.generate_response(prompt, max_length=150, temperature=0.3)
+            options_text = self.llm.generate_response(prompt, max_length=150, temperature=0.3, task="options")
             # Clean and parse the response
             options_text = options_text.strip()
             
@@ -354,21 +1001,33 @@ Response:"""
             logger.warning(f"Failed to generate options with LLM: {e}")
         
         # Enhanced fallback options based on emotion
-        fallback_options = {
-            "happy": ["继续分享", "讨论其他话题", "寻求建议", "结束对话"],
-            "sad": ["需要安慰", "讨论原因", "寻求帮助", "换个话题"],
-            "anxious": ["需要安抚", "讨论焦虑源", "放松技巧", "专业帮助"],
-            "angry": ["表达感受", "讨论原因", "冷静方法", "寻求支持"],
-            "neutral": ["继续对话", "换个话题", "寻求指导", "结束会话"]
-        }
+        return self.get_fallback_options(emotion)
+    
+    def get_fallback_options(self, emotion: str) -> List[str]:
+        """Emotion-keyed quick-reply options that need no LLM call"""
+        return list(FALLBACK_OPTIONS.get(emotion, FALLBACK_OPTIONS["neutral"]))
+    
+    def get_deferred_options(self, options_token: str, wait: float = 0) -> Optional[Dict[str, Any]]:
+        """
+        Fetch quick-reply options computed in the background for a turn
         
-        return fallback_options.get(emotion, fallback_options["neutral"])
+        Args:
+            options_token: Token returned with the turn's response
+            wait: Seconds to wait for options that are still being generated
+            
+        Returns:
+            {"ready": bool, "options": [...]} or None for unknown/expired tokens.
+            Until the LLM options are ready the emotion-keyed fallback is served.
+        """
+        deferred = self.options_store.get(options_token, wait=wait)
+        if deferred is None:
+            return None
+        return {"ready": deferred["ready"], "options": deferred["result"]}
     
     def _requires_followup(self, response: str, emotion: str) -> bool:
         """Determine if this response requires immediate follow-up"""
-        # Check for crisis indicators in response
-        crisis_keywords = ["紧急", "求助", "危机", "危险", "自杀", "自伤"]
-        if any(keyword in response for keyword in crisis_keywords):
+        # Check for crisis indicators in response (lexicons/followup.json)
+        if get_matcher("followup").contains(response):
             return True
         
         # Emotions that might require follow-up
@@ -384,10 +1043,12 @@ Response:"""
         Provide immediate emotional support, validate their feelings, 
         and offer crisis resources. Be calm, empathetic, and direct.
         
+        They have already been shown crisis hotline numbers, so do not list them again.
+        
         Include these elements:
         1. Immediate emotional validation
         2. Concern for their safety  
-        3. Crisis hotline information
+        3. A reminder that the hotlines they were given are there for them right now
         4. Encouragement to seek professional help
         5. Offer to continue supporting them
         
@@ -396,45 +1057,136 @@ Response:"""
         crisis_response = self.llm.generate_response(
             crisis_prompt, 
             max_length=400, 
-            temperature=0.3
+            temperature=0.3,
+            task="crisis"
         )
         
-        # Log crisis situation
-        logger.critical(f"CRISIS ALERT - User {user_id}: {message}")
-        
         return crisis_response
     
     def get_conversation_history(self, user_id: int, session_id: int) -> List[Dict]:
         """Get conversation history for a session"""
         session_key = f"{user_id}_{session_id}"
-        return self.conversation_histories.get(session_key, [])
+        return [msg.to_dict() for msg in self.sessions.history(session_key)]
     
     def clear_session(self, user_id: int, session_id: int):
         """Clear conversation history for a session"""
         session_key = f"{user_id}_{session_id}"
-        if session_key in self.conversation_histories:
-            del self.conversation_histories[session_key]
+        self.sessions.pop(session_key)
+        if self.summarizer:
+            self.summarizer.forget(session_key)
+        self._forget_session_state(session_key)
+    
+    @staticmethod
+    def _session_ids(session_key: str) -> Optional[Tuple[int, int]]:
+        """(user_id, session_id) of a session key, None if not numeric"""
+        try:
+            user_id, session_id = (int(part) for part in session_key.split("_", 1))
+        except ValueError:
+            return None
+        return user_id, session_id
+    
+    def _load_session_history(self, session_key: str) -> Optional[List[ChatMessage]]:
+        """Recent messages of an evicted or unknown session from the message table"""
+        ids = self._session_ids(session_key)
+        if ids is None:
+            return None
+        rows = message_store.recent(*ids, limit=self.sessions.max_messages)
+        return [ChatMessage(row["role"], row["content"], to_timestamp(row["created_at"])) for row in rows]
+    
+    def _load_session_summary(self, session_key: str) -> Optional[str]:
+        """Latest stored rolling summary of a session"""
+        ids = self._session_ids(session_key)
+        if ids is None:
+            return None
+        rows = message_store.recent(*ids, limit=1, roles=("summary",))
+        return rows[-1]["content"] if rows else None
+    
+    def _save_session_summary(self, session_key: str, summary: str) -> None:
+        """Store a new rolling summary with the session's messages"""
+        ids = self._session_ids(session_key)
+        if ids is not None:
+            message_store.append(*ids, "summary", summary)
+    
+    def _fold_session_summary(self, summary: str, messages: List[ChatMessage]) -> str:
+        """Update a session summary with messages that left the history window"""
+        conversation_text = "\n".join(
+            f"{'User' if msg.role == 'user' else 'Assistant'}: {msg.content}" for msg in messages
+        )
+        previous = summary or "(none yet)"
+        prompt = f"""You maintain a running summary of a therapeutic conversation.
+        
+        SUMMARY SO FAR:
+        {previous}
+        
+        NEW MESSAGES:
+        {conversation_text}
+        
+        Rewrite the summary so it also covers the new messages. Keep the user's
+        main concerns, emotional patterns, important facts and anything agreed on.
+        Write in Chinese, at most 200 characters, no preamble.
+        
+        Summary:"""
+        
+        updated = self.llm.generate_response(prompt, max_length=300, temperature=0.2, task="summary")
+        if not updated or updated.strip() in FALLBACK_RESPONSES:
+            raise RuntimeError("LLM unavailable for summarization")
+        return updated
+    
+    def _forget_session_state(self, session_key: str) -> None:
+        """Drop per-session state kept next to the history"""
+        self.issued_options.pop(session_key, None)
+        self.last_classifications.pop(session_key, None)
+        self.ultra_think_sessions.pop(session_key, None)
+    
+    def get_session_stats(self) -> Dict[str, Any]:
+        """Session store size, memory and eviction counters, and summary folds"""
+        stats = self.sessions.get_stats()
+        if self.summarizer:
+            stats.update({f"summary_{name}": value for name, value in self.summarizer.get_stats().items()})
+        with self._ultra_think_lock:
+            stats.update({f"ultra_think_{name}": value for name, value in self.ultra_think_stats.items()})
+        stats["ultra_think_sessions"] = len(self.ultra_think_sessions)
+        return stats
+    
+    def set_ultra_think_mode(self, user_id: int, session_id: int, enabled: bool = True):
+        """Enable or disable UltraThink deep thinking mode for one session"""
+        session_key = f"{user_id}_{session_id}"
+        if bool(enabled) == self.ultra_think_sessions.get(session_key, False):
+            return
+        if enabled:
+            self.ultra_think_sessions[session_key] = True
+        else:
+            self.ultra_think_sessions.pop(session_key, None)
+        logger.info(f"UltraThink mode {'enabled' if enabled else 'disabled'} for session {session_key}")
     
-    def set_ultra_think_mode(self, enabled: bool = True):
-        """Enable or disable UltraThink deep thinking mode"""
-        self._ultra_think_mode = enabled
-        logger.info(f"UltraThink mode {'enabled' if enabled else 'disabled'}")
+    def is_ultra_think_mode(self, user_id: int, session_id: int) -> bool:
+        """Check if UltraThink mode is enabled for a session"""
+        return self.ultra_think_sessions.get(f"{user_id}_{session_id}", False)
     
-    def is_ultra_think_mode(self) -> bool:
-        """Check if UltraThink mode is currently enabled"""
-        return self._ultra_think_mode
+    @staticmethod
+    def _reply_task(turn: Dict[str, Any]) -> str:
+        """Model route of the therapeutic reply (UltraThink replies have their own)"""
+        return "ultra_think" if turn.get("ultra_think") else "reply"
     
     def summarize_session(self, user_id: int, session_id: int) -> str:
         """Generate session summary using LLM"""
+        session_key = f"{user_id}_{session_id}"
         conversation = self.get_conversation_history(user_id, session_id)
         
-        if not conversation:
+        # Older turns are already condensed in the rolling summary, so the
+        # prompt stays bounded however long the session was
+        rolling_summary, unfolded = self.summarizer.get(session_key) if self.summarizer else ("", [])
+        conversation = [msg.to_dict() for msg in unfolded] + conversation
+        
+        if not conversation and not rolling_summary:
             return "No conversation history available."
         
         # Format conversation for summarization
         conversation_text = "\n".join([
             f"{msg['role']}: {msg['content']}" for msg in conversation
         ])
+        if rolling_summary:
+            conversation_text = f"[Summary of earlier turns] {rolling_summary}\n{conversation_text}"
         
         summary_prompt = f"""Summarize this therapeutic conversation as a mental health professional:
         
@@ -448,7 +1200,7 @@ Response:"""
         
         Summary:"""
         
-        return self.llm.generate_response(summary_prompt, max_length=500, temperature=0.2)
+        return self.llm.generate_response(summary_prompt, max_length=500, temperature=0.2, task="summary")
 
 # Global therapy service instance
 therapy_service = LLMTherapyService()
\ No newline at end of file
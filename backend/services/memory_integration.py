@@ -9,26 +9,49 @@ import json
 import logging
 from datetime import datetime
 import re
+import secrets
 from collections import defaultdict
 
+from backend.utils.metrics import metrics
+from backend.utils.keyword_matcher import get_matcher
+from backend.utils.state_backend import CachedStateBackend, get_state_backend
+
 # Configure logging
 logger = logging.getLogger(__name__)
 
 # In-memory storage for therapeutic conversations
 class LocalMemoryStorage:
-    """Local in-memory storage for therapeutic conversations"""
+    """
+    Local in-memory storage for therapeutic conversations.
     
-    def __init__(self):
+    With a shared state backend, each user's memories are kept there as one
+    list (the most recent max_per_user), so every worker sees them.
+    """
+    
+    def __init__(self, state: Optional[CachedStateBackend] = None, max_per_user: int = 200):
         self.memories = []  # List of memory dictionaries
         self.user_memories = defaultdict(list)  # user_id -> list of memory indices
+        self.state = state
+        self.max_per_user = max_per_user
         
     def store_memory(self, memory_data: Dict[str, Any]) -> str:
         """Store a memory and return a unique ID"""
-        memory_id = f"memory_{len(self.memories)}_{datetime.now().timestamp()}"
+        if self.state is not None:
+            memory_id = f"memory_{secrets.token_hex(6)}_{datetime.now().timestamp()}"
+        else:
+            memory_id = f"memory_{len(self.memories)}_{datetime.now().timestamp()}"
         memory_data['memory_id'] = memory_id
         memory_data['created_at'] = datetime.now().isoformat()
         memory_data['updated_at'] = datetime.now().isoformat()
         
+        if self.state is not None:
+            if 'user_id' in memory_data:
+                self.state.update(
+                    f"memories:{memory_data['user_id']}",
+                    lambda current: ((current or []) + [memory_data])[-self.max_per_user:]
+                )
+            return memory_id
+        
         self.memories.append(memory_data)
         
         # Index by user
@@ -37,14 +60,21 @@ class LocalMemoryStorage:
         
         return memory_id
     
+    def _get_user_memories(self, user_id: str) -> List[Dict[str, Any]]:
+        """All stored memories of a user, oldest first"""
+        if self.state is not None:
+            record = self.state.get(f"memories:{user_id}")
+            return record[1] if record else []
+        if user_id not in self.user_memories:
+            return []
+        return [self.memories[i] for i in self.user_memories[user_id]]
+    
     def retrieve_memories(self, user_id: str, query: str = None, top_k: int = 5) -> List[Dict[str, Any]]:
         """Retrieve memories for a user, optionally filtered by query"""
-        if user_id not in self.user_memories:
+        user_memories = self._get_user_memories(user_id)
+        if not user_memories:
             return []
         
-        user_memory_indices = self.user_memories[user_id]
-        user_memories = [self.memories[i] for i in user_memory_indices]
-        
         if not query:
             return user_memories[:top_k]
         
@@ -72,31 +102,21 @@ class LocalMemoryStorage:
     
     def get_user_insights(self, user_id: str) -> Dict[str, Any]:
         """Get therapeutic insights for a user"""
-        if user_id not in self.user_memories:
+        user_memories = self._get_user_memories(user_id)
+        if not user_memories:
             return {}
         
-        user_memories = [self.memories[i] for i in self.user_memories[user_id]]
-        
         # Simple pattern analysis
         emotional_patterns = []
         session_count = len(set(m.get('session_id') for m in user_memories if m.get('session_id')))
         
-        # Count emotional content patterns
-        emotion_keywords = {
-            'happy': ['happy', 'joy', 'positive', 'good', 'great', 'wonderful'],
-            'sad': ['sad', 'unhappy', 'negative', 'bad', 'difficult', 'hard'],
-            'anxious': ['anxious', 'worried', 'nervous', 'scared', 'afraid'],
-            'angry': ['angry', 'mad', 'frustrated', 'annoyed', 'upset']
-        }
-        
+        # Count emotional content patterns (lexicons/memory_emotion.json)
+        matcher = get_matcher('memory_emotion')
         emotion_counts = defaultdict(int)
         for memory in user_memories:
             content = memory.get('content', '') or memory.get('conversation_text', '')
-            content_lower = content.lower()
-            
-            for emotion, keywords in emotion_keywords.items():
-                if any(keyword in content_lower for keyword in keywords):
-                    emotion_counts[emotion] += 1
+            for emotion in matcher.matched_categories(content):
+                emotion_counts[emotion] += 1
         
         return {
             'total_sessions': session_count,
@@ -113,7 +133,12 @@ class SATbotMemoryManager:
     
     def __init__(self):
         self.enabled = True  # Always enabled for local implementation
-        self.storage = LocalMemoryStorage()
+        # Memories live in the shared state backend when one is configured
+        state = get_state_backend()
+        self.storage = LocalMemoryStorage(
+            state=state if state.shared else None,
+            max_per_user=int(os.getenv("MEMORY_MAX_PER_USER", "200"))
+        )
         logger.info("Local memory manager initialized")
     
     def store_conversation(self, user_id: str, user_name: str, conversation_text: str, 
@@ -149,7 +174,8 @@ class SATbotMemoryManager:
             }
             
             # Store in local memory
-            memory_id = self.storage.store_memory(memory_data)
+            with metrics.span("memory_store"):
+                memory_id = self.storage.store_memory(memory_data)
             
             logger.info(f"Conversation stored in local memory with ID: {memory_id}")
             return memory_id
@@ -177,11 +203,12 @@ class SATbotMemoryManager:
             
         try:
             # Search for relevant memories
-            relevant_memories = self.storage.retrieve_memories(
-                user_id=user_id,
-                query=current_context,
-                top_k=top_k
-            )
+            with metrics.span("memory_retrieval"):
+                relevant_memories = self.storage.retrieve_memories(
+                    user_id=user_id,
+                    query=current_context,
+                    top_k=top_k
+                )
             
             # Filter by minimum similarity
             filtered_memories = [
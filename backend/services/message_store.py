@@ -0,0 +1,242 @@
+"""
+Write-behind persistence of chat messages.
+Messages are queued by the request thread and inserted by a background
+writer in group commits: a batch is written once batch_size messages are
+pending or the oldest has waited flush_interval seconds, whichever is first.
+A batch that still fails after its retries is written row by row, so a bad
+row only loses itself.
+"""
+
+import os
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class MessageStore:
+    """Append-only message log with a background group-commit writer"""
+
+    def __init__(self, batch_size: int = 50, flush_interval: float = 0.2,
+                 max_pending: int = 10000, max_retries: int = 3):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.app = None
+        self.db = None
+        self._pending: List[Tuple[float, Dict[str, Any]]] = []
+        self._in_flight: List[Dict[str, Any]] = []
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._closing = False
+        # Set by flush(): pending messages are due now, not after flush_interval
+        self._urgent = False
+        self._atexit_registered = False
+        self._stats = {"queued": 0, "written": 0, "batches": 0, "dropped": 0, "failed": 0}
+
+    def init_app(self, app, db) -> None:
+        """Bind to the Flask app and database used for writes and reads"""
+        self.app = app
+        self.db = db
+
+    @property
+    def enabled(self) -> bool:
+        return self.app is not None
+
+    def append(self, user_id: Any, session_id: Any, role: str, content: str,
+               emotion: Optional[str] = None, timestamp: Optional[float] = None) -> bool:
+        """
+        Queue a message for persistence without waiting for the database
+
+        Returns:
+            False if the message was not queued (store not bound, ids not
+            numeric, or the queue is full)
+        """
+        if not self.enabled:
+            return False
+        try:
+            row = {
+                "user_id": int(user_id),
+                "session_id": int(session_id),
+                "role": role,
+                "content": content,
+                "emotion": emotion,
+                "created_at": datetime.fromtimestamp(
+                    timestamp if timestamp is not None else time.time(), timezone.utc
+                ).replace(tzinfo=None)
+            }
+        except (TypeError, ValueError):
+            return False
+
+        with self._cond:
+            if len(self._pending) >= self.max_pending:
+                self._stats["dropped"] += 1
+                logger.error("Message queue full, dropping message for session %s", session_id)
+                return False
+            self._pending.append((time.monotonic(), row))
+            self._stats["queued"] += 1
+            self._ensure_writer()
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+        return True
+
+    def _ensure_writer(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._closing = False
+            self._thread = threading.Thread(target=self._run, name="message-writer", daemon=True)
+            self._thread.start()
+            if not self._atexit_registered:
+                atexit.register(self.close)
+                self._atexit_registered = True
+
+    def _next_batch(self) -> Optional[List[Dict[str, Any]]]:
+        """Block until a batch is due; None once closed and drained"""
+        with self._cond:
+            while True:
+                if self._pending:
+                    waited = time.monotonic() - self._pending[0][0]
+                    if (len(self._pending) >= self.batch_size or waited >= self.flush_interval
+                            or self._urgent or self._closing):
+                        batch = [row for _, row in self._pending[:self.batch_size]]
+                        del self._pending[:self.batch_size]
+                        self._in_flight = batch
+                        return batch
+                    self._cond.wait(self.flush_interval - waited)
+                elif self._closing:
+                    return None
+                else:
+                    self._cond.wait()
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            for attempt in range(1, self.max_retries + 1):
+                try:
+                    self._write_batch(batch)
+                    with self._cond:
+                        self._stats["written"] += len(batch)
+                        self._stats["batches"] += 1
+                    break
+                except Exception as e:
+                    logger.warning(f"Message batch write failed (attempt {attempt}): {e}")
+                    if attempt == self.max_retries:
+                        self._write_rows(batch)
+                    else:
+                        time.sleep(0.5 * attempt)
+            with self._cond:
+                self._in_flight = []
+                self._cond.notify_all()
+
+    def _write_rows(self, rows: List[Dict[str, Any]]) -> None:
+        """Write a failed batch one row at a time, dropping only the rows that fail"""
+        for row in rows:
+            try:
+                self._write_batch([row])
+                with self._cond:
+                    self._stats["written"] += 1
+            except Exception as e:
+                with self._cond:
+                    self._stats["failed"] += 1
+                logger.error(f"Dropping message for session {row['session_id']}: {e}")
+
+    def _write_batch(self, rows: List[Dict[str, Any]]) -> None:
+        """Insert one batch in a single transaction"""
+        from backend.database.models import Message
+        with self.app.app_context():
+            try:
+                self.db.session.bulk_insert_mappings(Message, rows)
+                self.db.session.commit()
+            except Exception:
+                self.db.session.rollback()
+                raise
+
+    def _query_recent(self, user_id: int, session_id: int, limit: int,
+                      roles: Tuple[str, ...]) -> List[Dict[str, Any]]:
+        """The session's last `limit` stored messages with one of `roles`, oldest first"""
+        from backend.database.models import Message
+        with self.app.app_context():
+            messages = (Message.query
+                        .filter_by(session_id=session_id, user_id=user_id)
+                        .filter(Message.role.in_(roles))
+                        .order_by(Message.id.desc())
+                        .limit(limit)
+                        .all())
+            return [
+                {"role": m.role, "content": m.content, "emotion": m.emotion, "created_at": m.created_at}
+                for m in reversed(messages)
+            ]
+
+    def recent(self, user_id: Any, session_id: Any, limit: int = 10,
+               roles: Tuple[str, ...] = ("user", "assistant")) -> List[Dict[str, Any]]:
+        """
+        A session's last `limit` messages with one of `roles`, oldest first,
+        including messages still waiting to be written
+        """
+        if not self.enabled:
+            return []
+        try:
+            user_id, session_id = int(user_id), int(session_id)
+        except (TypeError, ValueError):
+            return []
+        stored = self._query_recent(user_id, session_id, limit, roles)
+
+        seen = {(m["role"], m["content"], m["created_at"]) for m in stored}
+        with self._cond:
+            unwritten = self._in_flight + [row for _, row in self._pending]
+        for row in unwritten:
+            # A batch may have been committed after the query ran
+            key = (row["role"], row["content"], row["created_at"])
+            if (row["session_id"] == session_id and row["user_id"] == user_id
+                    and row["role"] in roles and key not in seen):
+                stored.append(dict(row))
+        return stored[-limit:]
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Wait until every queued message has been written (or given up on)"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._urgent = True
+            self._cond.notify_all()
+            try:
+                while self._pending or self._in_flight:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+                return True
+            finally:
+                self._urgent = False
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Write out the queue and stop the writer"""
+        thread = self._thread
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        if thread is not None:
+            thread.join(timeout)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cond:
+            stats = dict(self._stats)
+            stats["pending"] = len(self._pending) + len(self._in_flight)
+        return stats
+
+
+def to_timestamp(created_at: datetime) -> float:
+    """Epoch seconds of a naive UTC datetime as stored in the message table"""
+    return created_at.replace(tzinfo=timezone.utc).timestamp()
+
+
+message_store = MessageStore(
+    batch_size=int(os.getenv("MESSAGE_BATCH_SIZE", "50")),
+    flush_interval=float(os.getenv("MESSAGE_FLUSH_MS", "200")) / 1000,
+    max_pending=int(os.getenv("MESSAGE_MAX_PENDING", "10000"))
+)
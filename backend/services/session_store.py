@@ -0,0 +1,297 @@
+"""
+Bounded per-session conversation history.
+Sessions are evicted after an idle TTL or when the store is full (least
+recently used first), and rehydrated through a loader on next access.
+Messages pushed out of a full history are handed to an on_trim callback.
+
+With a shared state backend the backend holds each session and this store
+is a read-through local cache of it: entries are revalidated by version on
+access, and appends are compare-and-set writes retried on conflict, so
+gunicorn workers (or hosts) serving the same session see one history.
+"""
+
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from backend.utils.state_backend import StateBackend
+
+logger = logging.getLogger(__name__)
+
+
+class ChatMessage(NamedTuple):
+    """One conversation message; a plain tuple, so no per-message dict"""
+    role: str
+    content: str
+    timestamp: float
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "role": self.role,
+            "content": self.content,
+            "timestamp": datetime.fromtimestamp(self.timestamp).isoformat()
+        }
+
+
+class _Session:
+    __slots__ = ("messages", "last_access", "version")
+
+    def __init__(self, max_messages: int, messages: Iterable[ChatMessage] = (), version: int = 0):
+        self.messages = deque(messages, maxlen=max_messages)
+        self.last_access = time.monotonic()
+        # Backend version the messages correspond to (0: not stored there)
+        self.version = version
+
+
+class SessionStore:
+    """Conversation histories keyed by session, bounded by idle TTL and entry count"""
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 3600,
+                 max_messages: int = 10,
+                 loader: Optional[Callable[[str], Optional[List[ChatMessage]]]] = None,
+                 on_evict: Optional[Callable[[str], None]] = None,
+                 backend: Optional[StateBackend] = None, write_retries: int = 8,
+                 on_trim: Optional[Callable[[str, List[ChatMessage]], None]] = None):
+        """
+        Args:
+            max_entries: Sessions kept in memory before the least recently used is evicted
+            ttl_seconds: Idle time after which a session is evicted
+            max_messages: Messages kept per session (oldest dropped first)
+            loader: Returns the stored messages of an evicted or unknown session, or None
+            on_evict: Called with the session key after a session is evicted
+            backend: Shared state backend holding the sessions, if any
+            write_retries: Attempts per append when other writers conflict
+            on_trim: Called with the session key and the messages an append
+                dropped from the history, oldest first
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_messages = max_messages
+        self.loader = loader
+        self.on_evict = on_evict
+        self.backend = backend
+        self.write_retries = write_retries
+        self.on_trim = on_trim
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "rehydrated": 0,
+                       "evicted_ttl": 0, "evicted_lru": 0,
+                       "shared_loads": 0, "write_conflicts": 0}
+
+    @staticmethod
+    def _shared_key(key: str) -> str:
+        return f"session:{key}"
+
+    @staticmethod
+    def _decode(value: Any) -> List[ChatMessage]:
+        return [ChatMessage(*item) for item in value or []]
+
+    @staticmethod
+    def _encode(messages: Iterable[ChatMessage]) -> List[List[Any]]:
+        return [list(message) for message in messages]
+
+    def _evict_locked(self, now: float) -> List[str]:
+        """Drop idle sessions, then the least recently used over capacity"""
+        evicted = []
+        # Access order is kept, so idle sessions sit at the front
+        while self._sessions:
+            key, session = next(iter(self._sessions.items()))
+            if now - session.last_access < self.ttl_seconds:
+                break
+            del self._sessions[key]
+            self._stats["evicted_ttl"] += 1
+            evicted.append(key)
+        while len(self._sessions) > self.max_entries:
+            key, _ = self._sessions.popitem(last=False)
+            self._stats["evicted_lru"] += 1
+            evicted.append(key)
+        return evicted
+
+    def _notify(self, evicted: List[str]) -> None:
+        if self.on_evict:
+            for key in evicted:
+                try:
+                    self.on_evict(key)
+                except Exception as e:
+                    logger.warning(f"Session eviction callback failed for {key}: {e}")
+
+    def _trimmed(self, key: str, messages: List[ChatMessage]) -> None:
+        if self.on_trim and messages:
+            try:
+                self.on_trim(key, messages)
+            except Exception as e:
+                logger.warning(f"Session trim callback failed for {key}: {e}")
+
+    def _append_local(self, key: str, message: ChatMessage) -> None:
+        session = self._session(key)
+        with self._lock:
+            full = len(session.messages) == session.messages.maxlen
+            trimmed = [session.messages[0]] if full and session.messages else []
+            session.messages.append(message)
+        self._trimmed(key, trimmed)
+
+    def _get_locked(self, key: str, now: float) -> Tuple[Optional[_Session], List[str]]:
+        """The live session for key, and the key if it just expired"""
+        session = self._sessions.get(key)
+        if session is not None and now - session.last_access >= self.ttl_seconds:
+            del self._sessions[key]
+            self._stats["evicted_ttl"] += 1
+            return None, [key]
+        if session is not None:
+            session.last_access = now
+            self._sessions.move_to_end(key)
+        return session, []
+
+    def _revalidate(self, key: str, session: _Session) -> None:
+        """Bring a cached session up to the backend's version"""
+        try:
+            if self.backend.version(self._shared_key(key)) == session.version:
+                return
+            record = self.backend.get(self._shared_key(key))
+        except Exception as e:
+            logger.warning(f"Failed to revalidate session {key}: {e}")
+            return
+        with self._lock:
+            if record is not None:
+                session.messages = deque(self._decode(record[1]), maxlen=self.max_messages)
+                session.version = record[0]
+            elif session.version:
+                # Cleared or expired by another worker
+                session.messages.clear()
+                session.version = 0
+
+    def _load(self, key: str) -> Optional[_Session]:
+        """A session from the shared backend, else through the loader"""
+        if self.backend is not None:
+            try:
+                record = self.backend.get(self._shared_key(key))
+            except Exception as e:
+                logger.warning(f"Failed to load session {key} from state backend: {e}")
+                record = None
+            if record is not None:
+                with self._lock:
+                    self._stats["shared_loads"] += 1
+                return _Session(self.max_messages, self._decode(record[1]), record[0])
+
+        messages = None
+        if self.loader:
+            try:
+                messages = self.loader(key)
+            except Exception as e:
+                logger.warning(f"Failed to rehydrate session {key}: {e}")
+        if not messages:
+            return None
+        with self._lock:
+            self._stats["rehydrated"] += 1
+        return _Session(self.max_messages, messages)
+
+    def _session(self, key: str) -> _Session:
+        """The live session for key, rehydrated or created empty"""
+        now = time.monotonic()
+        with self._lock:
+            session, expired = self._get_locked(key, now)
+            self._stats["hits" if session is not None else "misses"] += 1
+        self._notify(expired)
+        if session is not None:
+            if self.backend is not None:
+                self._revalidate(key, session)
+            return session
+
+        # Load outside the lock; it may hit the database or backend
+        loaded = self._load(key)
+
+        with self._lock:
+            # Another thread may have created the session meanwhile
+            session, evicted = self._get_locked(key, now)
+            if session is None:
+                session = loaded or _Session(self.max_messages)
+                self._sessions[key] = session
+            evicted += self._evict_locked(now)
+        self._notify(evicted)
+        return session
+
+    def append(self, key: str, role: str, content: str) -> ChatMessage:
+        """Add a message to a session, rehydrating it first if needed"""
+        message = ChatMessage(role, content, time.time())
+        if self.backend is None:
+            self._append_local(key, message)
+            return message
+
+        for _ in range(self.write_retries):
+            session = self._session(key)
+            with self._lock:
+                combined = list(session.messages) + [message]
+                messages = combined[-self.max_messages:]
+                expected = session.version
+            try:
+                version = self.backend.put(self._shared_key(key), self._encode(messages),
+                                           expected_version=expected, ttl=self.ttl_seconds)
+            except Exception as e:
+                logger.warning(f"Failed to write session {key} to state backend: {e}")
+                break
+            if version is not None:
+                with self._lock:
+                    session.messages = deque(messages, maxlen=self.max_messages)
+                    session.version = version
+                self._trimmed(key, combined[:len(combined) - len(messages)])
+                return message
+            # Another writer got there first; revalidate and retry
+            with self._lock:
+                self._stats["write_conflicts"] += 1
+
+        # Keep the message locally rather than lose it
+        logger.warning(f"Session {key} appended locally only")
+        self._append_local(key, message)
+        return message
+
+    def history(self, key: str) -> List[ChatMessage]:
+        """Snapshot of a session's messages, oldest first"""
+        session = self._session(key)
+        with self._lock:
+            return list(session.messages)
+
+    def reset(self, key: str) -> None:
+        """Start a session with an empty history"""
+        version = 0
+        if self.backend is not None:
+            try:
+                version = self.backend.put(self._shared_key(key), [], ttl=self.ttl_seconds) or 0
+            except Exception as e:
+                logger.warning(f"Failed to reset session {key} in state backend: {e}")
+        now = time.monotonic()
+        with self._lock:
+            self._sessions[key] = _Session(self.max_messages, version=version)
+            self._sessions.move_to_end(key)
+            evicted = self._evict_locked(now)
+        self._notify(evicted)
+
+    def pop(self, key: str) -> None:
+        """Forget a session"""
+        if self.backend is not None:
+            try:
+                self.backend.delete(self._shared_key(key))
+            except Exception as e:
+                logger.warning(f"Failed to delete session {key} from state backend: {e}")
+        with self._lock:
+            self._sessions.pop(key, None)
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._sessions
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Entry counts, approximate memory use and eviction counters"""
+        with self._lock:
+            sessions = list(self._sessions.values())
+            stats = dict(self._stats)
+        messages = sum(len(session.messages) for session in sessions)
+        approx_bytes = sum(
+            sys.getsizeof(message) + sys.getsizeof(message.content)
+            for session in sessions for message in list(session.messages)
+        )
+        stats.update({"sessions": len(sessions), "messages": messages, "approx_bytes": approx_bytes})
+        return stats
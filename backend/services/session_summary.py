@@ -0,0 +1,180 @@
+"""
+Rolling per-session conversation summary.
+Messages trimmed from a session's bounded history are collected as pending
+and, once `every_turns` turns have accumulated, folded into the session's
+summary by a background worker. Prompts then carry the summary plus the few
+pending messages instead of every old turn, so their size stays constant
+however long the session runs.
+
+Records live in a state backend under `summary:{key}`, so with a shared
+backend every worker sees (and folds) the same summary.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from backend.services.session_store import ChatMessage
+from backend.utils.state_backend import StateBackend
+
+logger = logging.getLogger(__name__)
+
+
+class RollingSummarizer:
+    """Folds trimmed session messages into a compact summary every few turns"""
+
+    def __init__(self, summarize: Callable[[str, List[ChatMessage]], str],
+                 state: StateBackend, every_turns: int = 5, max_pending: int = 40,
+                 ttl_seconds: float = 3600, max_workers: int = 2,
+                 loader: Optional[Callable[[str], Optional[str]]] = None,
+                 on_fold: Optional[Callable[[str, str], None]] = None,
+                 write_retries: int = 8):
+        """
+        Args:
+            summarize: Returns the new summary from the previous summary (may
+                be empty) and the messages to fold in; raises on failure
+            state: Backend holding each session's summary and pending messages
+            every_turns: Turns (user and assistant message pairs) folded at once
+            max_pending: Pending messages kept while folds fail (oldest dropped)
+            ttl_seconds: Idle time after which a record expires from the backend
+            max_workers: Concurrent background folds
+            loader: Returns the stored summary of a session without a record
+            on_fold: Called with the session key and the new summary
+            write_retries: Attempts per write when other writers conflict
+        """
+        self.summarize = summarize
+        self.state = state
+        self.every_turns = every_turns
+        self.max_pending = max_pending
+        self.ttl_seconds = ttl_seconds
+        self.loader = loader
+        self.on_fold = on_fold
+        self.write_retries = write_retries
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="summary")
+        self._running = set()
+        self._lock = threading.Lock()
+        self._stats = {"folds": 0, "folded_messages": 0, "fold_failures": 0, "dropped": 0}
+
+    @staticmethod
+    def _key(key: str) -> str:
+        return f"summary:{key}"
+
+    def _fresh(self, key: str) -> Dict[str, Any]:
+        """A new record, starting from the stored summary if there is one"""
+        summary = ""
+        if self.loader:
+            try:
+                summary = self.loader(key) or ""
+            except Exception as e:
+                logger.warning(f"Failed to load summary of session {key}: {e}")
+        return {"summary": summary, "pending": []}
+
+    def _record(self, key: str) -> Tuple[int, Dict[str, Any]]:
+        """(version, record) of a session, creating the record if needed"""
+        for _ in range(self.write_retries):
+            existing = self.state.get(self._key(key))
+            if existing is not None:
+                return existing
+            record = self._fresh(key)
+            version = self.state.put(self._key(key), record, expected_version=0, ttl=self.ttl_seconds)
+            if version is not None:
+                return version, record
+        raise RuntimeError(f"Summary record of session {key} kept conflicting")
+
+    def add(self, key: str, messages: List[ChatMessage]) -> None:
+        """Queue messages trimmed from a session's history for folding"""
+        pending = []
+        for _ in range(self.write_retries):
+            version, record = self._record(key)
+            pending = record["pending"] + [list(message) for message in messages]
+            dropped = max(0, len(pending) - self.max_pending)
+            updated = {"summary": record["summary"], "pending": pending[dropped:]}
+            if self.state.put(self._key(key), updated, expected_version=version,
+                              ttl=self.ttl_seconds) is not None:
+                if dropped:
+                    with self._lock:
+                        self._stats["dropped"] += dropped
+                    logger.warning(f"Dropped {dropped} unsummarized messages of session {key}")
+                pending = updated["pending"]
+                break
+        else:
+            logger.warning(f"Failed to queue trimmed messages of session {key}")
+            return
+        if len(pending) >= self.every_turns * 2:
+            self._schedule(key)
+
+    def _schedule(self, key: str) -> None:
+        with self._lock:
+            if key in self._running:
+                return
+            self._running.add(key)
+        self._executor.submit(self._fold, key)
+
+    def _fold(self, key: str) -> None:
+        """Fold a session's pending messages into its summary (runs in the pool)"""
+        folded = False
+        try:
+            _, record = self._record(key)
+            base, batch = record["summary"], record["pending"]
+            if not batch:
+                return
+            summary = self.summarize(base, [ChatMessage(*item) for item in batch])
+            if not summary or not summary.strip():
+                raise ValueError("empty summary")
+            summary = summary.strip()
+
+            for _ in range(self.write_retries):
+                current = self.state.get(self._key(key))
+                if current is None or current[1]["summary"] != base:
+                    # Cleared, or folded by another worker meanwhile
+                    return
+                # Messages trimmed during the fold stay pending
+                remaining = [item for item in current[1]["pending"] if item not in batch]
+                if self.state.put(self._key(key), {"summary": summary, "pending": remaining},
+                                  expected_version=current[0], ttl=self.ttl_seconds) is not None:
+                    folded = True
+                    break
+            if not folded:
+                return
+
+            with self._lock:
+                self._stats["folds"] += 1
+                self._stats["folded_messages"] += len(batch)
+            logger.info(f"Folded {len(batch)} messages into the summary of session {key}")
+            if self.on_fold:
+                self.on_fold(key, summary)
+        except Exception as e:
+            with self._lock:
+                self._stats["fold_failures"] += 1
+            logger.warning(f"Failed to fold summary of session {key}: {e}")
+        finally:
+            with self._lock:
+                self._running.discard(key)
+            if folded:
+                # More turns may have been trimmed while the fold ran
+                record = self.state.get(self._key(key))
+                if record is not None and len(record[1]["pending"]) >= self.every_turns * 2:
+                    self._schedule(key)
+
+    def get(self, key: str) -> Tuple[str, List[ChatMessage]]:
+        """A session's summary and the trimmed messages not folded into it yet"""
+        try:
+            _, record = self._record(key)
+        except Exception as e:
+            logger.warning(f"Summary of session {key} unavailable: {e}")
+            return "", []
+        return record["summary"], [ChatMessage(*item) for item in record["pending"]]
+
+    def forget(self, key: str) -> None:
+        """Drop a session's summary record"""
+        try:
+            self.state.delete(self._key(key))
+        except Exception as e:
+            logger.warning(f"Failed to delete summary of session {key}: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["running"] = len(self._running)
+        return stats
@@ -12,6 +12,8 @@ from gtts import gTTS
 import pygame
 import threading
 
+from backend.utils.keyword_matcher import get_matcher
+
 logger = logging.getLogger(__name__)
 
 class TTSService:
@@ -106,19 +108,8 @@ class TTSService:
     
     def analyze_emotional_tone(self, text: str) -> str:
         """Analyze text to determine appropriate emotional tone for TTS"""
-        text_lower = text.lower()
-        
-        # Emotional tone detection
-        if any(word in text_lower for word in ['sad', 'depressed', 'unhappy', 'crying', 'tears']):
-            return 'gentle'
-        elif any(word in text_lower for word in ['excited', 'happy', 'joy', 'great', 'wonderful']):
-            return 'excited'
-        elif any(word in text_lower for word in ['angry', 'mad', 'frustrated', 'upset']):
-            return 'calm'  # Stay calm with angry users
-        elif any(word in text_lower for word in ['anxious', 'nervous', 'worried', 'scared']):
-            return 'reassuring'
-        else:
-            return 'calm'
+        # Tones in lexicons/tts_tone.json are checked in order; stay calm with angry users
+        return get_matcher('tts_tone').first_category(text, 'calm')
     
     def generate_therapeutic_voice_response(self, therapeutic_text: str, 
                                           user_emotion: str = None) -> Optional[str]:
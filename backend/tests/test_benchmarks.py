@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Test the microbenchmark runner and baseline comparison
+"""
+
+import sys
+import os
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.tools.benchmarks import compare, format_report, measure, run_benchmarks
+
+def test_benchmarks():
+    """Stdlib-only benchmarks run at each size and compare against a baseline"""
+    print("Testing Benchmarks...")
+    print("=" * 50)
+
+    timing = measure(lambda: sum(range(100)), repeat=3, min_time=0.001)
+    print(f"1. Measured: {timing}")
+    assert timing["loops"] >= 1 and 0 < timing["min_s"] <= timing["median_s"] <= timing["max_s"]
+
+    report = run_benchmarks(["memory.retrieve_memories", "companion", "cards"],
+                            repeat=2, min_time=0.001, size_limit=100)
+    print(format_report(report))
+    assert set(report["results"]) == {
+        "memory.retrieve_memories[100]",
+        "companion.get_emotional_insights[10]", "companion.get_emotional_insights[50]",
+        "companion.get_emotional_insights[100]",
+        "cards.get_user_favorite_categories[10]", "cards.get_user_favorite_categories[50]",
+        "cards.get_user_favorite_categories[100]"
+    }
+    assert len(report["growth"]["cards.get_user_favorite_categories"]) == 2
+
+    # A baseline twice as fast flags every benchmark as a regression
+    baseline = {"results": {key: {"median_s": result["median_s"] / 2}
+                            for key, result in report["results"].items()}}
+    rows = compare(report, baseline, threshold=1.25)
+    print(f"2. Compared {len(rows)} benchmarks")
+    assert len(rows) == 7 and all(row["regression"] and row["ratio"] == 2.0 for row in rows)
+    assert not any(row["regression"] for row in compare(report, report))
+
+    print("\n✓ Benchmarks working")
+
+if __name__ == "__main__":
+    test_benchmarks()
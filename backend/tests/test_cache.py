@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Test the LRU+TTL cache used for deterministic LLM classifications
+"""
+
+import sys
+import os
+import time
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.utils.cache import LRUCache, MISSING, normalize_text
+
+def test_lru_cache():
+    """Hits, misses, LRU eviction and TTL expiry are all counted"""
+    print("Testing LRU+TTL Cache...")
+    print("=" * 50)
+    
+    cache = LRUCache(max_entries=2, ttl_seconds=60)
+    key = ("emotion", normalize_text("  我有点难过 "))
+    assert cache.get(key) is MISSING
+    cache.set(key, "sad")
+    assert cache.get(("emotion", normalize_text("我有点难过"))) == "sad"
+    
+    cache.set(("emotion", "继续对话"), "neutral")
+    cache.get(key)  # key is now most recently used
+    cache.set(("emotion", "换个话题"), "neutral")
+    assert cache.get(("emotion", "继续对话")) is MISSING
+    assert cache.get(key) == "sad"
+    
+    stats = cache.get_stats()
+    print(f"1. Stats after eviction: {stats}")
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 3
+    assert stats["misses"] == 2
+    
+    short_lived = LRUCache(max_entries=10, ttl_seconds=0.01)
+    short_lived.set("k", 0.0)
+    assert short_lived.get("k") == 0.0
+    time.sleep(0.02)
+    assert short_lived.get("k") is MISSING
+    print(f"2. Stats after expiry: {short_lived.get_stats()}")
+    assert short_lived.get_stats()["expirations"] == 1
+    
+    print("\n✓ LRU+TTL cache working")
+
+if __name__ == "__main__":
+    test_lru_cache()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Test the LLM circuit breaker, rate-limit ordering and the shared turn deadline
+"""
+
+import sys
+import os
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.models.llm_integration import (
+    FALLBACK_RESPONSES, CircuitBreaker, LLMIntegration, deadline_remaining, llm_deadline
+)
+from backend.tools.mock_llm import MockConfig, MockLLMServer, parse_latency
+from backend.utils.rate_limiter import RateLimiter
+
+def test_circuit_breaker():
+    """Failures open the breaker, one probe closes it, open calls spend nothing"""
+    print("Testing Circuit Breaker...")
+    print("=" * 50)
+
+    # Half-open admits a single probe; a probe that is never sent is released
+    breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=0.1)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.is_open() and not breaker.allow_request()
+    time.sleep(0.15)
+    assert breaker.allow_request() and breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow_request()
+    breaker.cancel_request()
+    assert breaker.allow_request() and not breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.is_open()
+    print(f"1. Breaker after a failed probe: {breaker.get_stats()}")
+    assert breaker.get_stats()["short_circuited"] == 3
+
+    server = MockLLMServer(config=MockConfig(latency="const:5", error_rate=1.0)).start()
+    try:
+        llm = LLMIntegration(api_type="openai", api_key="mock", api_base=server.base_url)
+        llm.cache_enabled = False
+        llm.coalesce_enabled = False
+        breaker = CircuitBreaker(failure_threshold=3, recovery_timeout=0.3)
+        llm.endpoints[0].circuit_breaker = llm.circuit_breaker = breaker
+        llm.rate_limiter = RateLimiter(requests_per_minute=6000, max_wait=1)
+
+        # Injected 500s open the breaker at the threshold
+        for _ in range(3):
+            assert llm.generate_response("你好", max_length=20) in FALLBACK_RESPONSES
+        assert breaker.state == CircuitBreaker.OPEN and server.config.stats["errors_injected"] == 3
+
+        # While open, calls reach neither the server nor the rate limiter
+        acquired = llm.get_rate_limit_stats()["acquired"]
+        for _ in range(5):
+            assert llm.generate_response("你好", max_length=20) in FALLBACK_RESPONSES
+            assert llm._acquire_call(10, breaker) is None
+        print(f"2. Open: server {server.config.stats}, limiter {llm.get_rate_limit_stats()}")
+        assert server.config.stats["requests"] == 3
+        assert llm.get_rate_limit_stats()["acquired"] == acquired
+
+        # After the cooldown one probe goes out; its success closes the breaker
+        server.config.error_rate = 0.0
+        time.sleep(0.35)
+        reply = llm.generate_response("你好", max_length=20)
+        print(f"3. Probe reply: {reply}")
+        assert reply not in FALLBACK_RESPONSES and breaker.state == CircuitBreaker.CLOSED
+
+        # A probe the rate limiter drops frees its slot for the next call
+        for _ in range(3):
+            breaker.record_failure()
+        time.sleep(0.35)
+        llm.rate_limiter = RateLimiter(requests_per_minute=1, max_wait=0, burst_seconds=1)
+        assert llm.rate_limiter.acquire(1, max_wait=0)
+        assert llm._acquire_call(10, breaker) is None
+        assert breaker.state == CircuitBreaker.HALF_OPEN and breaker.allow_request()
+
+        # The turn deadline bounds calls made from pool threads that copy the context
+        server.config.latency = parse_latency("const:1000")
+        breaker.record_success()
+        llm.rate_limiter = RateLimiter()
+        executor = ThreadPoolExecutor(max_workers=2)
+        with llm_deadline(0.2):
+            assert 0 < deadline_remaining() <= 0.2
+            start = time.perf_counter()
+            future = executor.submit(contextvars.copy_context().run,
+                                     llm.generate_response, "你好", 20)
+            assert future.result(timeout=5) in FALLBACK_RESPONSES
+            elapsed = time.perf_counter() - start
+            assert executor.submit(deadline_remaining).result() is None
+            assert executor.submit(contextvars.copy_context().run, deadline_remaining).result() <= 0.2
+        print(f"4. Pool-thread call under a 200 ms deadline returned in {elapsed * 1000:.0f} ms")
+        assert elapsed < 0.6 and deadline_remaining() is None
+        executor.shutdown()
+    finally:
+        server.stop()
+
+    print("\n✓ Circuit breaker working")
+
+if __name__ == "__main__":
+    test_circuit_breaker()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Test joint emotion/intention classification and its keyword fallback
+"""
+
+import sys
+import os
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.models.llm_integration import LLMIntegration
+from backend.tools.mock_llm import MockConfig, MockLLMServer
+
+def test_parse_classification():
+    """Model output is parsed leniently and normalised to the known labels"""
+    print("Testing Classification Parsing...")
+    print("=" * 50)
+
+    llm = LLMIntegration(api_type="openai", api_key="mock", api_base="http://127.0.0.1:9/v1")
+    parse = llm._parse_classification
+
+    # Plain, fenced and surrounded JSON
+    plain = parse('{"emotion": "Sad", "intention": "S", "confidence": 0.9}')
+    fenced = parse('```json\n{"emotion": "sad", "intention": "s", "confidence": 0.9}\n```')
+    chatty = parse('分析结果如下：{"emotion": "sad", "intention": "s", "confidence": 0.9} 仅供参考')
+    print(f"1. Plain / fenced / extra text: {plain} / {fenced} / {chatty}")
+    assert plain == fenced == chatty == {"emotion": "sad", "intention": "s", "confidence": 0.9}
+
+    # Unknown labels and a missing intention fall back to the neutral defaults
+    unknown = parse('{"emotion": "melancholy", "intention": "maybe", "confidence": 0.7}')
+    missing = parse('{"emotion": "angry", "confidence": 0.8}')
+    print(f"2. Unknown labels: {unknown}, missing intention: {missing}")
+    assert unknown == {"emotion": "neutral", "intention": "not_s", "confidence": 0.7}
+    assert missing == {"emotion": "angry", "intention": "not_s", "confidence": 0.8}
+
+    # Confidence is clamped to [0, 1] and defaults when absent or not a number
+    assert parse('{"emotion": "happy", "intention": "not_s", "confidence": 3}')["confidence"] == 1.0
+    assert parse('{"emotion": "happy", "intention": "not_s", "confidence": -1}')["confidence"] == 0.0
+    assert parse('{"emotion": "happy", "intention": "not_s", "confidence": "high"}')["confidence"] == 0.5
+    assert parse('{"emotion": "happy", "intention": "not_s"}')["confidence"] == 0.5
+
+    # Anything without a JSON object is rejected
+    for content in [None, "", 42, "没有结构化结果", '["sad", "s"]', "{emotion: sad}"]:
+        assert parse(content) is None, content
+    print("3. Confidence clamping and invalid payloads handled")
+
+    print("\n✓ Classification parsing working")
+
+def test_classify():
+    """classify asks the API once per text and falls back to keywords without it"""
+    print("Testing Classification...")
+    print("=" * 50)
+
+    server = MockLLMServer(config=MockConfig(latency="const:5")).start()
+    try:
+        llm = LLMIntegration(api_type="openai", api_key="mock", api_base=server.base_url)
+
+        # One structured request per text, cached afterwards
+        result = llm.classify("我很焦虑，不想活了")
+        print(f"1. API classification: {result}")
+        assert result["emotion"] == "anxious" and result["intention"] == "s"
+        assert 0 < result["confidence"] <= 1
+        assert llm.classify("  我很焦虑，不想活了 ") == result
+        assert server.config.stats["chat"] == 1
+
+        # Blank text is neutral without a request
+        assert llm.classify("   ") == {"emotion": "neutral", "intention": "not_s", "confidence": 1.0}
+        assert server.config.stats["requests"] == 1
+
+        # fallback_classify never calls the API and reports zero confidence
+        assert llm.fallback_classify("最近压力好大，真的撑不下去了") == {
+            "emotion": "anxious", "intention": "s", "confidence": 0.0
+        }
+        assert llm.fallback_classify(None) == {"emotion": "neutral", "intention": "not_s", "confidence": 0.0}
+        assert server.config.stats["requests"] == 1
+
+        # Failed API calls fall back to the keyword result
+        server.config.error_rate = 1.0
+        result = llm.classify("今天很开心")
+        print(f"2. Classification with the API failing: {result}")
+        assert result == {"emotion": "happy", "intention": "not_s", "confidence": 0.0}
+        assert server.config.stats["errors_injected"] >= 1
+
+        # As does a client without an API key, which sends nothing at all
+        requests = server.config.stats["requests"]
+        offline = LLMIntegration(api_type="openai", api_base=server.base_url)
+        # OPENAI_API_KEY may be set in the environment
+        for endpoint in offline.endpoints:
+            endpoint.api_key = None
+        assert offline.classify("我好难过") == {"emotion": "sad", "intention": "not_s", "confidence": 0.0}
+        assert server.config.stats["requests"] == requests
+    finally:
+        server.stop()
+
+    print("\n✓ Classification working")
+
+if __name__ == "__main__":
+    test_parse_classification()
+    test_classify()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Test the local crisis pre-screen and templated safety replies
+"""
+
+import sys
+import os
+import time
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.services.crisis_screen import CrisisScreen
+from backend.utils.keyword_matcher import get_matcher
+
+def test_crisis_screen():
+    """Crisis phrases are found in one pass and answered with local hotlines"""
+    print("Testing Crisis Screen...")
+    print("=" * 50)
+
+    screen = CrisisScreen(get_matcher("crisis"), {"zh": "China", "en": "United States"})
+
+    hits = screen.match("我真的撑不下去了，有时候想死")
+    print(f"1. Chinese hits: {hits}")
+    assert hits == ["撑不下去了", "想死"]
+    assert screen.match("Sometimes I want to DIE, I might hurt... I want to hurt myself") == ["want to die"]
+    assert screen.match("今天天气不错") == [] and screen.match("") == []
+
+    # "想死你了" is "missed you so much", not a crisis; a real one still counts
+    assert screen.match("好久不见，想死你了！") == [] and screen.match("想死我了，终于放假了") == []
+    assert screen.match("想死你了，可是我最近真的想死") == ["想死"]
+    assert screen.match("我想死，你别管我") == ["想死"]
+
+    # Replies follow the message's language; hotlines follow the country
+    reply = screen.safety_reply("我不想活了")
+    print(f"2. Chinese reply:\n{reply}")
+    assert "Lifeline: 400 821 1215" in reply and "热线" in reply
+    reply = screen.safety_reply("I want to end my life", country="uk")
+    assert "Samaritans" in reply and "immediate danger" in reply
+    assert "988" in screen.safety_reply("I want to end my life", country="Atlantis")
+
+    # Screening and the reply are local and fast
+    start = time.perf_counter()
+    for _ in range(1000):
+        screen.match("最近工作压力很大，晚上总是睡不着，感觉活着没意思")
+        screen.safety_reply("最近工作压力很大")
+    elapsed_ms = (time.perf_counter() - start) * 1000 / 1000
+    print(f"3. Screen + reply: {elapsed_ms:.4f} ms per message")
+    assert elapsed_ms < 1
+
+    print("\n✓ Crisis screen working")
+
+if __name__ == "__main__":
+    test_crisis_screen()
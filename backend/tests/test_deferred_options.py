@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Test deferred quick-reply options: fallback first, LLM options by token
+"""
+
+import sys
+import os
+import threading
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.models.llm_integration import LLMIntegration
+from backend.services.llm_therapy_service import LLMTherapyService
+from backend.tools.mock_llm import MockConfig, MockLLMServer
+
+class GatedLLM(LLMIntegration):
+    """Mock-server client whose options call waits until released"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.release = threading.Event()
+
+    def generate_response(self, prompt, *args, **kwargs):
+        if kwargs.get("task") == "options":
+            self.release.wait(5)
+        return super().generate_response(prompt, *args, **kwargs)
+
+def test_deferred_options():
+    """A turn returns fallback options and a token that later yields LLM options"""
+    print("Testing Deferred Options...")
+    print("=" * 50)
+
+    server = MockLLMServer(config=MockConfig(latency="const:5")).start()
+    try:
+        service = LLMTherapyService()
+        service._retrieve_rag_context = lambda message, user_id: None
+        service.llm = GatedLLM(api_type="openai", api_key="mock", api_base=server.base_url)
+        assert service.defer_options
+
+        # The reply goes out with the emotion-keyed fallback and a token
+        result = service.process_message(1, 1, "最近工作压力很大，总是睡不好")
+        fallback = service.get_fallback_options(result["emotion"])
+        print(f"1. Turn options: {result['options']} (token {result['options_token']})")
+        assert result["options"] == fallback and result["options_token"]
+
+        # Until the LLM options are ready the token serves the fallback
+        pending = service.get_deferred_options(result["options_token"])
+        print(f"2. Before ready: {pending}")
+        assert pending == {"ready": False, "options": fallback}
+
+        # Once generated, the token serves the LLM options, issued to the session
+        service.llm.release.set()
+        ready = service.get_deferred_options(result["options_token"], wait=5)
+        print(f"3. After ready: {ready}")
+        assert ready["ready"] and ready["options"] != fallback
+        assert all(option in service.issued_options["1_1"] for option in ready["options"])
+
+        # Streaming turns carry a token as well
+        events = list(service.process_message_stream(1, 1, "谢谢你听我说"))
+        done = events[-1]["data"]
+        print(f"4. Stream done event: options {done['options']}, token {done['options_token']}")
+        assert events[-1]["event"] == "done" and done["options_token"]
+        assert service.get_deferred_options(done["options_token"], wait=5)["ready"]
+        assert service.get_deferred_options("unknown") is None
+    finally:
+        server.stop()
+
+    print("\n✓ Deferred options working")
+
+if __name__ == "__main__":
+    test_deferred_options()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Test deferred task store used for off-critical-path option generation
+"""
+
+import sys
+import os
+import threading
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.services.deferred_tasks import DeferredTaskStore
+from backend.utils.state_backend import CachedStateBackend, InMemoryStateBackend
+
+def test_deferred_tasks():
+    """Pending results serve the fallback, finished results replace it"""
+    print("Testing Deferred Task Store...")
+    print("=" * 50)
+    
+    store = DeferredTaskStore("test", max_workers=2, ttl_seconds=60, max_entries=3)
+    release = threading.Event()
+    
+    def slow_options():
+        release.wait(5)
+        return ["继续分享", "寻求建议"]
+    
+    token = store.submit(slow_options, fallback=["继续对话"])
+    pending = store.get(token)
+    print(f"1. Pending: {pending}")
+    assert pending == {"ready": False, "result": ["继续对话"]}
+    
+    release.set()
+    ready = store.get(token, wait=5)
+    print(f"2. Ready: {ready}")
+    assert ready == {"ready": True, "result": ["继续分享", "寻求建议"]}
+    
+    def failing():
+        raise RuntimeError("LLM unavailable")
+    
+    failed_token = store.submit(failing, fallback=["需要帮助"])
+    failed = store.get(failed_token, wait=5)
+    print(f"3. Failed task: {failed}")
+    assert failed == {"ready": True, "result": ["需要帮助"]}
+    
+    print(f"4. Unknown token: {store.get('missing')}")
+    assert store.get("missing") is None
+    
+    for _ in range(5):
+        store.submit(lambda: None)
+    print(f"5. Entries after overflow: {len(store)}")
+    assert len(store) <= 3
+    
+    # With a shared backend, a token can be redeemed by another worker's store
+    shared = CachedStateBackend(InMemoryStateBackend())
+    worker_a = DeferredTaskStore("shared", state=shared)
+    worker_b = DeferredTaskStore("shared", state=shared)
+    release.clear()
+    shared_token = worker_a.submit(slow_options, fallback=["继续对话"])
+    print(f"6. Pending on other worker: {worker_b.get(shared_token)}")
+    assert worker_b.get(shared_token) == {"ready": False, "result": ["继续对话"]}
+    release.set()
+    assert worker_b.get(shared_token, wait=5) == {"ready": True, "result": ["继续分享", "寻求建议"]}
+    assert worker_b.get("missing") is None
+    
+    print("\n✓ Deferred task store working")
+
+if __name__ == "__main__":
+    test_deferred_tasks()
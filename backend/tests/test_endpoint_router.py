@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Test latency-aware endpoint routing and hedged LLM calls
+"""
+
+import sys
+import os
+import time
+import types
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.models.llm_integration import LLMIntegration, llm_deadline
+from backend.tools.mock_llm import MockConfig, MockLLMServer
+from backend.utils.endpoint_router import NOT_ATTEMPTED, EndpointRouter
+from backend.utils.rate_limiter import RateLimiter
+
+def test_endpoint_router():
+    """Slow primaries are hedged, failures fail over, rankings follow latency"""
+    print("Testing Endpoint Router...")
+    print("=" * 50)
+
+    slow = types.SimpleNamespace(name="slow")
+    fast = types.SimpleNamespace(name="fast")
+    router = EndpointRouter([slow, fast], default_hedge_delay=0.05,
+                            failure_penalty=10, explore_ratio=0)
+    latencies = {"slow": 0.5, "fast": 0.01}
+
+    def call(endpoint):
+        time.sleep(latencies[endpoint.name])
+        return f"answer from {endpoint.name}"
+
+    # Never-measured endpoints rank first, in configured order
+    assert router.ranked() == [slow, fast]
+
+    start = time.perf_counter()
+    assert router.call(call, hedge=True) == "answer from fast"
+    elapsed = time.perf_counter() - start
+    print(f"1. Hedged call answered in {elapsed * 1000:.0f} ms")
+    assert elapsed < 0.3
+    assert router.get_stats()["hedges"] == 1
+    assert router.get_stats()["hedge_wins"] == 1
+
+    # Once both are measured, the fast endpoint is tried first
+    time.sleep(0.6)
+    assert router.ranked() == [fast, slow]
+    assert router.call(call) == "answer from fast"
+
+    # A failing endpoint fails over straight away and sinks in the ranking
+    def flaky(endpoint):
+        return None if endpoint.name == "fast" else "answer from slow"
+    latencies["slow"] = 0.0
+    assert router.call(flaky, hedge=True) == "answer from slow"
+    assert router.ranked() == [slow, fast]
+    assert router.call(lambda endpoint: None, hedge=True) is None
+
+    # Endpoints can be filtered out (e.g. open circuit breakers)
+    assert router.ranked(lambda endpoint: endpoint is fast) == [fast]
+    assert router.call(call, available=lambda endpoint: False) is None
+
+    stats = router.get_stats()
+    print(f"2. Stats: {stats}")
+    assert stats["endpoints"]["fast"]["failures"] == 2
+
+    # Calls that never reached the endpoint fail over but are not recorded
+    before = router.get_stats()["endpoints"]
+    assert router.call(lambda endpoint: NOT_ATTEMPTED) is None
+    assert router.call(lambda endpoint: NOT_ATTEMPTED, hedge=True) is None
+    assert router.get_stats()["endpoints"] == before
+
+    # Client-side rejects against a live endpoint leave its latency record intact
+    server = MockLLMServer(config=MockConfig(latency="const:5")).start()
+    try:
+        llm = LLMIntegration(api_type="openai", api_key="mock", api_base=server.base_url)
+        llm.cache_enabled = False
+        assert llm.generate_response("你好", max_length=20)
+        healthy = llm.router.get_stats()["endpoints"]["primary"]
+        with llm_deadline(0):
+            for _ in range(3):
+                llm.generate_response("你好", max_length=20)
+        llm.rate_limiter = RateLimiter(requests_per_minute=1, max_wait=0, burst_seconds=1)
+        for _ in range(4):
+            llm.generate_response("你好", max_length=20)
+        tracked = llm.router.get_stats()["endpoints"]["primary"]
+        print(f"3. After deadline and rate-limit rejects: {tracked}, server {server.config.stats}")
+        assert server.config.stats["chat"] == 2 and tracked["failures"] == 0
+        assert tracked["calls"] == 2 and tracked["ewma_ms"] < 1000
+        assert healthy["calls"] == 1
+    finally:
+        server.stop()
+
+    print("\n✓ Endpoint router working")
+
+if __name__ == "__main__":
+    test_endpoint_router()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Test reuse of the session's classification for tapped quick-reply options
+"""
+
+import sys
+import os
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.models.llm_integration import LLMIntegration
+from backend.services.llm_therapy_service import LLMTherapyService
+from backend.tools.mock_llm import MockConfig, MockLLMServer
+
+def test_issued_options():
+    """Non-crisis classifications are reused for issued options, crisis ones never"""
+    print("Testing Issued Option Classification...")
+    print("=" * 50)
+
+    service = LLMTherapyService()
+    service.max_issued_options = 3
+    sad = {"emotion": "sad", "intention": "not_s", "confidence": 0.8}
+    crisis = {"emotion": "sad", "intention": "s", "confidence": 0.9}
+
+    # Only options issued to this session qualify
+    service._register_options("1_1", ["继续分享感受", " 给我一些建议 ", ""])
+    assert service._classification_for_issued_option("1_1", "随便说点什么") is None
+    assert service._classification_for_issued_option("2_2", "继续分享感受") is None
+
+    # Before any classification the static options are known to be safe
+    default = service._classification_for_issued_option("1_1", "给我一些建议")
+    print(f"1. Tap before any classification: {default}")
+    assert default == {"emotion": "neutral", "intention": "not_s", "confidence": 0.0}
+
+    # A non-crisis classification is reused, as a copy
+    service.last_classifications["1_1"] = sad
+    reused = service._classification_for_issued_option("1_1", " 继续分享感受")
+    print(f"2. Tap after a non-crisis turn: {reused}")
+    assert reused == sad and reused is not sad
+
+    # A crisis classification is never reused, even for an issued option
+    service.last_classifications["1_1"] = crisis
+    print(f"3. Tap after a crisis turn: {service._classification_for_issued_option('1_1', '继续分享感受')}")
+    assert service._classification_for_issued_option("1_1", "继续分享感受") is None
+
+    # Only the most recent options are remembered
+    service._register_options("1_1", ["换个话题", "结束对话"])
+    assert list(service.issued_options["1_1"]) == ["给我一些建议", "换个话题", "结束对话"]
+
+    # End to end: a tap skips the classification request unless the last turn was a crisis
+    server = MockLLMServer(config=MockConfig(latency="const:5")).start()
+    try:
+        service = LLMTherapyService()
+        service._retrieve_rag_context = lambda message, user_id: None
+        service.llm = LLMIntegration(api_type="openai", api_key="mock", api_base=server.base_url)
+        classified = []
+        classify = service.llm.classify
+        service.llm.classify = lambda text: classified.append(text) or classify(text)
+
+        result = service.process_message(1, 1, "最近和朋友吵架了，心里很难过")
+        options = service.get_deferred_options(result["options_token"], wait=5)["options"]
+        service.process_message(1, 1, options[0])
+        print(f"4. Classified after a tapped option: {classified}")
+        assert classified == ["最近和朋友吵架了，心里很难过"]
+        assert service.last_classifications["1_1"]["emotion"] == "sad"
+
+        result = service.process_message(1, 1, "我真的不想活了")
+        assert result["requires_followup"] and service.last_classifications["1_1"]["intention"] == "s"
+        service.process_message(1, 1, options[0])
+        print(f"5. Classified after a crisis turn: {classified}")
+        assert classified[-1] == options[0]
+    finally:
+        server.stop()
+
+    print("\n✓ Issued option classification working")
+
+if __name__ == "__main__":
+    test_issued_options()
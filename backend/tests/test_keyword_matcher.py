@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Test the Aho-Corasick keyword matcher and lexicon loading
+"""
+
+import sys
+import os
+import json
+import time
+import tempfile
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.utils.keyword_matcher import KeywordMatcher, get_matcher, load_lexicon, preload_lexicons
+
+def test_keyword_matcher():
+    """Overlapping terms are all found in one pass; lexicons merge from LEXICON_PATH"""
+    print("Testing Keyword Matcher...")
+    print("=" * 50)
+
+    # Overlapping and nested terms are all reported
+    matcher = KeywordMatcher({"a": ["he", "she"], "b": ["hers", "HIS"]})
+    matches = [(m.start, m.keyword, m.category) for m in matcher.find_all("uSHErs and his")]
+    print(f"1. Matches: {matches}")
+    assert matches == [(1, "she", "a"), (2, "he", "a"), (2, "hers", "b"), (11, "his", "b")]
+    assert matcher.matched_categories("she said hers") == {"a": ["she", "he"], "b": ["hers"]}
+    assert matcher.contains("ahis") and matcher.contains("ahis", category="b")
+    assert not matcher.contains("ahis", category="a") and not matcher.contains("")
+
+    # Offsets index the original text even where lowercasing changes its length
+    text = "İstanbul: HIS"
+    match = KeywordMatcher({"b": ["his"]}).find_all(text)[0]
+    assert text[match.start:match.end] == "HIS"
+
+    # Exclusion phrases mask the matches inside them and are never reported
+    masked = KeywordMatcher({"a": ["die"], "_exclude": ["diet"]})
+    assert [m.start for m in masked.find_all("diet, then die")] == [11]
+    assert not masked.contains("a diet") and masked.categories == ["a"] and len(masked) == 1
+
+    # Categories are ranked in the order they were added
+    assert matcher.first_category("hers") == "a"
+    assert matcher.first_category("his") == "b"
+    assert matcher.first_category("nothing", "none") == "none"
+
+    # Bundled lexicons back the existing scanners
+    assert get_matcher("emotion_zh").first_category("今天很开心", "neutral") == "happy"
+    assert get_matcher("tts_tone").first_category("I feel unhappy", "calm") == "gentle"
+    assert get_matcher("crisis").contains("I want to END my life")
+    assert "followup" in preload_lexicons() and get_matcher("crisis") is get_matcher("crisis")
+
+    # Extra lexicon directories add terms to the bundled ones
+    with tempfile.TemporaryDirectory() as extra:
+        with open(os.path.join(extra, "crisis.json"), "w", encoding="utf-8") as f:
+            json.dump({"suicidal": ["想消失", "自杀"], "custom": ["jump off"]}, f, ensure_ascii=False)
+        os.environ["LEXICON_PATH"] = extra
+        try:
+            lexicon = load_lexicon("crisis")
+        finally:
+            del os.environ["LEXICON_PATH"]
+    print(f"2. Merged categories: {list(lexicon)}")
+    assert lexicon["suicidal"].count("自杀") == 1 and lexicon["suicidal"][-1] == "想消失"
+    assert lexicon["custom"] == ["jump off"]
+    assert load_lexicon("no_such_lexicon") == {}
+
+    # Scanning time does not grow with the number of terms
+    large = KeywordMatcher({"term": [f"keyword{i:05d}" for i in range(20000)]})
+    text = "最近工作压力很大，晚上总是睡不着 and keyword01234 appears once " * 20
+    large.contains(text)
+    start = time.perf_counter()
+    for _ in range(100):
+        found = large.find_all(text)
+    elapsed_ms = (time.perf_counter() - start) * 1000 / 100
+    print(f"3. {len(large)} terms, {len(text)} chars: {elapsed_ms:.3f} ms per scan")
+    assert len(found) == 20 and found[0].keyword == "keyword01234"
+    assert elapsed_ms < 20
+
+    print("\n✓ Keyword matcher working")
+
+if __name__ == "__main__":
+    test_keyword_matcher()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Test the API load generator against a minimal fake API
+"""
+
+import sys
+import os
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.tools.load_test import LoadTester, format_report, parse_server_timing, percentile
+
+class FakeAPI(BaseHTTPRequestHandler):
+    """Answers the endpoints the load tester calls, with Server-Timing"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        bodies = {
+            "/api/register": {"success": True, "token": "t"},
+            "/api/login": {"success": True, "userID": 1, "sessionID": 2, "token": "t"},
+            "/api/update_session": {"success": True, "chatbot_response": "ok"},
+            "/api/chat": {"success": self.headers.get("Authorization") == "Bearer t"}
+        }
+        data = json.dumps(bodies[self.path]).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Server-Timing", "generation;dur=12.5, db_commit;dur=1.0, total;dur=14")
+        self.end_headers()
+        self.wfile.write(data)
+
+def test_load_test():
+    """Users log in, converse, and latencies are reported per endpoint and stage"""
+    print("Testing Load Tester...")
+    print("=" * 50)
+
+    assert percentile([5, 1, 4, 2, 3], 50) == 3
+    assert percentile(list(range(1, 101)), 99) == 99
+    assert percentile([], 95) is None
+    assert parse_server_timing("rag;dur=3.5, total;dur=10") == [("rag", 3.5), ("total", 10.0)]
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeAPI)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        tester = LoadTester(f"http://127.0.0.1:{server.server_address[1]}", turns=4, run_id="test")
+        report = tester.run(users=6, concurrency=3)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    print(format_report(report))
+    endpoints = report["endpoints"]
+    assert endpoints["register"]["count"] == 6 and endpoints["login"]["count"] == 6
+    assert endpoints["update_session"]["count"] == 12 and endpoints["chat"]["count"] == 12
+    assert sum(row["errors"] for row in endpoints.values()) == 0
+    assert report["stages"]["generation"]["p95_ms"] == 12.5
+    assert "total" not in report["stages"]
+
+    print("\n✓ Load tester working")
+
+if __name__ == "__main__":
+    test_load_test()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Test training and prediction of the local emotion/crisis classifier
+"""
+
+import sys
+import os
+import csv
+import tempfile
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.models.classifiers import ClassificationModel
+from backend.models.local_classifier import FINE_EMOTIONS, LocalClassifier, train
+from backend.services.llm_therapy_service import LLMTherapyService
+
+# Small labelled fixture in the long form: text, emotion, crisis label
+FIXTURE = {
+    "joy": ["I am so happy today", "what a wonderful day", "I feel great and cheerful",
+            "this makes me so glad", "I am delighted with the news"],
+    "sadness": ["I feel so sad and lonely", "I cried all night", "everything feels hopeless and sad",
+                "I miss her and feel down", "I am heartbroken and sad"],
+    "anger": ["I am furious with my boss", "this makes me so angry", "I hate being treated like this",
+              "I am mad at everyone", "stop yelling, I am angry"],
+    "fear": ["I am scared of the exam", "I feel anxious and afraid", "I am terrified of losing my job",
+             "my heart races with fear", "I am so nervous and scared"]
+}
+
+class RecordingLLM:
+    """Stand-in LLM that records which messages it was asked to classify"""
+
+    def __init__(self, intention):
+        self.intention = intention
+        self.classified = []
+
+    def classify(self, text):
+        self.classified.append(text)
+        return {"emotion": "neutral", "intention": self.intention, "confidence": 0.5}
+
+    def fallback_classify(self, text):
+        return {"emotion": "neutral", "intention": "not_s", "confidence": 0.0}
+
+def test_local_classifier():
+    """A model trained on a fixture CSV predicts its labels; no model means no prediction"""
+    print("Testing Local Classifier...")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Without a trained model, predict() defers to the other paths
+        missing = LocalClassifier(os.path.join(tmp, "missing.joblib"))
+        assert not missing.available and missing.predict("I am so happy today") is None
+        print("1. No model: predict() returns None")
+
+        data_path = os.path.join(tmp, "fixture.csv")
+        with open(data_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["text", "emotion", "intention"])
+            for emotion, texts in FIXTURE.items():
+                for text in texts:
+                    writer.writerow([text, emotion, "not_s"])
+            writer.writerow(["I cannot go on, I want to end it all", "sadness", "s"])
+
+        model_path = os.path.join(tmp, "local_classifier.joblib")
+        report = train(data_path, model_path, holdout=0)
+        print(f"2. Training report: {report}")
+        assert report["samples"] == 21 and report["labels"] == ["anger", "fear", "joy", "sadness"]
+        assert report["crisis_model"]
+
+        classifier = LocalClassifier(model_path, neutral_below=0.0)
+        expected = {"I am so happy and glad": ("joy", "happy"),
+                    "I feel sad and cried": ("sadness", "sad"),
+                    "I am angry and furious": ("anger", "angry"),
+                    "I am scared and afraid": ("fear", "anxious")}
+        for text, (fine_emotion, emotion) in expected.items():
+            prediction = classifier.predict(text)
+            print(f"3. {text!r}: {prediction}")
+            assert prediction["fine_emotion"] == fine_emotion and prediction["emotion"] == emotion
+            assert prediction["fine_emotion"] in FINE_EMOTIONS
+            assert prediction["intention"] == "not_s" and 0 < prediction["confidence"] <= 1
+
+        # Crisis phrases are flagged whatever the model says
+        assert classifier.predict("I want to kill myself")["intention"] == "s"
+
+        # Low-confidence coarse predictions are reported as neutral
+        cautious = LocalClassifier(model_path, neutral_below=1.1)
+        assert cautious.predict("I am so happy and glad")["emotion"] == "neutral"
+
+        # The EmpatheticPersonas wide form has no crisis labels, so no crisis model
+        wide_path = os.path.join(tmp, "personas.csv")
+        with open(wide_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Happy - Utterance", "Sad - Utterance"])
+            writer.writerows(zip(FIXTURE["joy"], FIXTURE["sadness"]))
+        wide_model = os.path.join(tmp, "wide.joblib")
+        assert not train(wide_path, wide_model, holdout=0)["crisis_model"]
+        wide = LocalClassifier(wide_model, neutral_below=0.0)
+        assert wide.available and not wide.has_crisis_model and classifier.has_crisis_model
+
+        # A confident local emotion still leaves the intention to the LLM
+        service = LLMTherapyService()
+        service._retrieve_rag_context = lambda message, user_id: None
+        service.local_confidence = 0.0
+        service.local_classifier = wide
+        service.llm = RecordingLLM("s")
+        message = "I feel worthless and sad, everyone would be better off without me"
+        classification, _, _ = service._run_pregeneration(message, 1)
+        print(f"4. Without a crisis model: {classification}")
+        assert service.llm.classified == [message]
+        assert classification["intention"] == "s" and classification["fine_emotion"] == "sadness"
+
+        # With a trained crisis model the confident local result is used whole
+        service.local_classifier = classifier
+        service.llm = RecordingLLM("s")
+        classification, _, _ = service._run_pregeneration("I am so happy and glad", 1)
+        print(f"5. With a crisis model: {classification}")
+        assert service.llm.classified == [] and classification["intention"] == "not_s"
+
+        # The rule-based flow takes emotions from the local model, intent from the LLM
+        rule_based = ClassificationModel()
+        rule_based.local_classifier = classifier
+        rule_based.llm_integration = RecordingLLM("s")
+        assert rule_based.get_classification("I feel sad and cried", "emo") == "sadness"
+        assert rule_based.get_classification("I feel sad and cried", "s") == "s"
+        assert rule_based.llm_integration.classified == ["I feel sad and cried"]
+
+    print("\n✓ Local classifier working")
+
+if __name__ == "__main__":
+    test_local_classifier()
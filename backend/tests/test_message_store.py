@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Test the write-behind message store
+"""
+
+import sys
+import os
+import time
+import threading
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.services.message_store import MessageStore, to_timestamp
+
+class InMemoryMessageStore(MessageStore):
+    """Message store writing batches to a list instead of the database"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.rows = []
+        self.batches = []
+        self.gate = threading.Event()
+        self.gate.set()
+        self.bad_sessions = set()
+        self.init_app(app=object(), db=None)
+
+    def _write_batch(self, rows):
+        self.gate.wait()
+        # Like a foreign key violation, one bad row fails the whole insert
+        if any(row["session_id"] in self.bad_sessions for row in rows):
+            raise ValueError("foreign key constraint failed")
+        self.batches.append(len(rows))
+        self.rows.extend(rows)
+
+    def _query_recent(self, user_id, session_id, limit, roles):
+        matching = [dict(row) for row in self.rows
+                    if row["user_id"] == user_id and row["session_id"] == session_id
+                    and row["role"] in roles]
+        return matching[-limit:]
+
+def test_message_store():
+    """Messages are written in batches by size or age, and readable before they are written"""
+    print("Testing Message Store...")
+    print("=" * 50)
+
+    # A full batch is written without waiting for the flush interval
+    store = InMemoryMessageStore(batch_size=4, flush_interval=10.0)
+    for i in range(4):
+        assert store.append(1, 1, "user", f"message {i}")
+    deadline = time.monotonic() + 2
+    while not store.rows and time.monotonic() < deadline:
+        time.sleep(0.01)
+    print(f"1. Size-triggered batches: {store.batches}")
+    assert store.batches == [4]
+
+    # A partial batch is written once the oldest message is flush_interval old
+    store = InMemoryMessageStore(batch_size=100, flush_interval=0.1)
+    store.append(1, 1, "user", "我最近睡不好")
+    store.append(1, 1, "assistant", "能多说说吗？")
+    time.sleep(0.4)
+    print(f"2. Interval-triggered batches: {store.batches}")
+    assert store.batches == [2]
+    assert to_timestamp(store.rows[0]["created_at"]) > time.time() - 5
+
+    # Unwritten messages are merged into reads; a full queue drops new messages
+    store = InMemoryMessageStore(batch_size=100, flush_interval=10.0, max_pending=3)
+    store.gate.clear()
+    store.append(2, 5, "user", "a", timestamp=1.0)
+    store.append(2, 5, "assistant", "b", timestamp=2.0)
+    store.append(3, 5, "user", "other user", timestamp=3.0)
+    assert not store.append(2, 5, "user", "c", timestamp=4.0)
+    recent = store.recent(2, 5, limit=10)
+    print(f"3. Recent before write: {[row['content'] for row in recent]}")
+    assert [row["content"] for row in recent] == ["a", "b"]
+
+    store.gate.set()
+    assert store.flush(timeout=2)
+    assert [row["content"] for row in store.recent(2, 5, limit=1)] == ["b"]
+
+    # Sessions without numeric ids are not persisted
+    assert not store.append("guest", 5, "user", "hi")
+    stats = store.get_stats()
+    print(f"4. Stats: {stats}")
+    assert stats == {"queued": 3, "written": 3, "batches": 1, "dropped": 1, "failed": 0, "pending": 0}
+
+    store.close()
+    assert not store._thread.is_alive()
+
+    # A batch that keeps failing is retried row by row; only the bad row is lost
+    store = InMemoryMessageStore(batch_size=100, flush_interval=10.0, max_retries=1)
+    store.bad_sessions.add(99)
+    store.append(4, 1, "user", "fine")
+    store.append(4, 99, "user", "bad session")
+    store.append(5, 1, "user", "also fine")
+    assert store.flush(timeout=2)
+    stats = store.get_stats()
+    print(f"5. After a bad row: {[row['content'] for row in store.rows]} {stats}")
+    assert [row["content"] for row in store.rows] == ["fine", "also fine"]
+    assert stats["written"] == 2 and stats["failed"] == 1
+    store.close()
+
+    print("\n✓ Message store working")
+
+if __name__ == "__main__":
+    test_message_store()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Test the mock OpenAI-compatible LLM server
+"""
+
+import sys
+import os
+import json
+import urllib.error
+import urllib.request
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.tools.mock_llm import MockConfig, MockLLMServer
+
+def _post(url, payload):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=5) as response:
+        return response.read().decode("utf-8")
+
+def test_mock_llm():
+    """Deterministic chat, streaming and embeddings, plus injected 429s"""
+    print("Testing Mock LLM Server...")
+    print("=" * 50)
+
+    server = MockLLMServer(config=MockConfig(seed=1)).start()
+    try:
+        base = server.base_url
+        chat = {"model": "gpt-3.5-turbo", "messages": [
+            {"role": "system", "content": "你是一个富有同理心的治疗型AI助手"},
+            {"role": "user", "content": "我最近压力很大"}
+        ]}
+
+        first = json.loads(_post(f"{base}/chat/completions", chat))
+        second = json.loads(_post(f"{base}/chat/completions", chat))
+        content = first["choices"][0]["message"]["content"]
+        print(f"1. Chat reply: {content}")
+        assert content and content == second["choices"][0]["message"]["content"]
+        assert first["usage"]["total_tokens"] > 0
+
+        classify = dict(chat, response_format={"type": "json_object"},
+                        messages=[{"role": "user", "content": "我很焦虑，不想活了"}])
+        result = json.loads(json.loads(_post(f"{base}/chat/completions", classify))["choices"][0]["message"]["content"])
+        print(f"2. Classification: {result}")
+        assert result["emotion"] == "anxious" and result["intention"] == "s"
+
+        stream = _post(f"{base}/chat/completions", dict(chat, stream=True))
+        events = [line[len("data: "):] for line in stream.splitlines() if line.startswith("data: ")]
+        assert events[-1] == "[DONE]"
+        streamed = "".join(json.loads(event)["choices"][0]["delta"]["content"] for event in events[:-1])
+        print(f"3. Streamed {len(events) - 1} chunks")
+        assert streamed == content
+
+        embeddings = json.loads(_post(f"{base}/embeddings", {"input": ["你好", "你好"]}))["data"]
+        assert len(embeddings) == 2 and embeddings[0]["embedding"] == embeddings[1]["embedding"]
+        assert abs(sum(v * v for v in embeddings[0]["embedding"]) - 1) < 1e-3
+
+        server.config.rate_limit_rate = 1.0
+        server.config.retry_after = 2
+        try:
+            _post(f"{base}/chat/completions", chat)
+            assert False, "expected 429"
+        except urllib.error.HTTPError as e:
+            print(f"4. Injected {e.code} with Retry-After {e.headers['Retry-After']}")
+            assert e.code == 429 and e.headers["Retry-After"] == "2"
+
+        stats = server.config.stats
+        print(f"5. Stats: {stats}")
+        assert stats["chat"] == 3 and stats["stream"] == 1 and stats["rate_limited"] == 1
+    finally:
+        server.stop()
+
+    print("\n✓ Mock LLM server working")
+
+if __name__ == "__main__":
+    test_mock_llm()
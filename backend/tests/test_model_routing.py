@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Test per-task model routing configuration
+"""
+
+import sys
+import os
+import json
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.utils.model_routing import DEFAULT_MODEL, TASKS, load_task_routes
+
+ROUTING_ENV = {
+    "LLM_FAST_MODEL": "small-model",
+    "LLM_STRONG_MODEL": "large-model",
+    "LLM_TASK_ROUTES": json.dumps({
+        "classify": {"max_tokens": 40, "timeout": 3, "endpoint": "fast"},
+        "reply": {"timeout": 20, "endpoint": ["primary", "backup"]},
+        "unknown": {"model": "ignored"}
+    }),
+    "LLM_OPTIONS_MODEL": "options-model",
+    "LLM_OPTIONS_MAX_TOKENS": "120",
+    "LLM_SUMMARY_TIMEOUT": "not-a-number"
+}
+
+def test_model_routing():
+    """Tier models, JSON routes and per-task variables are layered per task"""
+    print("Testing Model Routing...")
+    print("=" * 50)
+
+    # Without configuration every task keeps the previous behaviour
+    routes = load_task_routes()
+    assert set(routes) == set(TASKS)
+    assert all(route.model is None and route.request_model == DEFAULT_MODEL for route in routes.values())
+    assert routes["reply"].allows("primary") and not routes["reply"].allows("fast", dedicated=True)
+
+    saved = {name: os.environ.get(name) for name in ROUTING_ENV}
+    os.environ.update(ROUTING_ENV)
+    try:
+        routes = load_task_routes()
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+    for task in TASKS:
+        print(f"1. {task}: {routes[task]}")
+
+    # Short tasks use the fast tier, replies the strong one
+    classify = routes["classify"]
+    assert classify.model == "small-model" and classify.max_tokens == 40 and classify.timeout == 3.0
+    assert classify.allows("fast", dedicated=True) and not classify.allows("primary")
+    assert routes["ultra_think"].model == "large-model" and routes["crisis"].model == "large-model"
+    assert routes["reply"].endpoints == ("primary", "backup") and routes["reply"].timeout == 20.0
+
+    # Per-task variables win; invalid values are skipped, not fatal
+    assert routes["options"].model == "options-model" and routes["options"].max_tokens == 120
+    assert routes["summary"].model == "small-model" and routes["summary"].timeout is None
+    assert routes["options"].timeout is None
+
+    # Malformed JSON falls back to the remaining layers
+    os.environ["LLM_TASK_ROUTES"] = "{not json"
+    try:
+        assert load_task_routes()["classify"].max_tokens is None
+    finally:
+        del os.environ["LLM_TASK_ROUTES"]
+
+    print("\n✓ Model routing working")
+
+if __name__ == "__main__":
+    test_model_routing()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Test token counting and token-budgeted prompt assembly
+"""
+
+import sys
+import os
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.utils.prompt_budget import PromptBudget, PromptSection, TokenCounter
+
+def test_prompt_budget():
+    """Sections fill in priority order, drop whole units and respect caps"""
+    print("Testing Prompt Budget...")
+    print("=" * 50)
+
+    counter = TokenCounter()
+    assert counter.count("") == 0
+    assert counter.count("Hello world") == 2
+    print(f"1. Tokenizer backend: {counter.backend}, "
+          f"'我今天很难过' = {counter.count('我今天很难过')} tokens")
+
+    history = [f"User: message number {i}" for i in range(20)]
+    sections = [
+        PromptSection("history", history, priority=0, max_tokens=30, keep="newest"),
+        PromptSection("rag", ["relevant knowledge " * 200], priority=1, max_tokens=40),
+        PromptSection("memory", ["an old note", "another old note"], priority=2)
+    ]
+
+    def render(history, rag, memory):
+        return f"SYSTEM PROMPT\n{history}\n{rag}\n{memory}"
+
+    prompt, report = PromptBudget(100, counter).assemble(render, sections)
+    print(f"2. Report: {report}")
+
+    # History keeps the newest messages, in order, within its cap
+    assert "message number 19" in prompt
+    assert "message number 0\n" not in prompt
+    assert report["sections"]["history"] <= 30
+    # The single oversized RAG unit is truncated to its cap
+    assert 0 < report["sections"]["rag"] <= 40
+    # Memory gets what is left of the budget
+    assert report["sections"]["memory"] <= 100 - report["fixed_tokens"] - 30 - 40
+    assert report["prompt_tokens"] <= 100 + 5
+
+    # A tight budget starves the lowest-priority sections first
+    _, tight = PromptBudget(35, counter).assemble(render, sections)
+    print(f"3. Tight report: {tight}")
+    assert tight["sections"]["memory"] == 0
+    assert tight["sections"]["history"] > 0
+
+    print("\n✓ Prompt budget working")
+
+if __name__ == "__main__":
+    test_prompt_budget()
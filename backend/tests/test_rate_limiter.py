@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Test the client-side token-bucket rate limiter for the LLM provider
+"""
+
+import sys
+import os
+import tempfile
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.utils.rate_limiter import RateLimiter, SQLiteRateLimiter, parse_retry_after
+
+def test_rate_limiter():
+    """Bursts are queued within the bound, rejected beyond it, and paused by Retry-After"""
+    print("Testing Token-Bucket Rate Limiter...")
+    print("=" * 50)
+
+    # 60 RPM with a 2 second burst: two requests pass, the third waits ~1s
+    limiter = RateLimiter(requests_per_minute=60, max_wait=1.5, burst_seconds=2)
+    assert limiter.reserve() == 0
+    assert limiter.reserve() == 0
+    wait = limiter.reserve()
+    assert 0.9 < wait <= 1.0
+    # The fourth would wait ~2s, beyond the bound, and reserves nothing
+    assert limiter.reserve() is None
+    assert 0.9 < limiter.reserve(max_wait=3) - 1.0 <= 1.0
+    print(f"1. Stats after burst: {limiter.get_stats()}")
+    assert limiter.get_stats()["rejected"] == 1
+
+    # Token bucket: 600 TPM, 10s burst = 100 tokens
+    tokens = RateLimiter(tokens_per_minute=600, max_wait=0.5, burst_seconds=10)
+    assert tokens.reserve(tokens=80) == 0
+    assert tokens.reserve(tokens=80) is None
+    tokens.adjust_tokens(-60)  # the first request used only 20 tokens
+    assert tokens.reserve(tokens=80) == 0
+
+    # Retry-After holds back callers even with no limits configured
+    unlimited = RateLimiter(max_wait=5)
+    assert unlimited.reserve() == 0
+    unlimited.pause(parse_retry_after("2"))
+    assert 1.9 < unlimited.reserve() <= 2.0
+    assert unlimited.reserve(max_wait=1) is None
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after("soon") is None
+    print(f"2. Stats after Retry-After: {unlimited.get_stats()}")
+
+    # The SQLite variant shares buckets between limiter instances (workers)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "limits.db")
+        worker_a = SQLiteRateLimiter(path, requests_per_minute=60, max_wait=0, burst_seconds=2)
+        worker_b = SQLiteRateLimiter(path, requests_per_minute=60, max_wait=0, burst_seconds=2)
+        assert worker_a.reserve() == 0
+        assert worker_b.reserve() == 0
+        assert worker_a.reserve() is None
+        assert worker_b.reserve() is None
+    print("3. SQLite buckets shared across instances")
+
+    print("\n✓ Rate limiter working")
+
+if __name__ == "__main__":
+    test_rate_limiter()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Test the bounded session-history store
+"""
+
+import sys
+import os
+import time
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.services.session_store import ChatMessage, SessionStore
+
+def test_session_store():
+    """Histories are capped, idle and surplus sessions evicted and rehydrated on access"""
+    print("Testing Session Store...")
+    print("=" * 50)
+
+    stored = {"1_1": [ChatMessage("user", "我最近睡不好", 0.0), ChatMessage("assistant", "能多说说吗？", 1.0)]}
+    evicted = []
+    store = SessionStore(max_entries=2, ttl_seconds=0.2, max_messages=4,
+                         loader=lambda key: stored.get(key), on_evict=evicted.append)
+
+    # Messages beyond max_messages drop the oldest
+    for i in range(6):
+        store.append("2_1", "user", f"message {i}")
+    history = store.history("2_1")
+    print(f"1. Capped history: {[msg.content for msg in history]}")
+    assert [msg.content for msg in history] == ["message 2", "message 3", "message 4", "message 5"]
+    assert history[0].to_dict()["role"] == "user"
+
+    # An unknown session is rehydrated through the loader
+    store.append("1_1", "user", "还是很累")
+    assert [msg.role for msg in store.history("1_1")] == ["user", "assistant", "user"]
+
+    # A third session evicts the least recently used one
+    store.reset("3_1")
+    print(f"2. Evicted: {evicted}")
+    assert evicted == ["2_1"] and "2_1" not in store and "1_1" in store
+
+    # Idle sessions expire
+    time.sleep(0.25)
+    store.history("4_1")
+    assert "1_1" not in store and "3_1" not in store
+    print(f"3. Evicted after expiry: {evicted}")
+    assert sorted(evicted[1:]) == ["1_1", "3_1"]
+
+    # A session that expires when it is read is reported too
+    del evicted[:]
+    time.sleep(0.25)
+    store.history("4_1")
+    assert evicted == ["4_1"]
+
+    stats = store.get_stats()
+    print(f"4. Stats: {stats}")
+    assert stats["rehydrated"] == 1 and stats["evicted_lru"] == 1 and stats["evicted_ttl"] == 3
+    assert stats["sessions"] == 1 and stats["messages"] == 0
+
+    print("\n✓ Session store working")
+
+if __name__ == "__main__":
+    test_session_store()
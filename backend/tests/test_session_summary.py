@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Test the rolling session summary
+"""
+
+import sys
+import os
+import time
+import threading
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.services.session_store import SessionStore
+from backend.services.session_summary import RollingSummarizer
+from backend.utils.state_backend import CachedStateBackend, InMemoryStateBackend
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+def test_session_summary():
+    """Trimmed turns are folded every few turns; the summary survives eviction"""
+    print("Testing Session Summary...")
+    print("=" * 50)
+
+    calls = []
+    saved = {}
+    entered, release = threading.Event(), threading.Event()
+    release.set()
+
+    def summarize(summary, messages):
+        entered.set()
+        release.wait()
+        calls.append(len(messages))
+        return "|".join(filter(None, [summary] + [msg.content for msg in messages]))
+
+    summarizer = RollingSummarizer(summarize, CachedStateBackend(InMemoryStateBackend()),
+                                   every_turns=2, loader=saved.get, on_fold=saved.__setitem__)
+    store = SessionStore(max_messages=4, on_trim=summarizer.add)
+
+    # The first 2 turns fill the window; nothing is trimmed yet
+    for i in range(2):
+        store.append("1_1", "user", f"u{i}")
+        store.append("1_1", "assistant", f"a{i}")
+    assert summarizer.get("1_1") == ("", [])
+
+    # Trimmed messages are pending until 2 turns (4 messages) accumulate
+    store.append("1_1", "user", "u2")
+    store.append("1_1", "assistant", "a2")
+    summary, pending = summarizer.get("1_1")
+    print(f"1. Pending after 3 turns: {[msg.content for msg in pending]}")
+    assert summary == "" and [msg.content for msg in pending] == ["u0", "a0"]
+
+    # A fold running in the background keeps later trims pending
+    release.clear()
+    store.append("1_1", "user", "u3")
+    store.append("1_1", "assistant", "a3")
+    assert entered.wait(2)
+    store.append("1_1", "user", "u4")
+    release.set()
+    assert wait_for(lambda: summarizer.get_stats()["folds"] == 1)
+    summary, pending = summarizer.get("1_1")
+    print(f"2. Summary: {summary!r}, pending: {[msg.content for msg in pending]}")
+    assert summary == "u0|a0|u1|a1"
+    assert [msg.content for msg in pending] == ["u2"]
+    assert saved["1_1"] == summary and calls == [4]
+
+    # A session without a record starts from the stored summary
+    summarizer.forget("1_1")
+    assert summarizer.get("1_1") == ("u0|a0|u1|a1", [])
+
+    # Failed folds keep the messages pending
+    failing = RollingSummarizer(lambda summary, messages: "", CachedStateBackend(InMemoryStateBackend()),
+                                every_turns=1)
+    failing.add("2_1", list(store.history("1_1"))[:2])
+    assert wait_for(lambda: failing.get_stats()["fold_failures"] == 1)
+    assert len(failing.get("2_1")[1]) == 2
+
+    stats = summarizer.get_stats()
+    print(f"3. Stats: {stats}")
+    assert stats["folded_messages"] == 4 and stats["fold_failures"] == 0
+
+    print("\n✓ Session summary working")
+
+if __name__ == "__main__":
+    test_session_summary()
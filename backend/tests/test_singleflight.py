@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Test single-flight coalescing of identical in-flight LLM requests
+"""
+
+import sys
+import os
+import threading
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.utils.singleflight import SingleFlight
+
+def test_singleflight():
+    """Concurrent callers with one key share a single execution"""
+    print("Testing Single-Flight Coalescing...")
+    print("=" * 50)
+
+    group = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    executions = []
+
+    def greeting():
+        executions.append(1)
+        started.set()
+        release.wait(5)
+        return {"choices": [{"message": {"content": "你好"}}]}
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(group.do("greeting", greeting)))
+    leader.start()
+    started.wait(5)
+
+    followers = [
+        threading.Thread(target=lambda: results.append(group.do("greeting", greeting)))
+        for _ in range(4)
+    ]
+    for thread in followers:
+        thread.start()
+    while group.get_stats()["deduplicated"] < 4:
+        pass
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+
+    print(f"1. Stats after 5 concurrent calls: {group.get_stats()}")
+    assert len(executions) == 1
+    assert len(results) == 5
+    assert sorted(shared for _, shared in results) == [False, True, True, True, True]
+    assert group.get_stats()["in_flight"] == 0
+
+    # Followers give up at their own timeout, and errors reach every caller
+    release.clear()
+    started.clear()
+    leader = threading.Thread(target=lambda: group.do("greeting", greeting))
+    leader.start()
+    started.wait(5)
+    try:
+        group.do("greeting", greeting, timeout=0.01)
+        assert False, "follower should time out"
+    except TimeoutError:
+        pass
+    release.set()
+    leader.join(5)
+
+    def failing():
+        raise ValueError("boom")
+    try:
+        group.do("broken", failing)
+        assert False, "error should propagate"
+    except ValueError:
+        pass
+
+    stats = group.get_stats()
+    print(f"2. Stats after timeout and error: {stats}")
+    assert stats["wait_timeouts"] == 1
+    assert stats["executions"] == 3
+
+    print("\n✓ Single-flight coalescing working")
+
+if __name__ == "__main__":
+    test_singleflight()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Test streamed replies: SSE parsing in the LLM client and /api/chat/stream events
+"""
+
+import sys
+import os
+import json
+import tempfile
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend import create_app, db
+from backend.models.llm_integration import FALLBACK_RESPONSES, LLMIntegration
+from backend.services.llm_therapy_service import therapy_service
+from backend.tools.mock_llm import MockConfig, MockLLMServer, chat_content
+from backend.utils.config import Config
+
+def parse_events(body):
+    """(event, data) pairs of a Server-Sent Events body"""
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+def test_stream_parsing():
+    """Chunks are joined up to [DONE]; bad lines are skipped; a broken stream ends cleanly"""
+    print("Testing Stream Parsing...")
+    print("=" * 50)
+
+    server = MockLLMServer(config=MockConfig(latency="const:5")).start()
+    try:
+        llm = LLMIntegration(api_type="openai", api_key="mock", api_base=server.base_url)
+        breaker = llm.endpoints[0].circuit_breaker
+        payload = {"model": "gpt-3.5-turbo", "messages": [
+            {"role": "system", "content": "你是一个富有同理心的治疗型AI助手"},
+            {"role": "user", "content": "我最近压力很大"}
+        ]}
+        expected = chat_content(payload)
+
+        # Deltas are yielded in order and the stream ends at data: [DONE]
+        deltas = list(llm._call_api_stream("/chat/completions", payload))
+        print(f"1. {len(deltas)} deltas: {''.join(deltas)}")
+        assert len(deltas) > 1 and "".join(deltas) == expected
+
+        # Comments, malformed JSON and error objects without choices are skipped
+        server.config.stream_noise = True
+        deltas = list(llm._call_api_stream("/chat/completions", payload))
+        print(f"2. With malformed lines: {''.join(deltas)}")
+        assert "".join(deltas) == expected
+        assert breaker.get_stats()["consecutive_failures"] == 0
+
+        # A stream dropped mid-reply ends without raising and counts as a failure
+        server.config.stream_cut_after = 2
+        deltas = list(llm._call_api_stream("/chat/completions", payload))
+        print(f"3. Cut after 2 chunks: {deltas}, breaker {breaker.get_stats()}")
+        assert "".join(deltas) == expected[:8]
+        assert breaker.get_stats()["consecutive_failures"] == 1
+
+        # The partial reply is kept rather than replaced with a fallback
+        pieces = list(llm.generate_response_stream("我最近压力很大", max_length=50))
+        assert pieces and "".join(pieces) not in FALLBACK_RESPONSES
+
+        # A stream that fails before any content yields one fallback reply
+        server.config.stream_cut_after = 0
+        server.config.error_rate = 1.0
+        pieces = list(llm.generate_response_stream("我最近压力很大", max_length=50))
+        print(f"4. Failed stream: {pieces}")
+        assert len(pieces) == 1 and pieces[0] in FALLBACK_RESPONSES
+    finally:
+        server.stop()
+
+    print("\n✓ Stream parsing working")
+
+def test_chat_stream_endpoint():
+    """/api/chat/stream sends tokens, then done, then the deferred options or crisis follow-up"""
+    print("Testing Chat Stream Endpoint...")
+    print("=" * 50)
+
+    server = MockLLMServer(config=MockConfig(latency="const:5")).start()
+    database_uri = Config.SQLALCHEMY_DATABASE_URI
+    llm = therapy_service.llm
+    Config.SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "app.db")
+    try:
+        app = create_app()
+        therapy_service.llm = LLMIntegration(api_type="openai", api_key="mock", api_base=server.base_url)
+        with app.app_context():
+            from backend.database.models import User
+            db.create_all()
+            user = User(username="stream_tester", email="stream@example.com")
+            db.session.add(user)
+            db.session.commit()
+            headers = {"Authorization": f"Bearer {user.generate_auth_token()}"}
+
+        client = app.test_client()
+
+        def stream(message):
+            response = client.post("/api/chat/stream", headers=headers,
+                                   json={"message": message, "session_id": 3})
+            assert response.status_code == 200 and response.mimetype == "text/event-stream"
+            return parse_events(response.get_data(as_text=True))
+
+        # Reply tokens, the done event with fallback options, then the LLM options
+        events = stream("我最近工作压力很大")
+        names = [name for name, _ in events]
+        print(f"1. Events: {names}")
+        assert names[-2:] == ["done", "options"] and set(names[:-2]) == {"token"}
+        done = events[-2][1]
+        assert done["success"] and done["options_token"] and done["user_id"]
+        assert "".join(data["delta"] for _, data in events[:-2]) == done["response"]
+        assert events[-1][1]["options"] and events[-1][1]["options"] != done["options"]
+
+        # Crisis turns send the safety reply, then the personalized follow-up
+        events = stream("我真的不想活了")
+        names = [name for name, _ in events]
+        print(f"2. Crisis events: {names}")
+        assert names == ["token", "done", "followup"]
+        assert events[1][1]["requires_followup"] and events[2][1]["response"]
+
+        # Missing message is rejected before streaming
+        response = client.post("/api/chat/stream", headers=headers, json={"session_id": 3})
+        assert response.status_code == 400
+    finally:
+        therapy_service.llm = llm
+        Config.SQLALCHEMY_DATABASE_URI = database_uri
+        server.stop()
+
+    print("\n✓ Chat stream endpoint working")
+
+if __name__ == "__main__":
+    test_stream_parsing()
+    test_chat_stream_endpoint()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Test the bounded UltraThink pool and the per-session UltraThink toggle
+"""
+
+import sys
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend import create_app, db
+from backend.models.llm_integration import LLMIntegration, llm_deadline
+from backend.services.llm_therapy_service import LLMTherapyService, therapy_service
+from backend.tools.mock_llm import MockConfig, MockLLMServer
+from backend.utils.config import Config
+
+def slot_free(service):
+    """Whether the UltraThink pool has a free slot (without taking it)"""
+    if not service._ultra_think_slots.acquire(blocking=False):
+        return False
+    service._ultra_think_slots.release()
+    return True
+
+def test_ultra_think_pool():
+    """The pool admits up to its bound, rejects beyond it and always frees slots"""
+    print("Testing UltraThink Pool...")
+    print("=" * 50)
+
+    server = MockLLMServer(config=MockConfig(latency="const:5")).start()
+    try:
+        service = LLMTherapyService()
+        service._retrieve_rag_context = lambda message, user_id: None
+        service.llm = LLMIntegration(api_type="openai", api_key="mock", api_base=server.base_url)
+        service._ultra_think_slots = threading.BoundedSemaphore(1)
+
+        # One slot: the first task is admitted, the next one rejected
+        release = threading.Event()
+        busy = service._submit_ultra_think(release.wait, 5)
+        assert busy is not None and not slot_free(service)
+        assert service._submit_ultra_think(release.wait, 5) is None
+        print(f"1. Saturated pool: {service.ultra_think_stats}")
+        assert service.ultra_think_stats["admitted"] == 1
+        assert service.ultra_think_stats["rejected"] == 1
+
+        # A rejected UltraThink turn is answered with a standard reply
+        result = service.process_message(1, 1, "我想好好想想我的未来", ultra_think=True)
+        print(f"2. Turn while saturated: ultra_think={result['ultra_think']}, response={result['response'][:20]}")
+        assert not result["ultra_think"] and result["response"]
+        assert service.is_ultra_think_mode(1, 1)
+        release.set()
+        busy.result(timeout=5)
+        assert slot_free(service)
+
+        # An admitted turn runs on the pool and frees its slot afterwards
+        result = service.process_message(1, 1, "我还是想再想想")
+        assert result["ultra_think"] and service.ultra_think_stats["admitted"] == 2
+        assert slot_free(service) and service.ultra_think_stats["active"] == 0
+
+        # Every exit path frees the slot: a task that raises...
+        def fail():
+            raise RuntimeError("boom")
+        failed = service._submit_ultra_think(fail)
+        assert isinstance(failed.exception(timeout=5), RuntimeError)
+        assert slot_free(service)
+
+        # ...a reply abandoned at the turn deadline, once it finishes...
+        release = threading.Event()
+        service._generate_reply_now = lambda turn: release.wait(5) and "late"
+        turn = {"ultra_think": True, "session_key": "1_1"}
+        with llm_deadline(0.1):
+            assert service._generate_reply(turn) is None
+        assert not slot_free(service)
+        release.set()
+        service._ultra_think_executor.submit(lambda: None).result(timeout=5)
+        assert slot_free(service)
+
+        # ...a stream that stalls past the idle timeout, once it finishes...
+        release = threading.Event()
+        service.ultra_think_stream_idle = 0.1
+        service.llm.generate_response_stream = lambda *args, **kwargs: iter([release.wait(5) and "late"])
+        service._build_turn_prompt = lambda turn: ""
+        assert list(service._stream_reply({"ultra_think": True, "session_key": "1_1"})) == []
+        release.set()
+        service._ultra_think_executor.submit(lambda: None).result(timeout=5)
+        assert slot_free(service)
+
+        # ...and a submit the executor refuses
+        service._ultra_think_executor = ThreadPoolExecutor(max_workers=1)
+        service._ultra_think_executor.shutdown()
+        try:
+            service._submit_ultra_think(fail)
+            assert False, "submit to a shut-down pool should raise"
+        except RuntimeError:
+            pass
+        print(f"3. After every exit path: {service.ultra_think_stats}")
+        assert slot_free(service) and service.ultra_think_stats["active"] == 0
+    finally:
+        server.stop()
+
+    print("\n✓ UltraThink pool working")
+
+def test_ultra_think_toggle():
+    """ultra_think on /api/update_session and /api/chat switches the session mode"""
+    print("Testing UltraThink Toggle...")
+    print("=" * 50)
+
+    server = MockLLMServer(config=MockConfig(latency="const:5")).start()
+    database_uri = Config.SQLALCHEMY_DATABASE_URI
+    llm = therapy_service.llm
+    tmpdir = tempfile.mkdtemp()
+    Config.SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(tmpdir, "app.db")
+    try:
+        app = create_app()
+        therapy_service.llm = LLMIntegration(api_type="openai", api_key="mock", api_base=server.base_url)
+        with app.app_context():
+            from backend.database.models import User, UserModelSession
+            db.create_all()
+            user = User(username="ultra_think_tester", email="ultra@example.com")
+            db.session.add(user)
+            db.session.commit()
+            session = UserModelSession(user_id=user.id)
+            db.session.add(session)
+            db.session.commit()
+            user_id, session_id = user.id, session.id
+            token = user.generate_auth_token()
+
+        client = app.test_client()
+
+        def update_session(message, ultra_think=None):
+            choice_info = {"user_id": user_id, "session_id": session_id, "user_choice": message}
+            if ultra_think is not None:
+                choice_info["ultra_think"] = ultra_think
+            return client.post("/api/update_session", json={"choice_info": choice_info}).get_json()
+
+        # update_session: "true" switches the session on, absent leaves it as is
+        data = update_session("我想深入聊聊我的焦虑", "true")
+        print(f"1. update_session ultra_think=true: {data['ultra_think']}")
+        assert data["success"] and data["ultra_think"]
+        assert therapy_service.is_ultra_think_mode(user_id, session_id)
+        assert update_session("继续")["ultra_think"]
+        data = update_session("简单聊聊就好", False)
+        print(f"2. update_session ultra_think=false: {data['ultra_think']}")
+        assert not data["ultra_think"] and not therapy_service.is_ultra_think_mode(user_id, session_id)
+
+        # chat: the token's user and the given session are switched
+        headers = {"Authorization": f"Bearer {token}"}
+        data = client.post("/api/chat", headers=headers,
+                           json={"message": "帮我想想", "session_id": 7, "ultra_think": "on"}).get_json()
+        print(f"3. chat ultra_think=on: {data['ultra_think']}")
+        assert data["success"] and data["ultra_think"]
+        assert therapy_service.is_ultra_think_mode(user_id, 7)
+        assert not therapy_service.is_ultra_think_mode(user_id, session_id)
+        data = client.post("/api/chat", headers=headers,
+                           json={"message": "好的", "session_id": 7, "ultra_think": "0"}).get_json()
+        assert not data["ultra_think"] and not therapy_service.is_ultra_think_mode(user_id, 7)
+    finally:
+        therapy_service.llm = llm
+        Config.SQLALCHEMY_DATABASE_URI = database_uri
+        server.stop()
+
+    print("\n✓ UltraThink toggle working")
+
+if __name__ == "__main__":
+    test_ultra_think_pool()
+    test_ultra_think_toggle()
@@ -0,0 +1,300 @@
+"""
+Microbenchmarks for the pure-Python hot paths, with baseline comparison.
+
+Each benchmark runs at several data sizes, so per-size timings and the
+growth exponent between sizes (1.0 = linear, 2.0 = quadratic) show
+scaling cliffs before production data does. Results are written as JSON
+and can be compared with a stored baseline:
+
+    python -m backend.tools.benchmarks --json-out bench.json
+    python -m backend.tools.benchmarks --save-baseline backend/tools/bench_baseline.json
+    python -m backend.tools.benchmarks --baseline backend/tools/bench_baseline.json --threshold 1.25
+
+Comparison exits non-zero when any benchmark's median is slower than the
+baseline by more than the threshold ratio. Baselines are machine
+specific: record them on the machine that will run the comparison.
+Benchmarks whose dependencies (scikit-learn, fuzzywuzzy, pandas) are not
+installed are reported as skipped.
+"""
+
+import sys
+import json
+import math
+import time
+import random
+import platform
+import argparse
+import statistics
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+from unittest import mock
+
+WORDS = [
+    "work", "stress", "sleep", "family", "friend", "lonely", "anxious", "happy", "sad", "exam",
+    "today", "feel", "tired", "hope", "talk", "help", "angry", "worried", "calm", "future",
+    "工作", "压力", "睡眠", "家人", "朋友", "孤独", "焦虑", "开心", "难过", "考试"
+]
+
+# name -> (sizes, setup); setup(size) prepares data and returns the callable to time
+BENCHMARKS: Dict[str, Dict[str, Any]] = {}
+
+
+def benchmark(name: str, sizes: List[int]):
+    """Register a benchmark; the decorated setup function takes a size and returns a zero-argument callable"""
+    def register(setup: Callable[[int], Callable[[], Any]]):
+        BENCHMARKS[name] = {"sizes": list(sizes), "setup": setup}
+        return setup
+    return register
+
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+@benchmark("memory.retrieve_memories", sizes=[100, 1000, 10000])
+def bench_retrieve_memories(size: int):
+    from backend.services.memory_integration import LocalMemoryStorage
+    rng = random.Random(size)
+    storage = LocalMemoryStorage()
+    for _ in range(size):
+        storage.store_memory({"user_id": "u1", "content": _text(rng, 30)})
+    query = "I feel stress about work and sleep"
+    return lambda: storage.retrieve_memories("u1", query, top_k=5)
+
+
+@benchmark("rag.build_index", sizes=[100, 1000, 5000])
+def bench_build_index(size: int):
+    from backend.models.rag_system import VectorStore
+    rng = random.Random(size)
+    texts = [_text(rng, 40) for _ in range(size)]
+
+    def run():
+        store = VectorStore()
+        store.documents = list(texts)
+        store.metadata = [{"doc_id": i} for i in range(size)]
+        store.build_index()
+    return run
+
+
+@benchmark("rag.search", sizes=[100, 1000, 5000])
+def bench_search(size: int):
+    from backend.models.rag_system import VectorStore
+    rng = random.Random(size)
+    store = VectorStore()
+    store.documents = [_text(rng, 40) for _ in range(size)]
+    store.metadata = [{"doc_id": i} for i in range(size)]
+    store.build_index()
+    return lambda: store.search("stress about work and sleep", top_k=5)
+
+
+@benchmark("countries.get_country", sizes=[10, 100, 1000])
+def bench_get_country(size: int):
+    from backend.utils.countries import CountryFinder
+    finder = CountryFinder()
+    text = ("I live in united kingdom " * (size // 25 + 1))[:size]
+    return lambda: finder.get_country(text)
+
+
+def _persona_frame(rows: int):
+    """Synthetic EmpatheticPersonas frame: prompt columns of '<sentence> <persona>' cells"""
+    import pandas as pd
+    rng = random.Random(rows)
+    columns = ["Sad - Was this caused by a specific event/s?", "All emotions - How are you feeling today?"]
+    return pd.DataFrame({
+        column: [f"{_text(rng, 12).capitalize()}. {_text(rng, 8)}? <persona {i % 5}>" for i in range(rows)]
+        for column in columns
+    })
+
+
+def _decision_maker():
+    """ModelDecisionMaker built on a synthetic frame instead of its hardcoded CSV path"""
+    import pandas as pd
+    with mock.patch.object(pd, "read_csv", return_value=_persona_frame(10)):
+        from backend.models.rule_based_model import ModelDecisionMaker
+        return ModelDecisionMaker()
+
+
+@benchmark("decision_maker.get_model_prompt", sizes=[100, 1000, 10000])
+def bench_get_model_prompt(size: int):
+    maker = _decision_maker()
+    maker.data = _persona_frame(size)
+    maker.recent_questions["u1"] = []
+    maker.user_emotions["u1"] = "Sad"
+    return lambda: maker.get_model_prompt("u1", None, None, " - Was this caused by a specific event/s?", True)
+
+
+@benchmark("decision_maker.get_suggestions", sizes=[10, 100, 1000])
+def bench_get_suggestions(size: int):
+    maker = _decision_maker()
+    rng = random.Random(size)
+    titles = maker.EXERCISE_TITLES
+    maker.suggestions["u1"] = [deque(rng.sample(titles, 5)) for _ in range(size)]
+    maker.done_exercises["u1"] = rng.sample(titles, 5)
+    return lambda: maker.get_suggestions("u1", None)
+
+
+@benchmark("companion.get_emotional_insights", sizes=[10, 50, 100])
+def bench_emotional_insights(size: int):
+    from backend.services.companion_enhancer import CompanionEnhancer
+    rng = random.Random(size)
+    enhancer = CompanionEnhancer()
+    now = datetime.now()
+    for i in range(size):
+        enhancer.track_user_patterns("u1", rng.choice(["happy", "sad", "angry", "anxious", "neutral"]),
+                                     now - timedelta(hours=i * 7))
+    return lambda: enhancer.get_emotional_insights("u1")
+
+
+@benchmark("cards.get_user_favorite_categories", sizes=[10, 50, 100])
+def bench_favorite_categories(size: int):
+    from backend.services.inspirational_cards import InspirationalCardSystem
+    rng = random.Random(size)
+    cards = InspirationalCardSystem()
+    for _ in range(size):
+        cards._record_draw("u1", rng.choice(cards.cards)["id"])
+    return lambda: cards.get_user_favorite_categories("u1")
+
+
+def measure(func: Callable[[], Any], repeat: int = 5, min_time: float = 0.05) -> Dict[str, Any]:
+    """Per-call seconds over `repeat` rounds, each looping until it lasts at least min_time"""
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or loops >= 1_000_000:
+            break
+        loops *= 2 if elapsed <= 0 else max(2, min(10, int(min_time / elapsed) + 1))
+
+    rounds = [elapsed / loops]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        rounds.append((time.perf_counter() - start) / loops)
+    return {
+        "loops": loops,
+        "min_s": min(rounds),
+        "median_s": statistics.median(rounds),
+        "max_s": max(rounds)
+    }
+
+
+def run_benchmarks(names: Optional[List[str]] = None, repeat: int = 5, min_time: float = 0.05,
+                   size_limit: Optional[int] = None) -> Dict[str, Any]:
+    """Run the selected benchmarks; results are keyed 'name[size]'"""
+    results: Dict[str, Any] = {}
+    skipped: Dict[str, str] = {}
+    growth: Dict[str, List[Optional[float]]] = {}
+    for name, spec in BENCHMARKS.items():
+        if names and not any(part in name for part in names):
+            continue
+        sizes = [size for size in spec["sizes"] if size_limit is None or size <= size_limit]
+        previous = None
+        for size in sizes:
+            try:
+                func = spec["setup"](size)
+            except ImportError as e:
+                skipped[name] = f"missing dependency: {e.name or e}"
+                break
+            result = measure(func, repeat=repeat, min_time=min_time)
+            result.update({"benchmark": name, "size": size})
+            results[f"{name}[{size}]"] = result
+            if previous is not None:
+                # Exponent k in time ~ size^k between consecutive sizes
+                prev_size, prev_time = previous
+                exponent = None
+                if prev_time > 0 and result["median_s"] > 0:
+                    exponent = round(math.log(result["median_s"] / prev_time) / math.log(size / prev_size), 2)
+                growth.setdefault(name, []).append(exponent)
+            previous = (size, result["median_s"])
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "repeat": repeat,
+            "min_time": min_time
+        },
+        "results": results,
+        "growth": growth,
+        "skipped": skipped
+    }
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], threshold: float = 1.25) -> List[Dict[str, Any]]:
+    """Median ratios against a baseline report; entries above threshold are regressions"""
+    rows = []
+    for key, result in report["results"].items():
+        base = baseline.get("results", {}).get(key)
+        if not base or not base.get("median_s"):
+            continue
+        ratio = result["median_s"] / base["median_s"]
+        rows.append({"benchmark": key, "baseline_s": base["median_s"], "current_s": result["median_s"],
+                     "ratio": round(ratio, 3), "regression": ratio > threshold})
+    return rows
+
+
+def _format_seconds(seconds: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+
+def format_report(report: Dict[str, Any], comparison: Optional[List[Dict[str, Any]]] = None) -> str:
+    lines = [f"{'benchmark':<48}{'median':>12}{'min':>12}{'loops':>9}"]
+    for key, result in report["results"].items():
+        lines.append(f"{key:<48}{_format_seconds(result['median_s']):>12}"
+                     f"{_format_seconds(result['min_s']):>12}{result['loops']:>9}")
+    if report["growth"]:
+        lines += ["", "Growth exponents between sizes (1 = linear, 2 = quadratic):"]
+        for name, exponents in report["growth"].items():
+            lines.append(f"  {name}: {', '.join('-' if e is None else str(e) for e in exponents)}")
+    for name, reason in report["skipped"].items():
+        lines.append(f"skipped {name}: {reason}")
+    if comparison:
+        lines += ["", f"{'vs baseline':<48}{'ratio':>12}"]
+        for row in comparison:
+            flag = "  REGRESSION" if row["regression"] else ""
+            lines.append(f"{row['benchmark']:<48}{row['ratio']:>12}{flag}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Microbenchmarks for pure-Python hot paths")
+    parser.add_argument("-k", "--filter", action="append", help="only run benchmarks whose name contains this")
+    parser.add_argument("--list", action="store_true", help="list benchmarks and sizes, then exit")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.05, help="minimum seconds per timing round")
+    parser.add_argument("--max-size", type=int, help="skip sizes above this (quick runs)")
+    parser.add_argument("--json-out", help="write results as JSON to this file")
+    parser.add_argument("--save-baseline", help="write results as the baseline to this file")
+    parser.add_argument("--baseline", help="compare against this baseline file")
+    parser.add_argument("--threshold", type=float, default=1.25, help="median ratio counted as a regression")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name, spec in BENCHMARKS.items():
+            print(f"{name}: sizes {spec['sizes']}")
+        return 0
+
+    report = run_benchmarks(args.filter, repeat=args.repeat, min_time=args.min_time, size_limit=args.max_size)
+    comparison = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            comparison = compare(report, json.load(f), args.threshold)
+        report["comparison"] = comparison
+    print(format_report(report, comparison))
+
+    for path in (args.json_out, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+    return 1 if comparison and any(row["regression"] for row in comparison) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,246 @@
+"""
+Load generator for the Flask API with per-endpoint and per-stage latency.
+
+Each synthetic user logs in (via /api/register + /api/login, or
+/api/mobile_login) and then holds a scripted conversation, alternating
+/api/update_session and /api/chat turns. Users run at the configured
+concurrency. Requests send "X-Debug-Timings: 1", so the stage spans in the
+Server-Timing header (classification, rag_retrieval, generation,
+db_commit, ...) are aggregated next to the client-side latencies.
+
+Typical run against a local app backed by the mock LLM:
+
+    python -m backend.tools.mock_llm --port 8001 --latency lognormal:400,0.4 &
+    API_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=mock gunicorn -w 4 -b 127.0.0.1:5000 'backend:create_app()' &
+    python -m backend.tools.load_test --base-url http://127.0.0.1:5000 --users 50 --concurrency 10 --turns 5
+
+To size gunicorn workers, repeat with increasing -w and concurrency and
+watch where chat-turn p95 rises faster than throughput.
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+CONVERSATION = [
+    "你好，我最近心情不太好",
+    "工作压力很大，晚上经常睡不着",
+    "我总是担心自己做得不够好",
+    "有时候觉得很孤独，没有人可以说话",
+    "谢谢你听我说这些，我感觉好一点了",
+    "你有什么放松的方法可以推荐吗？",
+    "我想试试深呼吸练习",
+    "今天就聊到这里吧"
+]
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile (q in 0-100) of a list of values"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(-(-q * len(ordered) // 100)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def parse_server_timing(header: Optional[str]) -> List[Tuple[str, float]]:
+    """(stage, milliseconds) entries of a Server-Timing header value"""
+    entries = []
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if name and key == "dur":
+                try:
+                    entries.append((name, float(value)))
+                except ValueError:
+                    pass
+    return entries
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 1) if value is not None else None
+
+
+class LoadStats:
+    """Thread-safe latency samples per endpoint and per server-side stage"""
+
+    def __init__(self):
+        self.endpoints: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.stages: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+
+    def record(self, endpoint: str, seconds: float, ok: bool,
+               stages: Optional[List[Tuple[str, float]]] = None) -> None:
+        with self._lock:
+            self.endpoints.setdefault(endpoint, []).append(seconds * 1000)
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+            for stage, ms in stages or []:
+                self.stages.setdefault(stage, []).append(ms)
+
+    def stop(self) -> None:
+        self.finished = time.perf_counter()
+
+    @staticmethod
+    def _summarize(samples: List[float], duration: float) -> Dict[str, Any]:
+        return {
+            "count": len(samples),
+            "rps": round(len(samples) / duration, 2) if duration > 0 else None,
+            "mean_ms": round(sum(samples) / len(samples), 1) if samples else None,
+            "p50_ms": _round(percentile(samples, 50)),
+            "p95_ms": _round(percentile(samples, 95)),
+            "p99_ms": _round(percentile(samples, 99)),
+            "max_ms": _round(max(samples) if samples else None)
+        }
+
+    def report(self) -> Dict[str, Any]:
+        duration = (self.finished or time.perf_counter()) - self.started
+        with self._lock:
+            endpoints = {}
+            for name, samples in sorted(self.endpoints.items()):
+                summary = self._summarize(samples, duration)
+                summary["errors"] = self.errors.get(name, 0)
+                endpoints[name] = summary
+            stages = {name: self._summarize(samples, duration)
+                      for name, samples in sorted(self.stages.items())}
+        return {"duration_s": round(duration, 2), "endpoints": endpoints, "stages": stages}
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    """Plain-text tables of a LoadStats report"""
+    def fmt(value):
+        return "-" if value is None else (f"{value:.1f}" if isinstance(value, float) else str(value))
+
+    lines = [f"Duration: {report['duration_s']} s"]
+    for title, rows, with_errors in (("Endpoint", report["endpoints"], True),
+                                     ("Stage (server)", report["stages"], False)):
+        header = f"{title:<24}{'count':>8}{'rps':>8}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}"
+        lines += ["", header + (f"{'errors':>8}" if with_errors else ""), "-" * (len(header) + 8 * with_errors)]
+        for name, row in rows.items():
+            line = f"{name:<24}{row['count']:>8}{fmt(row['rps']):>8}" + "".join(
+                f"{fmt(row[key]):>9}" for key in ("mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms")
+            )
+            lines.append(line + (f"{row['errors']:>8}" if with_errors else ""))
+    return "\n".join(lines)
+
+
+class LoadTester:
+    """Drives synthetic users against a running API"""
+
+    def __init__(self, base_url: str, stats: Optional[LoadStats] = None, timeout: float = 60.0,
+                 login_mode: str = "register", turns: int = 5, think_time: float = 0.0,
+                 run_id: Optional[str] = None):
+        self.base_url = base_url.rstrip("/")
+        self.stats = stats or LoadStats()
+        self.timeout = timeout
+        self.login_mode = login_mode
+        self.turns = turns
+        self.think_time = think_time
+        # Usernames must be unique across runs against the same database
+        self.run_id = run_id or f"{int(time.time())}{random.randrange(1000):03d}"
+
+    def request(self, label: str, path: str, payload: Dict[str, Any],
+                token: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """POST JSON, record latency and Server-Timing, and return the decoded body (None on failure)"""
+        headers = {"Content-Type": "application/json", "X-Debug-Timings": "1"}
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        data = json.dumps(payload).encode("utf-8")
+        http_request = urllib.request.Request(self.base_url + path, data=data, headers=headers)
+        start = time.perf_counter()
+        body, ok, timing = None, False, None
+        try:
+            with urllib.request.urlopen(http_request, timeout=self.timeout) as response:
+                timing = response.headers.get("Server-Timing")
+                body = json.loads(response.read().decode("utf-8"))
+                ok = bool(body.get("success", True))
+        except urllib.error.HTTPError as e:
+            timing = e.headers.get("Server-Timing")
+        except Exception:
+            pass
+        elapsed = time.perf_counter() - start
+        stages = [(stage, ms) for stage, ms in parse_server_timing(timing) if stage != "total"]
+        self.stats.record(label, elapsed, ok, stages)
+        return body if ok else None
+
+    def login(self, index: int) -> Optional[Dict[str, Any]]:
+        """Log a synthetic user in; returns user_id, session_id and token"""
+        username = f"loadtest_{self.run_id}_{index}"
+        if self.login_mode == "mobile":
+            body = self.request("mobile_login", "/api/mobile_login", {"username": username})
+            if not body:
+                return None
+            return {"user_id": body["user_id"], "session_id": body["session_id"], "token": body["token"]}
+
+        user_info = {"username": username, "password": "loadtest-password"}
+        if not self.request("register", "/api/register", {"user_info": user_info}):
+            return None
+        body = self.request("login", "/api/login", {"user_info": user_info})
+        if not body:
+            return None
+        return {"user_id": body["userID"], "session_id": body["sessionID"], "token": body["token"]}
+
+    def run_user(self, index: int) -> None:
+        """One user's login and conversation"""
+        user = self.login(index)
+        if not user:
+            return
+        offset = index % len(CONVERSATION)
+        for turn in range(self.turns):
+            message = CONVERSATION[(offset + turn) % len(CONVERSATION)]
+            if turn % 2 == 0:
+                self.request("update_session", "/api/update_session", {"choice_info": {
+                    "user_id": user["user_id"], "session_id": user["session_id"],
+                    "input_type": "text", "user_choice": message
+                }})
+            else:
+                self.request("chat", "/api/chat", {"message": message, "session_id": user["session_id"]},
+                             token=user["token"])
+            if self.think_time:
+                time.sleep(random.uniform(0, 2 * self.think_time))
+
+    def run(self, users: int, concurrency: int) -> Dict[str, Any]:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="load-user") as executor:
+            list(executor.map(self.run_user, range(users)))
+        self.stats.stop()
+        return self.stats.report()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Load test the therapy API")
+    parser.add_argument("--base-url", default="http://127.0.0.1:5000")
+    parser.add_argument("--users", type=int, default=20, help="synthetic users to run")
+    parser.add_argument("--concurrency", type=int, default=5, help="users running at the same time")
+    parser.add_argument("--turns", type=int, default=5, help="conversation turns per user")
+    parser.add_argument("--login", choices=["register", "mobile"], default="register",
+                        help="register + login, or mobile_login")
+    parser.add_argument("--think-time", type=float, default=0.0, help="mean seconds between a user's turns")
+    parser.add_argument("--timeout", type=float, default=60.0, help="per-request timeout in seconds")
+    parser.add_argument("--json-out", help="also write the report as JSON to this file")
+    args = parser.parse_args(argv)
+
+    tester = LoadTester(args.base_url, timeout=args.timeout, login_mode=args.login,
+                        turns=args.turns, think_time=args.think_time)
+    report = tester.run(args.users, args.concurrency)
+    report["config"] = {"users": args.users, "concurrency": args.concurrency,
+                        "turns": args.turns, "login": args.login}
+    print(format_report(report))
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
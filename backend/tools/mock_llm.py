@@ -0,0 +1,362 @@
+"""
+Mock OpenAI-compatible LLM server for benchmarks and offline tests.
+
+Implements POST /chat/completions (plain and streaming) and POST
+/embeddings, with or without a /v1 prefix, plus GET /stats. Outputs are a
+deterministic function of the request, and the prompts used by
+LLMIntegration get plausible answers: classification JSON, emotion and
+intention labels, quick-reply option arrays and therapeutic replies.
+Latency, server errors and 429s are injected from a seeded random source;
+streams can also carry malformed lines or be cut off mid-reply.
+
+Run it and point the backend at it:
+
+    python -m backend.tools.mock_llm --port 8001 --latency lognormal:300,0.5 --rate-limit-rate 0.05
+    API_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=mock ...
+
+Latency specs (milliseconds): const:200, uniform:100,400,
+lognormal:MEDIAN,SIGMA, exp:MEAN.
+"""
+
+import sys
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+
+EMOTION_KEYWORDS = {
+    "happy": ["开心", "高兴", "快乐", "幸福", "happy", "glad"],
+    "sad": ["难过", "伤心", "悲伤", "沮丧", "失望", "sad", "down"],
+    "angry": ["生气", "愤怒", "恼火", "烦躁", "angry", "furious"],
+    "anxious": ["焦虑", "紧张", "担心", "压力", "anxious", "worried", "stress"]
+}
+CRISIS_KEYWORDS = ["自杀", "不想活", "想死", "结束生命", "自残", "suicide", "kill myself", "want to die"]
+
+REPLIES = [
+    "谢谢你愿意和我分享这些。听起来这段时间你承受了不少，能多说说是什么让你有这样的感受吗？",
+    "我能感受到你现在的心情。你的感受是真实而重要的，我们可以一起慢慢梳理。",
+    "这确实不容易。试着做几次缓慢的深呼吸，然后告诉我此刻你最在意的是什么。",
+    "你已经做得很好了，愿意表达本身就是一种力量。最近有什么让你感到稍微轻松一点的事情吗？"
+]
+OPTION_SETS = [
+    ["继续分享感受", "需要一些建议", "换个话题", "结束对话"],
+    ["我想聊聊这个", "给我一些建议", "我需要安慰", "继续"],
+    ["说说原因", "尝试放松练习", "寻求专业帮助", "换个话题"]
+]
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """Turn a latency spec (milliseconds) into a sampler returning seconds"""
+    kind, _, args = (spec or "const:0").partition(":")
+    values = [float(value) for value in args.split(",") if value.strip()] or [0.0]
+    if kind == "const":
+        return lambda rng: values[0] / 1000
+    if kind == "uniform":
+        low, high = values[0], values[1] if len(values) > 1 else values[0]
+        return lambda rng: rng.uniform(low, high) / 1000
+    if kind == "lognormal":
+        median, sigma = values[0], values[1] if len(values) > 1 else 0.5
+        return lambda rng: rng.lognormvariate(math.log(max(median, 1e-3)), sigma) / 1000
+    if kind == "exp":
+        return lambda rng: rng.expovariate(1 / max(values[0], 1e-3)) / 1000
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class MockConfig:
+    """Behaviour of the mock server; attributes may be changed while it runs"""
+
+    def __init__(self, latency: str = "const:0", token_delay_ms: float = 0.0,
+                 error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 retry_after: float = 1.0, embedding_dim: int = 64, seed: int = 0,
+                 stream_noise: bool = False, stream_cut_after: int = 0):
+        self.latency = parse_latency(latency)
+        self.token_delay_ms = token_delay_ms
+        # Streams open with lines a client must skip: an SSE comment, a
+        # malformed data line and an error object with no choices
+        self.stream_noise = stream_noise
+        # Drop the connection after this many chunks, before [DONE]
+        self.stream_cut_after = stream_cut_after
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.embedding_dim = embedding_dim
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "chat": 0, "stream": 0, "embeddings": 0,
+                      "errors_injected": 0, "rate_limited": 0}
+
+    def count(self, key: str) -> None:
+        with self.lock:
+            self.stats[key] += 1
+
+    def draw(self) -> Dict[str, Any]:
+        """Sample latency and injected failures for one request"""
+        with self.lock:
+            roll = self.rng.random()
+            return {
+                "latency": self.latency(self.rng),
+                "rate_limited": roll < self.rate_limit_rate,
+                "error": self.rate_limit_rate <= roll < self.rate_limit_rate + self.error_rate
+            }
+
+
+def _digest(*parts: str) -> int:
+    return int(hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()[:12], 16)
+
+
+def _detect_emotion(text: str) -> str:
+    lowered = text.lower()
+    for emotion, keywords in EMOTION_KEYWORDS.items():
+        if any(keyword in lowered for keyword in keywords):
+            return emotion
+    return "neutral"
+
+
+def _is_crisis(text: str) -> bool:
+    lowered = text.lower()
+    return any(keyword in lowered for keyword in CRISIS_KEYWORDS)
+
+
+def chat_content(body: Dict[str, Any]) -> str:
+    """Deterministic assistant message for a chat completion request"""
+    messages = body.get("messages") or []
+    system = " ".join(str(m.get("content", "")) for m in messages if m.get("role") == "system")
+    user = str(messages[-1].get("content", "")) if messages else ""
+    seed = _digest(system, user)
+
+    if (body.get("response_format") or {}).get("type") == "json_object":
+        return json.dumps({
+            "emotion": _detect_emotion(user),
+            "intention": "s" if _is_crisis(user) else "not_s",
+            "confidence": round(0.6 + (seed % 40) / 100, 2)
+        })
+    if "'s'或'not_s'" in system:
+        return "s" if _is_crisis(user) else "not_s"
+    if "happy, sad, angry, anxious, neutral" in system:
+        return _detect_emotion(user)
+    if "JSON array" in user:
+        return json.dumps(OPTION_SETS[seed % len(OPTION_SETS)], ensure_ascii=False)
+
+    reply = REPLIES[seed % len(REPLIES)]
+    max_tokens = body.get("max_tokens")
+    return reply[:max_tokens] if isinstance(max_tokens, int) and max_tokens > 0 else reply
+
+
+def embedding(text: str, dim: int) -> List[float]:
+    """Deterministic unit vector for a text"""
+    values = []
+    counter = 0
+    while len(values) < dim:
+        block = hashlib.sha256(f"{counter}:{text}".encode("utf-8")).digest()
+        values.extend((byte - 127.5) / 127.5 for byte in block)
+        counter += 1
+    values = values[:dim]
+    norm = math.sqrt(sum(v * v for v in values)) or 1.0
+    return [round(v / norm, 6) for v in values]
+
+
+def _usage(body: Dict[str, Any], completion: str) -> Dict[str, int]:
+    prompt_chars = sum(len(str(m.get("content", ""))) for m in body.get("messages") or [])
+    prompt_tokens = max(1, prompt_chars // 2)
+    completion_tokens = max(1, len(completion) // 2)
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "MockLLM/1.0"
+
+    @property
+    def config(self) -> MockConfig:
+        return self.server.config
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status: int, payload: Dict[str, Any],
+                   headers: Optional[Dict[str, str]] = None) -> None:
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _path(self) -> str:
+        path = self.path.split("?", 1)[0]
+        return path[len("/v1"):] if path.startswith("/v1/") else path
+
+    def do_GET(self):
+        if self._path() == "/stats":
+            with self.config.lock:
+                return self._send_json(200, dict(self.config.stats))
+        self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return self._send_json(400, {"error": {"message": "invalid JSON"}})
+
+        path = self._path()
+        if path not in ("/chat/completions", "/embeddings"):
+            return self._send_json(404, {"error": {"message": "not found"}})
+
+        config = self.config
+        config.count("requests")
+        draw = config.draw()
+        time.sleep(draw["latency"])
+        if draw["rate_limited"]:
+            config.count("rate_limited")
+            return self._send_json(429, {"error": {"message": "rate limit exceeded"}},
+                                   {"Retry-After": f"{config.retry_after:g}"})
+        if draw["error"]:
+            config.count("errors_injected")
+            return self._send_json(500, {"error": {"message": "injected server error"}})
+
+        if path == "/embeddings":
+            config.count("embeddings")
+            inputs = body.get("input")
+            inputs = inputs if isinstance(inputs, list) else [inputs or ""]
+            return self._send_json(200, {
+                "object": "list",
+                "model": body.get("model", "mock-embed"),
+                "data": [{"object": "embedding", "index": i, "embedding": embedding(str(text), config.embedding_dim)}
+                         for i, text in enumerate(inputs)],
+                "usage": {"prompt_tokens": sum(len(str(t)) // 2 for t in inputs),
+                          "total_tokens": sum(len(str(t)) // 2 for t in inputs)}
+            })
+
+        content = chat_content(body)
+        completion_id = f"chatcmpl-{_digest(json.dumps(body, sort_keys=True)):x}"
+        model = body.get("model", "mock-chat")
+        if body.get("stream"):
+            config.count("stream")
+            return self._stream(completion_id, model, content)
+
+        config.count("chat")
+        self._send_json(200, {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                         "finish_reason": "stop"}],
+            "usage": _usage(body, content)
+        })
+
+    def _stream(self, completion_id: str, model: str, content: str) -> None:
+        """
+        Server-Sent Events in a chunked HTTP/1.1 body, a few characters per
+        chunk, then [DONE]. A cut-off stream ends without the terminating
+        chunk, as a dropped upstream connection would.
+        """
+        noise = []
+        if self.config.stream_noise:
+            noise = [b": keep-alive\n\n", b"data: {\"choices\": [\n\n",
+                     b"data: {\"error\": {\"message\": \"upstream hiccup\"}}\n\n"]
+        chunks = []
+        for start in range(0, len(content), 4):
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "model": model,
+                     "choices": [{"index": 0, "delta": {"content": content[start:start + 4]},
+                                  "finish_reason": None}]}
+            chunks.append(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+        cut = self.config.stream_cut_after
+
+        self.protocol_version = "HTTP/1.1"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        for event in noise:
+            self._write_chunk(event)
+        for event in chunks[:cut] if cut else chunks:
+            self._write_chunk(event)
+            if self.config.token_delay_ms:
+                time.sleep(self.config.token_delay_ms / 1000)
+        if cut:
+            return
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+class MockLLMServer(ThreadingHTTPServer):
+    """Threaded mock server; start() runs it in a background thread"""
+
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0,
+                 config: Optional[MockConfig] = None, verbose: bool = False):
+        super().__init__((host, port), MockLLMHandler)
+        self.config = config or MockConfig()
+        self.verbose = verbose
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "MockLLMServer":
+        self._thread = threading.Thread(target=self.serve_forever, name="mock-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", default="const:0",
+                        help="latency distribution in ms: const:N, uniform:A,B, lognormal:MEDIAN,SIGMA, exp:MEAN")
+    parser.add_argument("--token-delay-ms", type=float, default=0.0, help="delay between streamed chunks")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--stream-noise", action="store_true",
+                        help="open streams with a comment, a malformed line and an error chunk")
+    parser.add_argument("--stream-cut-after", type=int, default=0,
+                        help="drop streams after this many chunks (0: never)")
+    parser.add_argument("--embedding-dim", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=0, help="seed for latency and failure injection")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+
+    config = MockConfig(latency=args.latency, token_delay_ms=args.token_delay_ms,
+                        error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+                        retry_after=args.retry_after, embedding_dim=args.embedding_dim, seed=args.seed,
+                        stream_noise=args.stream_noise, stream_cut_after=args.stream_cut_after)
+    server = MockLLMServer(args.host, args.port, config, verbose=args.verbose)
+    print(f"Mock LLM listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
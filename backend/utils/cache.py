@@ -0,0 +1,83 @@
+"""
+Bounded LRU cache with per-entry TTL, used to memoise deterministic
+LLM results (temperature-0 classifications, embedding similarities)
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable
+
+# Returned by LRUCache.get on a miss, so that cached falsy values are usable
+MISSING = object()
+
+
+def normalize_text(text: str) -> str:
+    """Normalise text for use in cache keys: trimmed, lower-cased, single-spaced"""
+    return " ".join((text or "").strip().lower().split())
+
+
+class LRUCache:
+    """Thread-safe LRU cache with a time-to-live and hit/miss/eviction counters"""
+
+    def __init__(self, max_entries: int = 2048, ttl_seconds: float = 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable) -> Any:
+        """Return the cached value, or MISSING if absent or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return MISSING
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Store a value, evicting the least recently used entries when full"""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Cache counters, including the hit ratio over all lookups"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
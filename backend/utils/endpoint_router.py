@@ -0,0 +1,181 @@
+"""
+Latency-aware routing and hedged calls across interchangeable endpoints.
+
+Each endpoint keeps an exponentially weighted moving average (EWMA) and a
+window of recent latencies. Calls go to the endpoint with the lowest
+recent latency. A hedged call also goes to the next endpoint if the first
+has not answered within its recent p95 latency, and the first successful
+answer wins.
+
+A call function returns NOT_ATTEMPTED when it gave up before contacting
+the endpoint (client-side throttling, a spent deadline); such calls fail
+over like failures but leave the endpoint's latency record untouched.
+"""
+
+import random
+import threading
+import time
+import contextvars
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional
+
+# Returned by a call function that never reached the endpoint
+NOT_ATTEMPTED = object()
+
+
+class LatencyTracker:
+    """EWMA and windowed quantiles of one endpoint's call latency"""
+
+    def __init__(self, alpha: float = 0.2, window: int = 200):
+        self.alpha = alpha
+        self.ewma: Optional[float] = None
+        self.samples: deque = deque(maxlen=window)
+        self.calls = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, ok: bool, penalty: float = 0.0) -> None:
+        """Record one call; failures feed the EWMA (plus penalty) but not the quantiles"""
+        with self._lock:
+            self.calls += 1
+            if ok:
+                self.samples.append(seconds)
+            else:
+                self.failures += 1
+                seconds += penalty
+            self.ewma = seconds if self.ewma is None else (
+                self.alpha * seconds + (1 - self.alpha) * self.ewma
+            )
+
+    def quantile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if not self.samples:
+                return None
+            ordered = sorted(self.samples)
+            return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def get_stats(self) -> Dict[str, Any]:
+        p50, p95 = self.quantile(0.5), self.quantile(0.95)
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "failures": self.failures,
+                "ewma_ms": round(self.ewma * 1000, 1) if self.ewma is not None else None,
+                "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+                "p95_ms": round(p95 * 1000, 1) if p95 is not None else None
+            }
+
+
+class EndpointRouter:
+    """
+    Routes calls to the fastest available endpoint, optionally hedging.
+
+    Endpoints are any objects with a unique `name`. A call function takes
+    an endpoint and returns a result, None on failure, or NOT_ATTEMPTED if
+    it never reached the endpoint; None results count as failures and rank
+    that endpoint lower.
+    """
+
+    def __init__(self, endpoints: List[Any], hedge_quantile: float = 0.95,
+                 default_hedge_delay: float = 2.0, min_hedge_delay: float = 0.2,
+                 min_samples: int = 20, failure_penalty: float = 10.0,
+                 explore_ratio: float = 0.05, max_workers: int = 16):
+        self.endpoints = list(endpoints)
+        self.trackers = {endpoint.name: LatencyTracker() for endpoint in self.endpoints}
+        self.hedge_quantile = hedge_quantile
+        self.default_hedge_delay = default_hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.min_samples = min_samples
+        # Seconds added to a failed call's latency, so failing endpoints sink
+        self.failure_penalty = failure_penalty
+        # Share of calls sent to a random endpoint, so rankings stay fresh
+        self.explore_ratio = explore_ratio
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-hedge")
+        self._lock = threading.Lock()
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def ranked(self, available: Optional[Callable[[Any], bool]] = None) -> List[Any]:
+        """Available endpoints, fastest first; endpoints never measured go first"""
+        candidates = [e for e in self.endpoints if available is None or available(e)]
+        candidates.sort(key=lambda e: self.trackers[e.name].ewma or 0.0)
+        if len(candidates) > 1 and random.random() < self.explore_ratio:
+            candidates.insert(0, candidates.pop(random.randrange(1, len(candidates))))
+        return candidates
+
+    def hedge_delay(self, endpoint: Any) -> float:
+        """How long to wait on an endpoint before hedging: its recent quantile latency"""
+        tracker = self.trackers[endpoint.name]
+        if len(tracker.samples) < self.min_samples:
+            return self.default_hedge_delay
+        return max(self.min_hedge_delay, tracker.quantile(self.hedge_quantile))
+
+    def _timed(self, endpoint: Any, func: Callable[[Any], Any]) -> Any:
+        start = time.perf_counter()
+        result = None
+        try:
+            result = func(endpoint)
+            return result
+        finally:
+            if result is not NOT_ATTEMPTED:
+                self.trackers[endpoint.name].record(
+                    time.perf_counter() - start, result is not None, self.failure_penalty
+                )
+
+    def call(self, func: Callable[[Any], Any], hedge: bool = False,
+             available: Optional[Callable[[Any], bool]] = None) -> Any:
+        """
+        Call the fastest endpoint. With hedge, a second endpoint is called
+        once the first has been outstanding longer than its hedge delay, or
+        straight away if the first fails. The first non-None result is
+        returned; the other call is cancelled if it has not started, or its
+        result is discarded.
+        """
+        candidates = self.ranked(available)
+        if not candidates:
+            return None
+        if not hedge or len(candidates) == 1:
+            result = self._timed(candidates[0], func)
+            return None if result is NOT_ATTEMPTED else result
+
+        backups = candidates[1:2]
+        pending = {}
+
+        def launch(endpoint):
+            # Tasks run in a copy of the caller's context (turn deadline)
+            future = self._executor.submit(contextvars.copy_context().run, self._timed, endpoint, func)
+            pending[future] = endpoint
+
+        launch(candidates[0])
+        delay = self.hedge_delay(candidates[0])
+        try:
+            while pending:
+                done, _ = wait(list(pending), timeout=delay if backups else None,
+                               return_when=FIRST_COMPLETED)
+                for future in done:
+                    endpoint = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception:
+                        result = None
+                    if result is not None and result is not NOT_ATTEMPTED:
+                        if endpoint is not candidates[0]:
+                            with self._lock:
+                                self.hedge_wins += 1
+                        return result
+                # Hedge on timeout, or fail over when the only call failed
+                if backups and (not done or not pending):
+                    with self._lock:
+                        self.hedges += 1
+                    launch(backups.pop(0))
+            return None
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = {"hedges": self.hedges, "hedge_wins": self.hedge_wins}
+        stats["endpoints"] = {name: tracker.get_stats() for name, tracker in self.trackers.items()}
+        return stats
@@ -0,0 +1,243 @@
+"""
+Multi-keyword matching over Chinese and English lexicons.
+
+A lexicon maps categories to terms. Its terms are compiled into one
+Aho-Corasick automaton, so a single pass over the text finds every
+occurrence of every term, however many terms the lexicon has. Matching is
+by substring (no word boundaries) and case-insensitive, like the
+`keyword in text.lower()` checks it replaces. Characters whose lowercase
+form is longer (e.g. "İ") are kept as they are, so match offsets index the
+original text.
+
+Terms listed under the reserved category "_exclude" are not reported
+themselves; they suppress every match lying inside one of their
+occurrences. This keeps idioms such as "想死你了" ("missed you so much")
+from matching the crisis term "想死".
+
+Lexicons are JSON files ({"category": ["term", ...]}) in
+backend/utils/lexicons. Directories listed in LEXICON_PATH (os.pathsep
+separated) may hold files of the same name whose terms are added to the
+bundled ones.
+"""
+
+import os
+import json
+import logging
+import threading
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LEXICON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lexicons")
+# Reserved lexicon category of phrases whose occurrences mask other matches
+EXCLUDE = "_exclude"
+
+
+def _fold_case(text: str) -> str:
+    """Lowercase text one character for one character, so offsets are unchanged"""
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+    return "".join(lower if len(lower) == 1 else char
+                   for char, lower in ((char, char.lower()) for char in text))
+
+
+class KeywordMatch(NamedTuple):
+    """One occurrence of a term; start/end index the searched text"""
+    start: int
+    end: int
+    keyword: str
+    category: str
+
+
+class KeywordMatcher:
+    """Aho-Corasick automaton over categorized terms; built on first search"""
+
+    def __init__(self, lexicon: Optional[Dict[str, Iterable[str]]] = None, ignore_case: bool = True):
+        self.ignore_case = ignore_case
+        # Categories in the order they were first added (never EXCLUDE)
+        self.categories: List[str] = []
+        self._terms: Dict[str, List[str]] = {}
+        self._seen = set()
+        self._goto: List[Dict[str, int]] = []
+        self._fail: List[int] = []
+        self._output: List[Tuple[Tuple[str, str], ...]] = []
+        self._built = False
+        self._lock = threading.Lock()
+        if lexicon:
+            self.add_lexicon(lexicon)
+
+    def add(self, keyword: str, category: str) -> None:
+        """Add a term; the automaton is rebuilt on the next search"""
+        if not keyword:
+            return
+        keyword = _fold_case(keyword) if self.ignore_case else keyword
+        with self._lock:
+            if category not in self._terms:
+                if category != EXCLUDE:
+                    self.categories.append(category)
+                self._terms[category] = []
+            if (category, keyword) not in self._seen:
+                self._seen.add((category, keyword))
+                self._terms[category].append(keyword)
+                self._built = False
+
+    def add_lexicon(self, lexicon: Dict[str, Iterable[str]]) -> None:
+        for category, keywords in lexicon.items():
+            for keyword in keywords:
+                self.add(keyword, category)
+
+    def __len__(self) -> int:
+        return sum(len(self._terms[category]) for category in self.categories)
+
+    def _build(self) -> None:
+        """Trie of all terms plus failure links (breadth-first)"""
+        goto: List[Dict[str, int]] = [{}]
+        outputs: List[List[Tuple[str, str]]] = [[]]
+        for category, keywords in self._terms.items():
+            for keyword in keywords:
+                node = 0
+                for char in keyword:
+                    nxt = goto[node].get(char)
+                    if nxt is None:
+                        nxt = len(goto)
+                        goto[node][char] = nxt
+                        goto.append({})
+                        outputs.append([])
+                    node = nxt
+                outputs[node].append((keyword, category))
+
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in goto[node].items():
+                queue.append(child)
+                state = fail[node]
+                while state and char not in goto[state]:
+                    state = fail[state]
+                fail[child] = goto[state].get(char, 0)
+                # A node also reports every term ending at its failure target
+                outputs[child].extend(outputs[fail[child]])
+
+        self._goto = goto
+        self._fail = fail
+        self._output = [tuple(output) for output in outputs]
+        self._built = True
+
+    def _automaton(self) -> Tuple[List[Dict[str, int]], List[int], List[Tuple[Tuple[str, str], ...]]]:
+        if not self._built:
+            with self._lock:
+                if not self._built:
+                    self._build()
+        return self._goto, self._fail, self._output
+
+    def iter_matches(self, text: str) -> Iterator[KeywordMatch]:
+        """Every occurrence of every term not inside an exclusion phrase, in order of where it ends"""
+        if EXCLUDE not in self._terms:
+            yield from self._scan(text)
+            return
+        # An exclusion phrase ends after the matches it masks, so the scan
+        # is completed before anything is reported
+        matches = list(self._scan(text))
+        excluded = [(match.start, match.end) for match in matches if match.category == EXCLUDE]
+        for match in matches:
+            if match.category != EXCLUDE and not any(
+                start <= match.start and match.end <= end for start, end in excluded
+            ):
+                yield match
+
+    def _scan(self, text: str) -> Iterator[KeywordMatch]:
+        """Every occurrence of every term, exclusion phrases included"""
+        if not text:
+            return
+        goto, fail, output = self._automaton()
+        if self.ignore_case:
+            text = _fold_case(text)
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for keyword, category in output[node]:
+                yield KeywordMatch(index + 1 - len(keyword), index + 1, keyword, category)
+
+    def find_all(self, text: str) -> List[KeywordMatch]:
+        return list(self.iter_matches(text))
+
+    def contains(self, text: str, category: Optional[str] = None) -> bool:
+        """Whether any term (of the category, if given) occurs; stops at the first hit"""
+        return any(category is None or match.category == category for match in self.iter_matches(text))
+
+    def matched_categories(self, text: str) -> Dict[str, List[str]]:
+        """Distinct terms found per category, in order of first occurrence"""
+        found: Dict[str, List[str]] = {}
+        for match in self.iter_matches(text):
+            keywords = found.setdefault(match.category, [])
+            if match.keyword not in keywords:
+                keywords.append(match.keyword)
+        return found
+
+    def first_category(self, text: str, default: Optional[str] = None) -> Optional[str]:
+        """The earliest-added category with a term in the text, else default"""
+        found = self.matched_categories(text)
+        for category in self.categories:
+            if category in found:
+                return category
+        return default
+
+
+def _lexicon_dirs() -> List[str]:
+    extra = [path for path in os.getenv("LEXICON_PATH", "").split(os.pathsep) if path]
+    return [DEFAULT_LEXICON_DIR] + extra
+
+
+def load_lexicon(name: str) -> Dict[str, List[str]]:
+    """
+    A lexicon by name: the bundled file merged with any same-named files
+    in LEXICON_PATH. Unreadable files are logged and skipped.
+    """
+    lexicon: Dict[str, List[str]] = {}
+    seen = set()
+    for directory in _lexicon_dirs():
+        path = os.path.join(directory, f"{name}.json")
+        if directory != DEFAULT_LEXICON_DIR and not os.path.exists(path):
+            continue
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to load lexicon {name} from {path}: {e}")
+            continue
+        for category, terms in data.items():
+            merged = lexicon.setdefault(category, [])
+            for term in terms:
+                if (category, term) not in seen:
+                    seen.add((category, term))
+                    merged.append(term)
+    return lexicon
+
+
+_matchers: Dict[str, KeywordMatcher] = {}
+_matchers_lock = threading.Lock()
+
+
+def get_matcher(name: str) -> KeywordMatcher:
+    """Process-wide matcher for a lexicon, compiled once on first request"""
+    with _matchers_lock:
+        matcher = _matchers.get(name)
+        if matcher is None:
+            matcher = KeywordMatcher(load_lexicon(name))
+            # Build now rather than on the first message
+            matcher._automaton()
+            _matchers[name] = matcher
+        return matcher
+
+
+def preload_lexicons() -> List[str]:
+    """Compile every bundled lexicon, so no request pays for a build"""
+    names = sorted(name[:-len(".json")] for name in os.listdir(DEFAULT_LEXICON_DIR) if name.endswith(".json"))
+    for name in names:
+        get_matcher(name)
+    return names
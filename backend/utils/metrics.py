@@ -0,0 +1,184 @@
+"""
+Lightweight in-process metrics: stage spans, histograms and counters,
+rendered in the Prometheus text exposition format.
+
+Spans time a pipeline stage, observe it into the stage-duration histogram
+and append it to the current request's trace, which the app can return in
+a Server-Timing header. Metrics are per process: with several gunicorn
+workers, each worker exposes its own values.
+"""
+
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# Seconds; tuned for LLM pipeline stages (milliseconds up to tens of seconds)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TOKEN_BUCKETS = (16, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+# (stage, milliseconds) entries of the request being served, if any
+_trace: contextvars.ContextVar = contextvars.ContextVar("metrics_trace", default=None)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Histogram:
+    """Cumulative-bucket histogram with one series per label set"""
+
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple, List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = tuple(sorted((name, str(label)) for name, label in labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    le = 'le="%s"' % bound
+                    lines.append(f"{self.name}_bucket{_format_labels(key, le)} {bucket_count}")
+                le = 'le="+Inf"'
+                lines.append(f"{self.name}_bucket{_format_labels(key, le)} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter with one series per label set"""
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._series: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = tuple(sorted((name, str(label)) for name, label in labels.items()))
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._series.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds the process's metrics and gauge collectors"""
+
+    def __init__(self):
+        self.stage_duration = Histogram(
+            "chat_stage_duration_seconds", "Duration of chat pipeline stages"
+        )
+        self.http_duration = Histogram(
+            "http_request_duration_seconds", "Duration of HTTP requests by endpoint"
+        )
+        self.llm_tokens = Counter("llm_tokens_total", "Provider-reported LLM token usage")
+        self.llm_request_tokens = Histogram(
+            "llm_request_tokens", "Provider-reported total tokens per LLM request", TOKEN_BUCKETS
+        )
+        self._collectors: List[Callable[[], List[Tuple[str, Dict[str, Any], float]]]] = []
+
+    def register_collector(self, collector: Callable[[], List[Tuple[str, Dict[str, Any], float]]]) -> None:
+        """Add a callable returning (gauge name, labels, value) samples at scrape time"""
+        self._collectors.append(collector)
+
+    def record_stage(self, stage: str, seconds: float, **labels: Any) -> None:
+        """Record an already-measured stage duration"""
+        self.stage_duration.observe(seconds, stage=stage, **labels)
+        trace = _trace.get()
+        if trace is not None:
+            trace.append((stage, round(seconds * 1000, 2)))
+
+    @contextmanager
+    def span(self, stage: str, **labels: Any) -> Iterator[None]:
+        """Time a block as one pipeline stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_stage(stage, time.perf_counter() - start, **labels)
+
+    def record_usage(self, usage: Optional[Dict[str, Any]], model: Optional[str] = None) -> None:
+        """Record an OpenAI-style usage block ({"prompt_tokens", "completion_tokens", "total_tokens"})"""
+        if not isinstance(usage, dict):
+            return
+        model = model or "unknown"
+        for kind in ("prompt_tokens", "completion_tokens"):
+            if isinstance(usage.get(kind), (int, float)):
+                self.llm_tokens.inc(usage[kind], type=kind.split("_")[0], model=model)
+        if isinstance(usage.get("total_tokens"), (int, float)):
+            self.llm_request_tokens.observe(usage["total_tokens"], model=model)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines: List[str] = []
+        for metric in (self.stage_duration, self.http_duration, self.llm_tokens, self.llm_request_tokens):
+            lines.extend(metric.render())
+        gauges: Dict[str, List[str]] = {}
+        for collector in self._collectors:
+            try:
+                samples = collector()
+            except Exception:
+                continue
+            for name, labels, value in samples:
+                key = tuple(sorted((label, str(v)) for label, v in labels.items()))
+                gauges.setdefault(name, []).append(f"{name}{_format_labels(key)} {_format_value(value)}")
+        for name, samples in gauges.items():
+            lines.append(f"# TYPE {name} gauge")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+def start_trace() -> contextvars.Token:
+    """Begin collecting spans for the current request"""
+    return _trace.set([])
+
+
+def current_trace() -> List[Tuple[str, float]]:
+    """Spans recorded so far for the current request"""
+    return list(_trace.get() or [])
+
+
+def end_trace(token: contextvars.Token) -> None:
+    _trace.reset(token)
+
+
+def server_timing(trace: List[Tuple[str, float]]) -> str:
+    """Format a trace as a Server-Timing header value"""
+    return ", ".join(f"{stage};dur={ms}" for stage, ms in trace)
+
+
+metrics = MetricsRegistry()
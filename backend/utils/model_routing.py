@@ -0,0 +1,115 @@
+"""
+Per-task model routing for LLM calls.
+
+Every LLM call names its task, and each task has its own route: the model
+to request, a max_tokens value, a request timeout and the endpoints it may
+be sent to. Short, high-volume tasks (classification, quick-reply options,
+summaries) can then go to a small, fast model while the therapeutic replies
+use a stronger one.
+
+Routes are layered, later layers winning:
+  1. LLM_FAST_MODEL applies to the fast tier (classify, options, summary) and
+     LLM_STRONG_MODEL to the strong tier (reply, ultra_think, crisis)
+  2. LLM_TASK_ROUTES, a JSON object keyed by task, e.g.
+     {"classify": {"model": "deepseek-chat", "max_tokens": 40, "timeout": 3,
+                   "endpoint": "fast"},
+      "reply": {"model": "deepseek-reasoner", "timeout": 20}}
+  3. LLM_<TASK>_MODEL, LLM_<TASK>_MAX_TOKENS, LLM_<TASK>_TIMEOUT and
+     LLM_<TASK>_ENDPOINT, e.g. LLM_OPTIONS_MODEL
+
+endpoint names one or more (comma separated) endpoints of LLM_ENDPOINTS.
+Unset fields keep the caller's max_tokens, LLM_REQUEST_TIMEOUT and every
+shared endpoint.
+"""
+
+import os
+import json
+import logging
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TASKS = ("classify", "options", "reply", "ultra_think", "summary", "crisis")
+FAST_TASKS = ("classify", "options", "summary")
+
+# Remapped to the provider's own model name by LLMIntegration
+DEFAULT_MODEL = "gpt-3.5-turbo"
+
+
+class TaskRoute(NamedTuple):
+    """Where and how one kind of LLM call is made; None means the default"""
+    task: str
+    model: Optional[str] = None
+    max_tokens: Optional[int] = None
+    timeout: Optional[float] = None
+    endpoints: Optional[Tuple[str, ...]] = None
+
+    @property
+    def request_model(self) -> str:
+        return self.model or DEFAULT_MODEL
+
+    def allows(self, endpoint_name: str, dedicated: bool = False) -> bool:
+        """Endpoints named by the route, or any shared endpoint if it names none"""
+        if self.endpoints is None:
+            return not dedicated
+        return endpoint_name in self.endpoints
+
+
+def _endpoint_names(value: Any) -> Optional[Tuple[str, ...]]:
+    names = value if isinstance(value, (list, tuple)) else str(value).split(",")
+    return tuple(str(name).strip() for name in names if str(name).strip()) or None
+
+
+_FIELDS = (("model", str, "model"), ("max_tokens", int, "max_tokens"),
+           ("timeout", float, "timeout"), ("endpoint", _endpoint_names, "endpoints"))
+
+
+def _route_fields(task: str, config: Dict[str, Any]) -> Dict[str, Any]:
+    """TaskRoute fields from one task's settings; invalid values are logged and skipped"""
+    fields: Dict[str, Any] = {}
+    for key, parse, field in _FIELDS:
+        value = config.get(key)
+        if value in (None, ""):
+            continue
+        try:
+            fields[field] = parse(value)
+        except (TypeError, ValueError) as e:
+            logger.error(f"Invalid {key} in the model route for {task}, ignoring it: {e}")
+    return fields
+
+
+def load_task_routes() -> Dict[str, TaskRoute]:
+    """Routes for every task from the environment; invalid settings are logged and skipped"""
+    routes = {}
+    try:
+        configured = json.loads(os.getenv("LLM_TASK_ROUTES") or "{}")
+        if not isinstance(configured, dict):
+            raise ValueError("expected a JSON object keyed by task")
+    except ValueError as e:
+        logger.error(f"Invalid LLM_TASK_ROUTES, ignoring it: {e}")
+        configured = {}
+    unknown = set(configured) - set(TASKS)
+    if unknown:
+        logger.warning(f"LLM_TASK_ROUTES has unknown tasks: {sorted(unknown)}")
+
+    for task in TASKS:
+        tier_model = os.getenv("LLM_FAST_MODEL" if task in FAST_TASKS else "LLM_STRONG_MODEL")
+        prefix = f"LLM_{task.upper()}_"
+        layers = [
+            {"model": tier_model},
+            configured.get(task) or {},
+            {
+                "model": os.getenv(prefix + "MODEL"),
+                "max_tokens": os.getenv(prefix + "MAX_TOKENS"),
+                "timeout": os.getenv(prefix + "TIMEOUT"),
+                "endpoint": os.getenv(prefix + "ENDPOINT")
+            }
+        ]
+        fields: Dict[str, Any] = {}
+        for layer in layers:
+            if isinstance(layer, dict):
+                fields.update(_route_fields(task, layer))
+            else:
+                logger.error(f"Invalid model route for {task}, ignoring it: {layer!r}")
+        routes[task] = TaskRoute(task, **fields)
+    return routes
@@ -0,0 +1,233 @@
+"""
+Local token counting and token-budgeted prompt assembly.
+
+Counts come from the byte-level BPE tokenizer bundled in
+backend/utils/tokenizer: through the `tokenizers` package when it is
+installed, otherwise through a pure-Python implementation of the same
+merges. This is not the provider's own tokenizer, so counts are an estimate
+for bounding prompt size rather than a billing figure.
+"""
+
+import os
+import re
+import json
+import math
+import logging
+import threading
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOKENIZER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tokenizer")
+
+try:
+    import regex
+    _PRETOKENIZE = regex.compile(
+        r"""'s|'t|'re|'ve|'m|'ll|'d| ?\p{L}+| ?\p{N}+| ?[^\s\p{L}\p{N}]+|\s+(?!\S)|\s+"""
+    )
+except ImportError:
+    # Same split with the standard library: letters are [^\W\d_]
+    _PRETOKENIZE = re.compile(
+        r"""'s|'t|'re|'ve|'m|'ll|'d| ?[^\W\d_]+| ?\d+| ?(?:[^\s\w]|_)+|\s+(?!\S)|\s+"""
+    )
+
+
+def _bytes_to_unicode() -> Dict[int, str]:
+    """The byte-to-printable-character table used by byte-level BPE vocabularies"""
+    printable = (list(range(ord("!"), ord("~") + 1)) + list(range(ord("¡"), ord("¬") + 1))
+                 + list(range(ord("®"), ord("ÿ") + 1)))
+    codes = printable[:]
+    extra = 0
+    for byte in range(256):
+        if byte not in printable:
+            printable.append(byte)
+            codes.append(256 + extra)
+            extra += 1
+    return dict(zip(printable, (chr(code) for code in codes)))
+
+
+class TokenCounter:
+    """Counts tokens with the bundled tokenizer; loads lazily on first use"""
+
+    def __init__(self, tokenizer_dir: str = DEFAULT_TOKENIZER_DIR):
+        self.tokenizer_dir = tokenizer_dir
+        self.backend = None
+        self._fast = None
+        self._ranks: Dict[Tuple[str, str], int] = {}
+        self._byte_encoder = _bytes_to_unicode()
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self.backend is not None:
+                return
+            try:
+                from tokenizers import Tokenizer
+                self._fast = Tokenizer.from_file(os.path.join(self.tokenizer_dir, "tokenizer.json"))
+                self.backend = "tokenizers"
+                return
+            except Exception:
+                pass
+            try:
+                with open(os.path.join(self.tokenizer_dir, "merges.txt"), encoding="utf-8") as f:
+                    merges = [line.split() for line in f if line.strip() and not line.startswith("#version")]
+                self._ranks = {tuple(pair): rank for rank, pair in enumerate(merges) if len(pair) == 2}
+                self.backend = "bpe"
+            except OSError as e:
+                logger.warning(f"Tokenizer files unavailable, estimating token counts: {e}")
+                self.backend = "heuristic"
+
+    def count(self, text: str) -> int:
+        """Number of tokens in text"""
+        if not text:
+            return 0
+        if self.backend is None:
+            self._load()
+        if self._fast is not None:
+            return len(self._fast.encode(text, add_special_tokens=False).ids)
+        if self._ranks:
+            return sum(self._word_tokens(word) for word in _PRETOKENIZE.findall(text))
+        # Roughly one token per CJK character and per four other characters
+        cjk = sum(1 for char in text if "一" <= char <= "鿿")
+        return cjk + math.ceil((len(text) - cjk) / 4)
+
+    @lru_cache(maxsize=65536)
+    def _word_tokens(self, word: str) -> int:
+        """BPE piece count for one pre-tokenized word"""
+        pieces = [self._byte_encoder[byte] for byte in word.encode("utf-8")]
+        while len(pieces) > 1:
+            ranked = [(self._ranks.get(pair, math.inf), i)
+                      for i, pair in enumerate(zip(pieces, pieces[1:]))]
+            rank, _ = min(ranked)
+            if rank == math.inf:
+                break
+            merged = []
+            i = 0
+            while i < len(pieces):
+                if (i < len(pieces) - 1 and
+                        self._ranks.get((pieces[i], pieces[i + 1])) == rank):
+                    merged.append(pieces[i] + pieces[i + 1])
+                    i += 2
+                else:
+                    merged.append(pieces[i])
+                    i += 1
+            pieces = merged
+        return len(pieces)
+
+
+class PromptSection:
+    """
+    A variable-size part of a prompt, made of units (history messages,
+    memories, context paragraphs) that are dropped whole when over budget.
+
+    keep="newest" drops units from the start (conversation history);
+    keep="first" drops them from the end (ranked results). When not even
+    one unit fits and truncate is set, that unit is cut to fit.
+    """
+
+    def __init__(self, name: str, units: List[str], priority: int,
+                 max_tokens: Optional[int] = None, keep: str = "first",
+                 truncate: bool = True, separator: str = "\n"):
+        self.name = name
+        self.units = [unit for unit in units if unit]
+        self.priority = priority
+        self.max_tokens = max_tokens
+        self.keep = keep
+        self.truncate = truncate
+        self.separator = separator
+
+
+def _truncate(text: str, limit: int, counter: TokenCounter) -> str:
+    """Longest prefix of text (by characters) that fits in limit tokens"""
+    if limit <= 0:
+        return ""
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if counter.count(text[:middle]) <= limit:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low]
+
+
+def fit_sections(sections: List[PromptSection], budget: int,
+                 counter: TokenCounter) -> Tuple[Dict[str, str], Dict[str, int]]:
+    """
+    Fill sections in priority order (lowest number first) until the budget
+    is spent; each section is also capped by its own max_tokens.
+
+    Returns:
+        (section name -> text, section name -> tokens used)
+    """
+    texts: Dict[str, str] = {}
+    used: Dict[str, int] = {}
+    remaining = budget
+    for section in sorted(sections, key=lambda s: s.priority):
+        limit = remaining if section.max_tokens is None else min(remaining, section.max_tokens)
+        ordered = section.units[::-1] if section.keep == "newest" else section.units
+        separator_tokens = counter.count(section.separator)
+
+        chosen, spent = [], 0
+        for unit in ordered:
+            cost = counter.count(unit) + (separator_tokens if chosen else 0)
+            if spent + cost <= limit:
+                chosen.append(unit)
+                spent += cost
+                continue
+            if not chosen and section.truncate:
+                unit = _truncate(unit, limit, counter)
+                if unit:
+                    chosen.append(unit)
+                    spent = counter.count(unit)
+            break
+
+        if section.keep == "newest":
+            chosen.reverse()
+        texts[section.name] = section.separator.join(chosen)
+        used[section.name] = spent
+        remaining -= spent
+    return texts, used
+
+
+class PromptBudget:
+    """Assembles prompts from a fixed template and budgeted sections"""
+
+    def __init__(self, total_tokens: int, counter: Optional[TokenCounter] = None):
+        self.total_tokens = total_tokens
+        self.counter = counter or get_token_counter()
+
+    def assemble(self, render: Callable[..., str],
+                 sections: List[PromptSection]) -> Tuple[str, Dict[str, object]]:
+        """
+        Render the prompt with as much of each section as the budget allows.
+
+        render is called with one keyword argument per section name; the
+        tokens of the template itself (rendered with empty sections) are
+        taken off the budget first.
+
+        Returns:
+            (prompt, report with prompt_tokens and per-section token counts)
+        """
+        fixed = self.counter.count(render(**{section.name: "" for section in sections}))
+        texts, used = fit_sections(sections, max(0, self.total_tokens - fixed), self.counter)
+        prompt = render(**texts)
+        return prompt, {
+            "prompt_tokens": self.counter.count(prompt),
+            "budget": self.total_tokens,
+            "fixed_tokens": fixed,
+            "sections": used,
+            "tokenizer": self.counter.backend
+        }
+
+
+_token_counter = None
+
+
+def get_token_counter() -> TokenCounter:
+    """Get the global token counter"""
+    global _token_counter
+    if _token_counter is None:
+        _token_counter = TokenCounter()
+    return _token_counter
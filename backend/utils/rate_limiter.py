@@ -0,0 +1,209 @@
+"""
+Client-side token-bucket rate limiting for the LLM provider.
+
+Requests reserve one unit from a requests-per-minute bucket and an estimated
+token count from a tokens-per-minute bucket. A caller that cannot be served
+immediately is queued (it sleeps until its reservation matures) as long as
+the wait stays within a bound; otherwise it is rejected and the caller falls
+back. A provider Retry-After pauses every caller until it has passed.
+
+RateLimiter keeps its buckets in process memory. SQLiteRateLimiter keeps
+them in a shared SQLite file so that several gunicorn workers pace against
+one provider limit together.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Iterator, Optional
+
+# Buckets refill continuously; the burst allowance caps how much unused
+# capacity can accumulate, in seconds' worth of the per-minute limit
+DEFAULT_BURST_SECONDS = 10.0
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header (delta-seconds or HTTP-date) into seconds"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+class RateLimiter:
+    """Process-wide RPM/TPM token-bucket limiter with bounded queueing"""
+
+    def __init__(self, requests_per_minute: float = 0, tokens_per_minute: float = 0,
+                 max_wait: float = 5.0, burst_seconds: float = DEFAULT_BURST_SECONDS):
+        # A limit of 0 disables that bucket; Retry-After is honoured regardless
+        self.limits = {"requests": requests_per_minute, "tokens": tokens_per_minute}
+        self.max_wait = max_wait
+        self.burst_seconds = burst_seconds
+        self._lock = threading.Lock()
+        self._state: Dict[str, Any] = {}
+        self.acquired = 0
+        self.queued = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.pauses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return any(limit > 0 for limit in self.limits.values())
+
+    def _now(self) -> float:
+        return time.monotonic()
+
+    @contextmanager
+    def _locked_state(self) -> Iterator[Dict[str, Any]]:
+        """Exclusive access to the bucket state: {bucket: [level, updated], "paused_until": t}"""
+        with self._lock:
+            yield self._state
+
+    def _capacity(self, name: str) -> float:
+        limit = self.limits[name]
+        return max(1.0, limit / 60.0 * self.burst_seconds)
+
+    def _level(self, state: Dict[str, Any], name: str, now: float) -> float:
+        """Bucket level at now, after refilling since the last update"""
+        capacity = self._capacity(name)
+        level, updated = state.get(name) or (capacity, now)
+        return min(capacity, level + (now - updated) * self.limits[name] / 60.0)
+
+    def reserve(self, tokens: int = 0, max_wait: Optional[float] = None) -> Optional[float]:
+        """
+        Reserve one request and the given number of tokens.
+
+        Returns:
+            Seconds the caller must wait before sending, or None if that
+            wait would exceed max_wait (nothing is reserved in that case)
+        """
+        max_wait = self.max_wait if max_wait is None else max_wait
+        costs = {"requests": 1.0, "tokens": float(tokens)}
+
+        with self._locked_state() as state:
+            now = self._now()
+            wait = max(0.0, state.get("paused_until", 0.0) - now)
+            levels = {}
+            for name, cost in costs.items():
+                if self.limits[name] <= 0 or cost <= 0:
+                    continue
+                # A request larger than the burst allowance waits for a full bucket
+                cost = min(cost, self._capacity(name))
+                costs[name] = cost
+                levels[name] = self._level(state, name, now)
+                if levels[name] < cost:
+                    wait = max(wait, (cost - levels[name]) * 60.0 / self.limits[name])
+
+            if wait > max_wait:
+                self.rejected += 1
+                return None
+
+            # Levels may go negative: later callers queue behind this reservation
+            for name, level in levels.items():
+                state[name] = [level - costs[name], now]
+            self.acquired += 1
+            if wait > 0:
+                self.queued += 1
+                self.total_wait += wait
+            return wait
+
+    def acquire(self, tokens: int = 0, max_wait: Optional[float] = None) -> bool:
+        """Reserve capacity and sleep until it is available; False if rejected"""
+        wait = self.reserve(tokens, max_wait)
+        if wait is None:
+            return False
+        if wait > 0:
+            time.sleep(wait)
+        return True
+
+    def adjust_tokens(self, delta: int) -> None:
+        """Correct the token bucket once the provider reports actual usage"""
+        if self.limits["tokens"] <= 0 or not delta:
+            return
+        with self._locked_state() as state:
+            now = self._now()
+            state["tokens"] = [self._level(state, "tokens", now) - delta, now]
+
+    def pause(self, seconds: float) -> None:
+        """Hold every caller back for the given time (provider Retry-After)"""
+        if seconds <= 0:
+            return
+        with self._locked_state() as state:
+            until = self._now() + seconds
+            if until > state.get("paused_until", 0.0):
+                state["paused_until"] = until
+            self.pauses += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests_per_minute": self.limits["requests"],
+                "tokens_per_minute": self.limits["tokens"],
+                "acquired": self.acquired,
+                "queued": self.queued,
+                "rejected": self.rejected,
+                "pauses": self.pauses,
+                "mean_wait_seconds": round(self.total_wait / self.queued, 4) if self.queued else 0.0
+            }
+
+
+class SQLiteRateLimiter(RateLimiter):
+    """RateLimiter whose bucket state is shared across processes through SQLite"""
+
+    def __init__(self, path: str, name: str = "llm", **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.name = name
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limits (name TEXT PRIMARY KEY, state TEXT NOT NULL)"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def _now(self) -> float:
+        # Wall-clock time, since monotonic clocks are not comparable across processes
+        return time.time()
+
+    @contextmanager
+    def _locked_state(self) -> Iterator[Dict[str, Any]]:
+        with self._lock:
+            connection = self._connection()
+            # BEGIN IMMEDIATE takes the database write lock for the whole
+            # read-modify-write, serialising workers against each other
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = connection.execute(
+                    "SELECT state FROM rate_limits WHERE name = ?", (self.name,)
+                ).fetchone()
+                state = json.loads(row[0]) if row else {}
+                yield state
+                connection.execute(
+                    "INSERT OR REPLACE INTO rate_limits (name, state) VALUES (?, ?)",
+                    (self.name, json.dumps(state))
+                )
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
@@ -0,0 +1,86 @@
+"""
+Single-flight call coalescing: concurrent callers asking for the same key
+share one in-flight execution and its result
+"""
+
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class _Call:
+    """One in-flight execution and the callers waiting on it"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Thread-safe single-flight group with execution/deduplication counters"""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.deduplicated = 0
+        self.wait_timeouts = 0
+
+    def do(self, key: Hashable, func: Callable[[], Any],
+           timeout: Optional[float] = None) -> Tuple[Any, bool]:
+        """
+        Run func, or wait for an identical in-flight call to finish.
+
+        The first caller for a key executes func; callers arriving while it
+        runs block until it completes and receive the same result (or
+        exception). Followers wait at most timeout seconds and then raise
+        TimeoutError; the leader's call is unaffected.
+
+        Returns:
+            (result, shared), where shared is True for followers
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = _Call()
+                self._calls[key] = call
+                self.executions += 1
+                leader = True
+            else:
+                self.deduplicated += 1
+                leader = False
+
+        if not leader:
+            if not call.done.wait(timeout):
+                with self._lock:
+                    self.wait_timeouts += 1
+                raise TimeoutError("timed out waiting for in-flight call")
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func()
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.executions + self.deduplicated
+            return {
+                "executions": self.executions,
+                "deduplicated": self.deduplicated,
+                "wait_timeouts": self.wait_timeouts,
+                "in_flight": len(self._calls),
+                "dedup_ratio": round(self.deduplicated / total, 4) if total else 0.0
+            }
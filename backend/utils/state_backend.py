@@ -0,0 +1,357 @@
+"""
+Pluggable key-value state shared by the app's processes.
+
+Values are JSON-serializable and carry a version that increases on every
+write. Writes can be conditional on the version last read (compare-and-set),
+so concurrent read-modify-write cycles from different gunicorn workers
+retry instead of overwriting each other.
+
+Backends:
+- InMemoryStateBackend: one process only (the default)
+- SQLiteStateBackend: a WAL-mode database file shared by the workers of one host
+- RedisStateBackend: any Redis-protocol server, shared across hosts
+
+CachedStateBackend wraps a backend with a local read-through cache that
+revalidates entries by version, so unchanged values are not re-fetched
+and decoded.
+"""
+
+import os
+import json
+import time
+import random
+import sqlite3
+import logging
+import threading
+import itertools
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class StateBackend(ABC):
+    """Versioned key-value store; version 0 means the key does not exist"""
+
+    # Whether other processes see this backend's state
+    shared = True
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Tuple[int, Any]]:
+        """(version, value), or None if the key does not exist"""
+
+    def version(self, key: str) -> int:
+        """Current version of a key, 0 if it does not exist"""
+        record = self.get(key)
+        return record[0] if record else 0
+
+    @abstractmethod
+    def put(self, key: str, value: Any, expected_version: Optional[int] = None,
+            ttl: Optional[float] = None) -> Optional[int]:
+        """
+        Write a value
+
+        Args:
+            expected_version: Only write if the key is at this version (0: only
+                if it does not exist); None writes unconditionally
+            ttl: Seconds until the key expires; None keeps it forever
+
+        Returns:
+            The new version, or None if expected_version did not match
+        """
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """Remove a key; missing keys are ignored"""
+
+
+class InMemoryStateBackend(StateBackend):
+    """Process-local backend; values are stored as given and must not be mutated"""
+
+    shared = False
+
+    def __init__(self, purge_every: int = 200):
+        self.purge_every = purge_every
+        self._puts = 0
+        self._data: Dict[str, Tuple[int, Any, Optional[float]]] = {}
+        # Versions come from one counter, so a stale reader never matches
+        # a deleted and recreated key
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _live(self, key: str) -> Optional[Tuple[int, Any, Optional[float]]]:
+        record = self._data.get(key)
+        if record is not None and record[2] is not None and record[2] <= time.monotonic():
+            del self._data[key]
+            return None
+        return record
+
+    def get(self, key: str) -> Optional[Tuple[int, Any]]:
+        with self._lock:
+            record = self._live(key)
+            return (record[0], record[1]) if record else None
+
+    def put(self, key: str, value: Any, expected_version: Optional[int] = None,
+            ttl: Optional[float] = None) -> Optional[int]:
+        with self._lock:
+            record = self._live(key)
+            current = record[0] if record else 0
+            if expected_version is not None and expected_version != current:
+                return None
+            version = next(self._counter)
+            now = time.monotonic()
+            self._data[key] = (version, value, now + ttl if ttl else None)
+            self._puts += 1
+            if self.purge_every and self._puts % self.purge_every == 0:
+                # Expired keys that are never read again would otherwise stay
+                expired = [k for k, r in self._data.items() if r[2] is not None and r[2] <= now]
+                for k in expired:
+                    del self._data[k]
+            return version
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class SQLiteStateBackend(StateBackend):
+    """Backend stored in a WAL-mode SQLite file, shared by processes on one host"""
+
+    def __init__(self, path: str, purge_every: int = 200):
+        self.path = path
+        self.purge_every = purge_every
+        self._puts = 0
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS state ("
+            "key TEXT PRIMARY KEY, version INTEGER NOT NULL, value TEXT NOT NULL, expires_at REAL)"
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, key: str) -> Optional[Tuple[int, Any]]:
+        row = self._connection().execute(
+            "SELECT version, value FROM state WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time())
+        ).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def version(self, key: str) -> int:
+        row = self._connection().execute(
+            "SELECT version FROM state WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time())
+        ).fetchone()
+        return row[0] if row else 0
+
+    def put(self, key: str, value: Any, expected_version: Optional[int] = None,
+            ttl: Optional[float] = None) -> Optional[int]:
+        data = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        connection = self._connection()
+        # BEGIN IMMEDIATE takes the write lock for the whole check-and-write
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT version, expires_at FROM state WHERE key = ?", (key,)
+            ).fetchone()
+            stored = row[0] if row else 0
+            live = stored if row and (row[1] is None or row[1] > now) else 0
+            if expected_version is not None and expected_version != live:
+                connection.execute("ROLLBACK")
+                return None
+            version = stored + 1
+            connection.execute(
+                "INSERT OR REPLACE INTO state (key, version, value, expires_at) VALUES (?, ?, ?, ?)",
+                (key, version, data, now + ttl if ttl else None)
+            )
+            self._puts += 1
+            if self.purge_every and self._puts % self.purge_every == 0:
+                connection.execute("DELETE FROM state WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+            connection.execute("COMMIT")
+            return version
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def delete(self, key: str) -> None:
+        # Expire rather than remove, so the version keeps increasing if the
+        # key is recreated; expired rows are purged later
+        self._connection().execute("UPDATE state SET expires_at = 0 WHERE key = ?", (key,))
+
+
+# Compare-and-set on a hash {v: version, d: data}; a hash without d is a
+# deleted key that keeps its version. ARGV: expected ('' = any), data, ttl ms ('' = none)
+_REDIS_PUT = """
+local current = tonumber(redis.call('HGET', KEYS[1], 'v') or '0')
+local live = current
+if redis.call('HEXISTS', KEYS[1], 'd') == 0 then live = 0 end
+if ARGV[1] ~= '' and tonumber(ARGV[1]) ~= live then return nil end
+local version = current + 1
+redis.call('HSET', KEYS[1], 'v', version, 'd', ARGV[2])
+if ARGV[3] ~= '' then redis.call('PEXPIRE', KEYS[1], ARGV[3]) else redis.call('PERSIST', KEYS[1]) end
+return version
+"""
+
+
+class RedisStateBackend(StateBackend):
+    """Backend on a Redis-protocol server; requires the redis package"""
+
+    def __init__(self, url: str, prefix: str = "therapy:state:"):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._put_script = self.client.register_script(_REDIS_PUT)
+
+    def get(self, key: str) -> Optional[Tuple[int, Any]]:
+        version, data = self.client.hmget(self.prefix + key, "v", "d")
+        return (int(version), json.loads(data)) if data is not None else None
+
+    def version(self, key: str) -> int:
+        version, exists = self.client.pipeline().hget(self.prefix + key, "v").hexists(self.prefix + key, "d").execute()
+        return int(version) if exists else 0
+
+    def put(self, key: str, value: Any, expected_version: Optional[int] = None,
+            ttl: Optional[float] = None) -> Optional[int]:
+        result = self._put_script(
+            keys=[self.prefix + key],
+            args=["" if expected_version is None else expected_version,
+                  json.dumps(value, ensure_ascii=False),
+                  "" if not ttl else int(ttl * 1000)]
+        )
+        return int(result) if result is not None else None
+
+    def delete(self, key: str) -> None:
+        # Keep the version for a day, so a recreated key does not reuse it
+        self.client.pipeline().hdel(self.prefix + key, "d").pexpire(self.prefix + key, 86400000).execute()
+
+
+class CachedStateBackend(StateBackend):
+    """
+    Read-through local cache over another backend.
+
+    A cached entry is served without any backend call for revalidate_after
+    seconds, then revalidated by comparing versions; the value is only
+    re-fetched when it changed.
+    """
+
+    def __init__(self, backend: StateBackend, revalidate_after: float = 0.0, max_entries: int = 10000):
+        self.backend = backend
+        self.shared = backend.shared
+        self.revalidate_after = revalidate_after
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[str, Tuple[int, Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"local_hits": 0, "revalidated": 0, "fetched": 0, "conflicts": 0}
+
+    def _remember(self, key: str, version: int, value: Any) -> None:
+        with self._lock:
+            self._cache[key] = (version, value, time.monotonic())
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def _forget(self, key: str) -> None:
+        with self._lock:
+            self._cache.pop(key, None)
+
+    def get(self, key: str) -> Optional[Tuple[int, Any]]:
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached and time.monotonic() - cached[2] < self.revalidate_after:
+                self._stats["local_hits"] += 1
+                return cached[0], cached[1]
+        if cached and self.backend.version(key) == cached[0]:
+            self._remember(key, cached[0], cached[1])
+            with self._lock:
+                self._stats["revalidated"] += 1
+            return cached[0], cached[1]
+        record = self.backend.get(key)
+        with self._lock:
+            self._stats["fetched"] += 1
+        if record is None:
+            self._forget(key)
+            return None
+        self._remember(key, record[0], record[1])
+        return record
+
+    def put(self, key: str, value: Any, expected_version: Optional[int] = None,
+            ttl: Optional[float] = None) -> Optional[int]:
+        version = self.backend.put(key, value, expected_version, ttl)
+        if version is None:
+            self._forget(key)
+            with self._lock:
+                self._stats["conflicts"] += 1
+        else:
+            self._remember(key, version, value)
+        return version
+
+    def delete(self, key: str) -> None:
+        self.backend.delete(key)
+        self._forget(key)
+
+    def update(self, key: str, func: Callable[[Optional[Any]], Any],
+               ttl: Optional[float] = None, retries: int = 8) -> Optional[Any]:
+        """
+        Read-modify-write: func(current value or None) returns the new value.
+        Retried on version conflicts; returns the written value, or None if
+        every attempt conflicted.
+        """
+        for attempt in range(retries):
+            record = self.get(key)
+            version, current = record if record else (0, None)
+            value = func(current)
+            if self.put(key, value, expected_version=version, ttl=ttl) is not None:
+                return value
+            # Back off briefly so competing writers interleave
+            time.sleep(random.uniform(0, 0.002 * (attempt + 1)))
+        logger.warning(f"State update for {key} gave up after {retries} conflicting attempts")
+        return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._cache)
+        return stats
+
+
+def create_state_backend() -> StateBackend:
+    """
+    Backend selected by STATE_BACKEND: memory (default), sqlite (STATE_DB_PATH)
+    or redis (STATE_REDIS_URL). Falls back to memory if the shared backend
+    cannot be created.
+    """
+    kind = os.getenv("STATE_BACKEND", "memory").lower()
+    try:
+        if kind == "sqlite":
+            return SQLiteStateBackend(os.getenv("STATE_DB_PATH", "instance/state.db"))
+        if kind == "redis":
+            return RedisStateBackend(os.getenv("STATE_REDIS_URL", "redis://localhost:6379/0"))
+    except Exception as e:
+        logger.error(f"Failed to create {kind} state backend, using in-process state: {e}")
+    return InMemoryStateBackend()
+
+
+_state_backend: Optional[CachedStateBackend] = None
+_state_lock = threading.Lock()
+
+
+def get_state_backend() -> CachedStateBackend:
+    """Process-wide state backend, wrapped in the read-through cache"""
+    global _state_backend
+    with _state_lock:
+        if _state_backend is None:
+            _state_backend = CachedStateBackend(
+                create_state_backend(),
+                revalidate_after=float(os.getenv("STATE_CACHE_REVALIDATE_SECONDS", "0"))
+            )
+        return _state_backend
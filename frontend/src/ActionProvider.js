@@ -93,8 +93,9 @@ class ActionProvider {
       console.log("Sending request to:", uri);
       console.log("Request data:", choice_info);
       
+      // UltraThink is a per-session setting carried with every message
       const response = await axios.post(uri, {
-        choice_info
+        choice_info: { ...choice_info, ultra_think: Boolean(this.state.ultraThinkMode) }
       });
 
       console.log("Received response:", response.data);
@@ -122,6 +123,47 @@ class ActionProvider {
     }
   };
 
+  // Fetch the follow-up to a crisis reply and show it once ready
+  fetchCrisisFollowup = async (followupToken) => {
+    try {
+      const { apiBaseUrl } = getEnvironment();
+      const response = await axios.get(`${apiBaseUrl}/api/crisis_followup/${followupToken}`, {
+        params: { wait: 10 }
+      });
+      if (response.data && response.data.success && response.data.response) {
+        const message = this.createChatBotMessage(response.data.response, { withAvatar: true });
+        this.addMessageToBotState(message);
+      }
+    } catch (error) {
+      console.error("Crisis follow-up request failed:", error);
+    }
+  };
+
+  // Replace the fallback quick replies with the LLM options once they are ready
+  fetchDeferredOptions = async (optionsToken) => {
+    this.latestOptionsToken = optionsToken;
+    try {
+      const { apiBaseUrl } = getEnvironment();
+      const response = await axios.get(`${apiBaseUrl}/api/options/${optionsToken}`, {
+        params: { wait: 5 }
+      });
+      const data = response.data;
+      // Skip options that arrive after the next turn's reply
+      if (!data || !data.success || !data.ready || this.latestOptionsToken !== optionsToken) {
+        return;
+      }
+      if (Array.isArray(data.options) && data.options.length > 0) {
+        this.setState((state) => (
+          state.currentOptionToShow === "InitialOptions"
+            ? { ...state, initialChoices: data.options, inputType: data.options }
+            : state
+        ));
+      }
+    } catch (error) {
+      console.error("Options request failed:", error);
+    }
+  };
+
   handleReceivedData = (dataReceived) => {
     try {
       // Validate data received
@@ -142,6 +184,11 @@ class ActionProvider {
       
       console.log("Processing response:", { chatbotResponse, userOptions, emotion });
 
+      // Crisis replies: the personalized follow-up arrives separately
+      if (dataReceived.followup_token) {
+        this.fetchCrisisFollowup(dataReceived.followup_token);
+      }
+
       // Check if UltraThink mode is enabled
       const isUltraThinkMode = this.state.ultraThinkMode;
       
@@ -188,6 +235,12 @@ class ActionProvider {
         currentOptionToShow: optionsToShow,
       }));
 
+      // Options sent with the reply are a fallback; the LLM ones follow
+      this.latestOptionsToken = null;
+      if (dataReceived.options_token && optionsToShow === "InitialOptions") {
+        this.fetchDeferredOptions(dataReceived.options_token);
+      }
+
       // Add emotion indicator if in UltraThink mode
       let responseWithEmotion = chatbotResponse;
       if (isUltraThinkMode && emotion !== "neutral") {